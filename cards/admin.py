@@ -1,6 +1,6 @@
 from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin # 追加
-from .models import PokemonCard, CardCategory, Type, EvolutionStage, SpecialFeature, MoveType, TrainerType, SpecialTrainer, GeminiApiKeyUsage
+from .models import PokemonCard, CardCategory, Type, EvolutionStage, SpecialFeature, MoveType, TrainerType, SpecialTrainer, GeminiApiKeyUsage, AnalysisJob, GeminiExtractionCache, BulkRegisterBatch, BulkRegisterItem, CsvImportJob, Deck, DeckEntry
 
 # PokemonCardAdminを定義し、ImportExportModelAdminを継承させる
 class PokemonCardAdmin(ImportExportModelAdmin):
@@ -52,8 +52,59 @@ class SpecialTrainerAdmin(admin.ModelAdmin):
 @admin.register(GeminiApiKeyUsage)
 class GeminiApiKeyUsageAdmin(admin.ModelAdmin):
     """GeminiApiKeyUsageモデルの管理画面設定"""
-    list_display = ['key_index', 'usage_count', 'last_reset_date', 'updated_at']
+    list_display = ['key_index', 'usage_count', 'daily_limit', 'last_reset_date', 'cooldown_until', 'updated_at']
     readonly_fields = ['key_index', 'updated_at']
     ordering = ['key_index']
 
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    """AnalysisJobモデルの管理画面設定"""
+    list_display = ['id', 'status', 'stage', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['id', 'created_at', 'started_at', 'finished_at', 'updated_at']
+    ordering = ['-created_at']
+
+@admin.register(GeminiExtractionCache)
+class GeminiExtractionCacheAdmin(admin.ModelAdmin):
+    """GeminiExtractionCacheモデルの管理画面設定"""
+    list_display = ['cache_key', 'kind', 'hit_count', 'created_at', 'last_used_at']
+    list_filter = ['kind']
+    readonly_fields = ['cache_key', 'kind', 'hit_count', 'created_at', 'last_used_at']
+    ordering = ['-last_used_at']
+
+class BulkRegisterItemInline(admin.TabularInline):
+    model = BulkRegisterItem
+    fields = ['position', 'item_id', 'is_excluded', 'data']
+    readonly_fields = ['position', 'item_id']
+    extra = 0
+
+@admin.register(BulkRegisterBatch)
+class BulkRegisterBatchAdmin(admin.ModelAdmin):
+    """BulkRegisterBatchモデルの管理画面設定"""
+    list_display = ['id', 'created_at']
+    readonly_fields = ['id', 'created_at']
+    ordering = ['-created_at']
+    inlines = [BulkRegisterItemInline]
+
+@admin.register(CsvImportJob)
+class CsvImportJobAdmin(admin.ModelAdmin):
+    """CsvImportJobモデルの管理画面設定"""
+    list_display = ['id', 'original_name', 'status', 'mode', 'stage', 'processed_rows', 'total_rows', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'mode']
+    readonly_fields = ['id', 'created_at', 'started_at', 'finished_at', 'updated_at']
+    ordering = ['-created_at']
+
+class DeckEntryInline(admin.TabularInline):
+    model = DeckEntry
+    fields = ['position', 'name', 'quantity']
+    extra = 0
+
+@admin.register(Deck)
+class DeckAdmin(admin.ModelAdmin):
+    """Deckモデルの管理画面設定"""
+    list_display = ['name', 'is_allocated', 'updated_at']
+    list_filter = ['is_allocated']
+    ordering = ['-updated_at']
+    inlines = [DeckEntryInline]
+
 admin.site.register(PokemonCard, PokemonCardAdmin)
\ No newline at end of file
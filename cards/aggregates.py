@@ -0,0 +1,300 @@
+"""
+コレクションの集計 (CollectionAggregate) の管理
+
+タイプ・進化段階・トレーナーズ種別・特別な分類 (ACE SPEC など)・HPの区間などの集計の項目と値ごとに、
+カードの種類数と所持枚数を集計テーブルに保持します。統計の表示 (collection_stats_modal) はこのテーブルを読むだけで、
+カード全体を集計し直すことはありません。
+
+カードが変更されると refresh_aggregates() で、変更されたカードの現在の内容と集計済みの内容
+(CollectionAggregateState) の差分だけを集計テーブルに加減算します。
+
+- カードの保存・削除・ManyToManyの変更: シグナル (cards.signals) から schedule_refresh() で予約し、
+  トランザクションの確定後にまとめて反映 (フォームの保存で発生する post_save と項目ごとの m2m_changed を1回にまとめる)
+- 枚数の増減: cards.quantities
+- CSVインポート・一括登録: 取り込み後に直接呼び出し
+
+シグナルが発生しない方法でカードを変更した場合は refresh_aggregates() を呼び出してください。
+ずれが生じた場合は rebuild_collection_aggregates コマンドで作り直せます。
+"""
+
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .master_data import get_master_data
+from .models import (
+    CardCategory, CollectionAggregate, CollectionAggregateState, EvolutionStage, PokemonCard, SpecialFeature,
+    SpecialTrainer, TrainerType, Type,
+)
+
+# 集計の項目 → (表示名, 値のマスタ)。HPは区間の下限を値とする
+DIMENSIONS = {
+    'category': ('カテゴリ', CardCategory),
+    'type': ('タイプ', Type),
+    'evolution_stage': ('進化段階', EvolutionStage),
+    'special_feature': ('特別', SpecialFeature),
+    'trainer_type': ('トレーナーズ種別', TrainerType),
+    'special_trainer': ('特別な分類', SpecialTrainer),
+    'hp': ('HP', None),
+}
+
+# カードの外部キー → 集計の項目
+FOREIGN_KEY_DIMENSIONS = {
+    'category': 'category',
+    'evolution_stage': 'evolution_stage',
+    'trainer_type': 'trainer_type',
+}
+
+# ManyToManyの項目 → 集計の項目
+RELATION_DIMENSIONS = {
+    'types': 'type',
+    'special_features': 'special_feature',
+    'special_trainers': 'special_trainer',
+}
+
+# HPの区間の幅
+HP_BUCKET_SIZE = 50
+
+# まとめて集計するカードの件数
+BATCH_SIZE = 1000
+
+
+def hp_bucket(hp):
+    """HPの区間の下限 (未設定の場合は None)"""
+    if hp is None or hp < 0:
+        return None
+    return hp // HP_BUCKET_SIZE * HP_BUCKET_SIZE
+
+
+_pending = threading.local()
+
+
+def schedule_refresh(card_ids, relations: bool = True):
+    """
+    カードの集計への反映を、トランザクションの確定後にまとめて行うよう予約する
+
+    同じトランザクション内で予約したカードは、確定後に1回の refresh_aggregates() で反映します。
+    トランザクション外で呼び出した場合は、すぐに反映します。
+    取り消されたトランザクションで予約したカードは、次に確定したときに反映します (反映は差分のため、何度行っても同じ結果)。
+    """
+    pending = getattr(_pending, 'cards', None)
+    if pending is None:
+        pending = _pending.cards = {}
+    for card_id in card_ids:
+        pending[card_id] = pending.get(card_id, False) or relations
+    # 同じトランザクションで複数回登録しても、最初に実行されたときにすべて反映し、以降は何もしない
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    pending = getattr(_pending, 'cards', None)
+    if not pending:
+        return
+    _pending.cards = {}
+    with_relations = [card_id for card_id, relations in pending.items() if relations]
+    without_relations = [card_id for card_id, relations in pending.items() if not relations]
+    if with_relations:
+        refresh_aggregates(with_relations)
+    if without_relations:
+        refresh_aggregates(without_relations, relations=False)
+
+
+def refresh_aggregates(card_ids, relations: bool = True):
+    """
+    カードの現在の内容を集計に反映する (集計済みの内容との差分を加減算する)
+
+    削除されたカードは集計から差し引きます。
+
+    Args:
+        card_ids: 変更されたカードのID
+        relations (bool): ManyToManyを読み直すか (枚数のみの変更の場合は False で、集計済みの項目を使う)
+    """
+    card_ids = sorted(set(card_ids))
+    for start in range(0, len(card_ids), BATCH_SIZE):
+        _refresh_chunk(card_ids[start:start + BATCH_SIZE], relations)
+
+
+def _refresh_chunk(card_ids: list, relations: bool):
+    with transaction.atomic():
+        # 初めて集計するカードも行をロックできるよう、集計済みの内容の行を空の内容で作成しておく
+        # (同時に作成された場合は一方のみ作成され、もう一方はロックの解除を待って作成済みの内容で差分を求める)
+        existing = set(CollectionAggregateState.objects.filter(card_id__in=card_ids).values_list('card_id', flat=True))
+        missing = [card_id for card_id in card_ids if card_id not in existing]
+        if missing:
+            CollectionAggregateState.objects.bulk_create(
+                [CollectionAggregateState(card_id=card_id, quantity=0, keys=[]) for card_id in missing],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+        # 同じカードの集計が同時に反映されないよう、集計済みの内容の行をロックする
+        # 集計の項目がない行は、まだ集計していないカード (カテゴリは必須のため、集計済みのカードには必ず項目がある)
+        states = {
+            state.card_id: state if state.keys else None
+            for state in CollectionAggregateState.objects.select_for_update().filter(card_id__in=card_ids)
+        }
+        rows = PokemonCard.objects.filter(pk__in=card_ids).values_list(
+            'pk', 'quantity', *[f'{name}_id' for name in FOREIGN_KEY_DIMENSIONS], 'hp',
+        )
+        current = {}
+        for card_id, quantity, *foreign_keys, hp in rows:
+            state = states.get(card_id)
+            if relations or state is None:
+                keys = _card_keys(foreign_keys, hp)
+            else:
+                keys = {tuple(key) for key in state.keys}
+            current[card_id] = (quantity, keys)
+        _add_relation_keys(current, [card_id for card_id in current if relations or states.get(card_id) is None])
+
+        deltas = defaultdict(lambda: [0, 0])
+        changed_states = []
+        for card_id in card_ids:
+            state = states.get(card_id)
+            old_quantity, old_keys = (state.quantity, {tuple(key) for key in state.keys}) if state else (0, set())
+            new_quantity, new_keys = current.get(card_id, (0, set()))
+            if state and old_quantity == new_quantity and old_keys == new_keys and card_id in current:
+                continue
+            for key in old_keys:
+                deltas[key][0] -= 1
+                deltas[key][1] -= old_quantity
+            for key in new_keys:
+                deltas[key][0] += 1
+                deltas[key][1] += new_quantity
+            if card_id in current:
+                changed_states.append(
+                    CollectionAggregateState(card_id=card_id, quantity=new_quantity, keys=sorted(map(list, new_keys)))
+                )
+
+        _apply_deltas({key: delta for key, delta in deltas.items() if delta != [0, 0]})
+        # 削除されたカードと、作成しておいた空の行のうち存在しないカードの行を削除する
+        removed = [card_id for card_id in states if card_id not in current]
+        if removed:
+            CollectionAggregateState.objects.filter(card_id__in=removed).delete()
+        if changed_states:
+            CollectionAggregateState.objects.bulk_create(
+                changed_states,
+                batch_size=BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['card_id'],
+                update_fields=['quantity', 'keys'],
+            )
+
+
+def _card_keys(foreign_keys: list, hp) -> set:
+    """カードの外部キー・HPから、集計の項目と値を求める"""
+    keys = {
+        (dimension, target_id)
+        for dimension, target_id in zip(FOREIGN_KEY_DIMENSIONS.values(), foreign_keys)
+        if target_id is not None
+    }
+    bucket = hp_bucket(hp)
+    if bucket is not None:
+        keys.add(('hp', bucket))
+    return keys
+
+
+def _add_relation_keys(current: dict, card_ids: list):
+    """ManyToManyの項目ごとに中間テーブルを1回ずつ読み込み、集計の項目と値を加える"""
+    if not card_ids:
+        return
+    for attribute, dimension in RELATION_DIMENSIONS.items():
+        m2m_field = PokemonCard._meta.get_field(attribute)
+        through = m2m_field.remote_field.through
+        source_column = f'{m2m_field.m2m_field_name()}_id'
+        target_column = f'{m2m_field.m2m_reverse_field_name()}_id'
+        rows = through.objects.filter(**{f'{source_column}__in': card_ids}).values_list(source_column, target_column)
+        for card_id, target_id in rows:
+            current[card_id][1].add((dimension, target_id))
+
+
+def _apply_deltas(deltas: dict):
+    """集計テーブルに、項目と値ごとの (種類数, 所持枚数) の増減を1回の UPDATE 文で反映する"""
+    if not deltas:
+        return
+    # 初めて集計される値の行を作成する (枚数のみの変更では既に行があるため作成しない)
+    new_keys = [key for key, (cards, _) in deltas.items() if cards > 0]
+    if new_keys:
+        CollectionAggregate.objects.bulk_create(
+            [CollectionAggregate(dimension=dimension, key=key) for dimension, key in new_keys],
+            ignore_conflicts=True,
+        )
+
+    def delta_expression(index: int):
+        return Case(
+            *[
+                When(dimension=dimension, key=key, then=Value(delta[index]))
+                for (dimension, key), delta in deltas.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+    condition = Q()
+    for dimension, key in deltas:
+        condition |= Q(dimension=dimension, key=key)
+    CollectionAggregate.objects.filter(condition).update(
+        cards=F('cards') + delta_expression(0),
+        copies=F('copies') + delta_expression(1),
+    )
+
+
+def rebuild_aggregates() -> int:
+    """
+    全カードから集計を作り直す
+
+    Returns:
+        int: 作り直す前と値が異なっていた集計の行数 (ずれの件数)
+    """
+    with transaction.atomic():
+        before = _snapshot()
+        CollectionAggregateState.objects.all().delete()
+        CollectionAggregate.objects.all().delete()
+        refresh_aggregates(PokemonCard.objects.values_list('pk', flat=True))
+        after = _snapshot()
+    return sum(1 for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+
+
+def _snapshot() -> dict:
+    """集計テーブルの内容 (種類数・所持枚数がともに0の行は除く)"""
+    return {
+        (dimension, key): (cards, copies)
+        for dimension, key, cards, copies in CollectionAggregate.objects.values_list('dimension', 'key', 'cards', 'copies')
+        if cards or copies
+    }
+
+
+def collection_stats() -> dict:
+    """
+    統計の表示用に、集計テーブルの内容を項目ごとにまとめる
+
+    Returns:
+        dict: {集計の項目: {'label': 表示名, 'rows': [{'object': マスタ (HPは None), 'label': 表示名,
+            'cards': 種類数, 'copies': 所持枚数}], 'max_copies': 所持枚数の最大値}}
+    """
+    values = defaultdict(dict)
+    for dimension, key, cards, copies in CollectionAggregate.objects.values_list('dimension', 'key', 'cards', 'copies'):
+        values[dimension][key] = (cards, copies)
+
+    master = get_master_data()
+    stats = {}
+    for dimension, (label, model) in DIMENSIONS.items():
+        if model is None:
+            rows = [
+                {'object': None, 'label': f'{key}〜{key + HP_BUCKET_SIZE - 1}', 'cards': cards, 'copies': copies}
+                for key, (cards, copies) in sorted(values[dimension].items())
+                if cards
+            ]
+        else:
+            # マスタの表示順で、削除されたマスタの値は表示しない
+            rows = [
+                {'object': obj, 'label': obj.name, 'cards': values[dimension].get(obj.pk, (0, 0))[0],
+                 'copies': values[dimension].get(obj.pk, (0, 0))[1]}
+                for obj in master.all(model)
+            ]
+        stats[dimension] = {
+            'label': label,
+            'rows': rows,
+            'max_copies': max((row['copies'] for row in rows), default=0),
+        }
+    return stats
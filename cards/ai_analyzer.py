@@ -7,20 +7,125 @@ Gemini APIを使用した詳細なカード情報の抽出機能を提供しま
 
 import os
 import cv2
-import numpy as np
 from PIL import Image
 import google.generativeai as genai
+from google.api_core.exceptions import ResourceExhausted
 from ultralytics import YOLO
 from django.conf import settings
 from datetime import datetime
 import json
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from django.db import transaction
-from django.utils import timezone
+import hashlib
+from django.db import connection
+
+from .gemini_cache import GeminiResultCache, crop_hash, file_hash
+from .grid_packing import DenseGridPacker, build_grid_packer
+from .key_scheduler import GeminiKeyScheduler
 
 logger = logging.getLogger(__name__)
 
+
+class YoloModelPool:
+    """
+    YOLOモデルインスタンスのプール
+
+    ワーカープロセス内でモデルを一度だけロードし、以降の解析ではロード済みの
+    インスタンスを貸し出します。同時に解析できる数はプールサイズまでで、
+    空きがない場合は他のリクエストが返却するまで待機します。
+    """
+
+    def __init__(self, loader, size: int = 1):
+        self._loader = loader
+        self._size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._metrics = {
+            'cold_loads': 0,
+            'cold_load_seconds_total': 0.0,
+            'last_cold_load_seconds': None,
+            'warm_acquires': 0,
+            'wait_seconds_total': 0.0,
+        }
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        """モデルを1つ借りる (withブロックを抜けると自動で返却される)"""
+        model = self._checkout(timeout)
+        try:
+            yield model
+        finally:
+            self._idle.put(model)
+
+    def preload(self):
+        """プールが空の場合、1インスタンスを事前にロードしておく"""
+        with self.acquire():
+            pass
+
+    def metrics(self) -> dict:
+        """コールド/ウォームのロード時間などの計測値を返す"""
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot['loaded_instances'] = self._created
+            snapshot['pool_size'] = self._size
+        return snapshot
+
+    def _checkout(self, timeout):
+        start = time.perf_counter()
+        try:
+            model = self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            self._record_warm(time.perf_counter() - start)
+            return model
+
+        # 空きがなく、まだ上限まで生成していなければ新規ロード (コールドスタート)
+        with self._lock:
+            can_create = self._created < self._size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                model = self._loader()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._metrics['cold_loads'] += 1
+                self._metrics['cold_load_seconds_total'] += elapsed
+                self._metrics['last_cold_load_seconds'] = elapsed
+            logger.info(f"YOLO model cold load: {elapsed:.2f}s ({self._created}/{self._size} instances)")
+            return model
+
+        # 上限まで生成済みの場合は返却待ち
+        try:
+            model = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError("YOLOモデルの空きがありません。しばらく時間を置いてから再試行してください。")
+        self._record_warm(time.perf_counter() - start)
+        return model
+
+    def _record_warm(self, waited: float):
+        with self._lock:
+            self._metrics['warm_acquires'] += 1
+            self._metrics['wait_seconds_total'] += waited
+        logger.info(f"YOLO model warm acquire: waited {waited:.3f}s")
+
+
 class CardAnalyzer:
     """カード画像解析クラス"""
     
@@ -153,12 +258,30 @@ class CardAnalyzer:
 
     def __init__(self):
         """CardAnalyzerクラスの初期化処理"""
-        self._setup_yolo()
+        # YOLOモデルはプロセス内で共有するプールから借りる (ロードは初回のみ)
+        self.model_pool = get_yolo_model_pool()
         self.api_keys = self._load_api_keys()
+        # API KEYの選択と使用回数の管理 (複数プロセスから同時に使用しても安全)
+        self.key_scheduler = GeminiKeyScheduler(self.api_keys, settings.GEMINI_API_KEY_DAILY_LIMITS)
         # Geminiの初期化はanalyze_image内で動的に行う
 
-    def _setup_yolo(self):
-        """YOLOモデルのセットアップ"""
+        # 解析済みカードの抽出結果キャッシュ (プロンプトを変更すると以前の結果は使われない)
+        self.result_cache = None
+        if settings.GEMINI_CACHE_ENABLED:
+            self.result_cache = GeminiResultCache(self.prompt_version())
+
+        # グリッド画像の作成方法 (GEMINI_GRID_STRATEGY)
+        if settings.GEMINI_GRID_STRATEGY == DenseGridPacker.name:
+            self.grid_packer = DenseGridPacker(
+                cell_width=settings.GEMINI_GRID_CELL_WIDTH,
+                max_cards=settings.GEMINI_GRID_MAX_CARDS,
+            )
+        else:
+            self.grid_packer = build_grid_packer(settings.GEMINI_GRID_STRATEGY)
+
+    @classmethod
+    def load_yolo_model(cls):
+        """YOLOモデルをロードする (プールから初回のみ呼ばれる)"""
         cache_dir =  os.path.expanduser("~/.cache/ultralytics") 
         custom_model_name = "custom_yolov8s_one_card.pt"
         custom_model_path = os.path.join(cache_dir, custom_model_name)
@@ -166,18 +289,48 @@ class CardAnalyzer:
         try:
             if os.path.exists(custom_model_path):
                 logger.info(f"Loading cached custom model: {custom_model_path}")
-                self.model = YOLO(custom_model_path)
+                model = YOLO(custom_model_path)
             else:
-                logger.info(f"Creating custom model from {self.YOLO_MODEL_NAME}")
-                self.model = YOLO(self.YOLO_MODEL_NAME)
-                self.model.set_classes(self.DETECT_CLASSES)
-                self.model.save(custom_model_path)
+                logger.info(f"Creating custom model from {cls.YOLO_MODEL_NAME}")
+                model = YOLO(cls.YOLO_MODEL_NAME)
+                model.set_classes(cls.DETECT_CLASSES)
+                model.save(custom_model_path)
                 logger.info(f"Saved custom model to {custom_model_path}")
                 
         except Exception as e:
             logger.error(f"Failed to load YOLO model: {e}")
-            self.model = YOLO(self.YOLO_MODEL_NAME)
-            self.model.set_classes(self.DETECT_CLASSES)
+            model = YOLO(cls.YOLO_MODEL_NAME)
+            model.set_classes(cls.DETECT_CLASSES)
+        return model
+
+    @classmethod
+    def prompt_version(cls) -> str:
+        """プロンプトとモデル名から求めた版数 (抽出結果キャッシュのキーに使用)"""
+        source = f"{cls.GEMINI_MODEL_NAME}\n{cls.GEMINI_PROMPT}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]
+
+    @staticmethod
+    def parse_response(raw_response: str) -> list:
+        """
+        Geminiのレスポンス(JSON文字列)をパースする
+
+        Raises:
+            json.JSONDecodeError: JSONとして読み取れない場合
+        """
+        # Markdownコードブロックが含まれている場合のクリーニング
+        raw_json = raw_response
+        if "```json" in raw_json:
+            raw_json = raw_json.split("```json")[1].split("```")[0]
+        elif "```" in raw_json:
+            raw_json = raw_json.split("```")[1].split("```")[0]
+
+        parsed = json.loads(raw_json)
+        return parsed if isinstance(parsed, list) else [parsed]
+
+    def preload(self):
+        """YOLOモデルを事前にロードしておく (gunicorn --preload / AppConfig.ready 用)"""
+        self.model_pool.preload()
+        logger.info(f"YOLO model preloaded: {self.model_pool.metrics()}")
 
     def _load_api_keys(self) -> list:
         """設定から複数のAPI KEYを読み込む"""
@@ -187,104 +340,189 @@ class CardAnalyzer:
         logger.info(f"Loaded {len(api_keys)} Gemini API keys")
         return api_keys
 
-    @transaction.atomic
-    def _get_current_api_key(self) -> tuple[str, int]:
-        """
-        現在使用すべきAPI KEYを取得し、使用回数を管理
-
-        Returns:
-            tuple[str, int]: (API KEY文字列, キーインデックス)
-        """
-        from .models import GeminiApiKeyUsage
-
-        today = timezone.now().date()
-        num_keys = len(self.api_keys)
-
-        # 全キーの状態を確認・初期化
-        for i in range(num_keys):
-            usage, created = GeminiApiKeyUsage.objects.select_for_update().get_or_create(
-                key_index=i,
-                defaults={'usage_count': 0, 'last_reset_date': today}
-            )
-
-            # 日付が変わっていたらリセット
-            if usage.last_reset_date < today:
-                usage.usage_count = 0
-                usage.last_reset_date = today
-                usage.save()
-
-        # 使用可能なキーを検索（使用回数が20未満）
-        for i in range(num_keys):
-            usage = GeminiApiKeyUsage.objects.select_for_update().get(key_index=i)
-            if usage.usage_count < 20:
-                logger.info(f"Using API key {i + 1}: {usage.usage_count}/20 used today")
-                return self.api_keys[i], i
-
-        # 全キーが上限に達している場合
-        logger.error("All Gemini API keys have reached daily limit (20 requests each)")
-        raise Exception("RESOURCE_EXHAUSTED: All API keys reached daily quota")
-
-    @transaction.atomic
-    def _increment_usage(self, key_index: int):
-        """使用回数をインクリメント"""
-        from .models import GeminiApiKeyUsage
-
-        usage = GeminiApiKeyUsage.objects.select_for_update().get(key_index=key_index)
-        usage.usage_count += 1
-        usage.save()
-        logger.info(f"Incremented API key {key_index + 1} usage: {usage.usage_count}/20")
-
     def _setup_gemini(self, api_key: str):
         """指定されたAPI KEYでGemini APIクライアントをセットアップ"""
         if not api_key:
             raise ValueError("API key is required for Gemini setup")
 
         genai.configure(api_key=api_key)
-        self.gemini_model = genai.GenerativeModel(self.GEMINI_MODEL_NAME)
+        # インスタンスはプロセス内で共有されるため、モデルは属性に保持せず呼び出し元に返す
+        return genai.GenerativeModel(self.GEMINI_MODEL_NAME)
 
-    def analyze_image(self, image_path: str) -> dict:
+    def analyze_image(self, image_path: str, progress_callback=None) -> dict:
         """
         画像解析のメインプロセスを実行します。
         成果物は入力画像と同じディレクトリに保存されます。
+
+        Args:
+            image_path: 解析する画像の絶対パス
+            progress_callback: 各段階の完了時に (段階名, 画像インデックス) を受け取る関数
+
+        Raises:
+            ResourceExhausted など、Gemini API呼び出し時の例外
+        """
+        result = self.analyze_images([image_path], progress_callback=progress_callback)['images'][0]
+        if result.get('exception'):
+            raise result['exception']
+        return result
+
+    def analyze_images(self, image_paths: list, progress_callback=None) -> dict:
         """
-        # 入力画像のディレクトリを基準とする
-        img_path_obj = Path(image_path)
-        base_dir = img_path_obj.parent
+        複数画像をまとめて解析します。
+
+        YOLOはまとめて推論 (バッチ推論) し、1枚ごとの切り抜き (CPU処理) と
+        Geminiへの問い合わせ (ネットワーク待ち) を並行して実行します。
+        未解析のカードは GeminiGridQueue がグリッドの作成方法 (grid_packer) に従ってまとめて送信します。
+        成果物は各入力画像と同じディレクトリに保存されます。
+
+        Args:
+            image_paths: 解析する画像の絶対パスのリスト
+            progress_callback: 各段階の完了時に (段階名, 画像インデックス) を受け取る関数
+
+        Returns:
+            dict: 'images' (入力順の画像ごとの解析結果) と 'stats' (処理枚数・所要時間・毎分カード数)。
+                  画像ごとの結果で失敗したものは 'error' (メッセージ) と 'exception' を持つ。
+        """
+        def report(stage, index):
+            if progress_callback:
+                progress_callback(stage, index)
+
+        batch_start = time.perf_counter()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # 1. 画像読み込み
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Failed to load image: {image_path}")
-            
-        # 2. YOLOによるカード検出
-        logger.info(f"Running YOLO inference on {image_path}")
-        results = self.model.predict(
-            image_path,
-            conf=self.CONF_THRESHOLD,
-            iou=self.IOU_THRESHOLD,
-            imgsz=self.IMG_SIZE,
-            max_det=self.MAX_DET,
-            save=False, # 自動保存無効
+        results = [None] * len(image_paths)
+
+        # 読み込めない画像はバッチ推論全体を失敗させるため、事前に除外する
+        readable_indexes = []
+        for index, image_path in enumerate(image_paths):
+            if self._is_readable_image(image_path):
+                readable_indexes.append(index)
+            else:
+                results[index] = {'error': f"Failed to load image: {image_path}", 'card_count': 0,
+                                  'exception': ValueError(f"Failed to load image: {image_path}")}
+
+        # Gemini問い合わせは1スレッドで順番に実行し、その間にメインスレッドで次の画像を処理する
+        with ThreadPoolExecutor(max_workers=1) as gemini_executor:
+            grid_queue = GeminiGridQueue(self, image_paths, gemini_executor, report)
+            acquire_start = inference_start = time.perf_counter()
+            if readable_indexes:
+                with self.model_pool.acquire(timeout=settings.YOLO_MODEL_POOL_TIMEOUT) as model:
+                    inference_start = time.perf_counter()
+                    logger.info(f"Running YOLO inference on {len(readable_indexes)} images")
+                    # 1. YOLOによるカード検出 (バッチ推論。stream=Trueで1枚ずつ結果を受け取りメモリを抑える)
+                    predictions = model.predict(
+                        [image_paths[i] for i in readable_indexes],
+                        conf=self.CONF_THRESHOLD,
+                        iou=self.IOU_THRESHOLD,
+                        imgsz=self.IMG_SIZE,
+                        max_det=self.MAX_DET,
+                        batch=settings.YOLO_PREDICT_BATCH,
+                        stream=True,
+                        save=False, # 自動保存無効
+                    )
+                    for index, prediction in zip(readable_indexes, predictions):
+                        report('detected', index)
+                        # 2. カードの切り抜き
+                        results[index] = self._prepare_crops(image_paths[index], prediction, timestamp)
+                        if results[index].get('error'):
+                            continue
+                        report('cropped', index)
+
+                        # 3. 未解析のカードをグリッドにまとめてGeminiへ送信 (バックグラウンドで実行)
+                        results[index]['cache_hits'] = grid_queue.add_image(index, results[index]['cropped_images'])
+            grid_queue.flush()
+            inference_end = time.perf_counter()
+
+            # 4. Geminiの結果を回収
+            failures = grid_queue.collect()
+
+        # 5. 画像ごとに抽出結果を切り抜き画像の順に並べる
+        for result in results:
+            if result.get('error'):
+                continue
+            cropped_images = result['cropped_images']
+            failed = next((failures[c['hash']] for c in cropped_images if c['hash'] in failures), None)
+            if failed is not None:
+                result['error'] = str(failed)
+                result['exception'] = failed
+                continue
+            result['items'] = [
+                dict(grid_queue.known[crop['hash']], id=crop['id'])
+                for crop in cropped_images if crop['hash'] in grid_queue.known
+            ]
+
+        elapsed = time.perf_counter() - batch_start
+        card_count = sum(r.get('card_count', 0) for r in results if not r.get('error'))
+        gemini_requests = grid_queue.request_count()
+        stats = {
+            'image_count': len(image_paths),
+            'card_count': card_count,
+            'elapsed_seconds': round(elapsed, 2),
+            'cards_per_minute': round(card_count / elapsed * 60, 1) if elapsed > 0 else 0.0,
+            'model_acquire_seconds': round(inference_start - acquire_start, 3),
+            'local_processing_seconds': round(inference_end - inference_start, 3),
+            'model_pool': self.model_pool.metrics(),
+            'cache_hits': sum(r.get('cache_hits', 0) for r in results),
+            'grid_strategy': self.grid_packer.name,
+            'grid_count': len(grid_queue.grids),
+            'grid_bytes': sum(grid['bytes'] for grid in grid_queue.grids),
+            'gemini_requests': gemini_requests,
+            'cards_per_request': round(grid_queue.sent_count() / gemini_requests, 1) if gemini_requests else None,
+            'gemini_cache': self.result_cache.metrics() if self.result_cache else None,
+        }
+        logger.info(
+            f"Analyzed {stats['image_count']} images / {card_count} cards in {elapsed:.1f}s "
+            f"({stats['cards_per_minute']} cards/min, {gemini_requests} Gemini requests)"
         )
-        
+        return {'images': results, 'stats': stats}
+
+    def _prepare_crops(self, image_path: str, prediction, timestamp: str) -> dict:
+        """1枚分の検出結果からカードを切り出す"""
+        try:
+            cropped_images = self._crop_detections(image_path, prediction)
+        except Exception as e:
+            logger.error(f"Failed to crop image {image_path}: {e}", exc_info=True)
+            return {'error': f"画像の切り抜きに失敗しました: {e}", 'exception': e, 'card_count': 0}
+
+        if not cropped_images:
+            logger.warning(f"No cards detected by YOLO: {image_path}")
+            return {'error': 'No cards detected', 'count': 0, 'card_count': 0}
+
+        return {
+            'timestamp': timestamp,
+            'card_count': len(cropped_images),
+            'cropped_images': cropped_images,
+        }
+
+    def _is_readable_image(self, image_path: str) -> bool:
+        """画像ファイルとして読み込めるかを確認する (デコードはせずヘッダのみ検証)"""
+        try:
+            with Image.open(image_path) as img:
+                img.verify()
+            return True
+        except Exception:
+            return False
+
+    def _crop_detections(self, image_path: str, prediction) -> list:
+        """YOLOの検出結果からカード画像を切り出して保存する"""
+        base_dir = Path(image_path).parent
+        img = prediction.orig_img
+
         # 検出結果の保存 (detection.jpg)
-        plot_img = results[0].plot()
+        plot_img = prediction.plot()
         detection_save_path = base_dir / "detection.jpg"
         cv2.imwrite(str(detection_save_path), plot_img)
-        
+
         # 3. カード画像の切り出し
         cropped_images = []
-        detections = results[0].boxes.data.cpu().numpy()
-        
+        detections = prediction.boxes.data.cpu().numpy()
+
         # 座標ソート
         detections = sorted(detections, key=lambda x: (x[1] // 100, x[0]))
-        
-        # クロップ画像用ディレクトリ (散らばらないようにサブフォルダ推奨だが、今回は直下には置かないでおく)
-        # 要望: "timestampフォルダの中に...すべて格納" -> base_dir/crops/crop_xx.jpg とする
+
+        # クロップ画像用ディレクトリ: base_dir/crops/crop_xx.jpg
         crops_dir = base_dir / "crops"
         crops_dir.mkdir(exist_ok=True)
-        
+
         # MEDIA_URLからの相対パス計算用
         # base_dir は .../media/bulk_register/2024/...
         # settings.MEDIA_ROOT は .../media/
@@ -317,98 +555,52 @@ class CardAnalyzer:
                 'id': i,
                 'path': str(crop_path),
                 'image': crop,
-                'media_url': media_url
+                'media_url': media_url,
+                'hash': crop_hash(crop),
             })
-            
-        if not cropped_images:
-            logger.warning("No cards detected by YOLO")
-            return {'error': 'No cards detected', 'count': 0}
-
-        # 4. グリッド画像の作成
-        grid_save_path = base_dir / "grid.jpg"
-        self._create_grid_image(cropped_images, grid_save_path)
-
-        # 5. Gemini API KEYの取得と初期化
-        current_key, key_index = self._get_current_api_key()
-        self._setup_gemini(current_key)
-
-        # 6. Geminiへ問い合わせ
-        gemini_response = self._query_gemini(str(grid_save_path))
+        return cropped_images
 
-        # 7. 成功したら使用回数をインクリメント
-        self._increment_usage(key_index)
-
-        # 8. 生レスポンス保存
-        response_log_path = base_dir / "gemini_response.txt"
-        with open(response_log_path, 'w', encoding='utf-8') as f:
-            f.write(gemini_response)
+    def _request_gemini(self, grid_path: str) -> str:
+        """
+        API KEYを選んでGeminiに問い合わせ、生レスポンスを保存して返す
 
-        return {
-            'timestamp': timestamp,
-            'card_count': len(cropped_images),
-            'cropped_images': cropped_images,
-            'grid_image': str(grid_save_path),
-            'raw_response': gemini_response
-        }
+        利用制限 (ResourceExhausted) を受けたキーは一時停止し、次のキーで再試行します。
 
-    def _create_grid_image(self, cropped_images: list, save_path: Path) -> Path:
+        Raises:
+            ResourceExhausted: 使用可能なキーがない場合
         """
-        複数のカード画像を1枚のグリッド画像に結合して保存する
-        """
-        # 画像サイズを統一
-        target_width = 400
-        resized_images = []
-        
-        for item in cropped_images:
-            img = item['image']
-            h, w = img.shape[:2]
-            scale = target_width / w
-            new_h = int(h * scale)
-            resized = cv2.resize(img, (target_width, new_h))
-            
-            cv2.putText(
-                resized, 
-                f"ID: {item['id']}", 
-                (10, 30), 
-                cv2.FONT_HERSHEY_SIMPLEX, 
-                1.0, 
-                (0, 0, 255), 
-                2
-            )
-            resized_images.append(resized)
-            
-        num_images = len(resized_images)
-        cols = 4 # 4列固定
-        rows = (num_images + cols - 1) // cols
-        
-        if resized_images:
-            max_h = max(img.shape[0] for img in resized_images)
-        else:
-            max_h = 100 # ダミー
-            
-        grid_h = rows * max_h
-        grid_w = cols * target_width
-        
-        grid = np.full((grid_h, grid_w, 3), 255, dtype=np.uint8)
-        
-        for idx, img in enumerate(resized_images):
-            r = idx // cols
-            c = idx % cols
-            
-            y_offset = r * max_h
-            x_offset = c * target_width
-            
-            h, w = img.shape[:2]
-            grid[y_offset:y_offset+h, x_offset:x_offset+w] = img
-            
-        cv2.imwrite(str(save_path), grid)
-        return save_path
-
-    def _query_gemini(self, image_path: str) -> str:
+        for _ in range(len(self.api_keys)):
+            # Gemini API KEYの選択と使用回数の予約 (1文のUPDATEで行う)
+            reserved = self.key_scheduler.reserve()
+            if reserved is None:
+                break
+            current_key, key_index = reserved
+            gemini_model = self._setup_gemini(current_key)
+
+            # Geminiへ問い合わせ
+            try:
+                gemini_response = self._query_gemini(gemini_model, grid_path)
+            except ResourceExhausted:
+                # 予約した使用回数は戻さず (実際に利用制限を受けたため)、次のキーで再試行する
+                self.key_scheduler.cool_down(key_index)
+                continue
+            except Exception:
+                self.key_scheduler.release(key_index)
+                raise
+
+            # 生レスポンス保存 (grid_00.jpg -> grid_00_response.txt)
+            response_log_path = Path(grid_path).with_name(f"{Path(grid_path).stem}_response.txt")
+            with open(response_log_path, 'w', encoding='utf-8') as f:
+                f.write(gemini_response)
+            return gemini_response
+
+        raise ResourceExhausted("RESOURCE_EXHAUSTED: All API keys reached daily quota")
+
+    def _query_gemini(self, gemini_model, image_path: str) -> str:
         """Gemini APIに画像を送信して解析する"""
         try:
             img = Image.open(image_path)
-            response = self.gemini_model.generate_content([
+            response = gemini_model.generate_content([
                 self.GEMINI_PROMPT,
                 img
             ])
@@ -416,3 +608,207 @@ class CardAnalyzer:
         except Exception as e:
             logger.error(f"Gemini API Error: {e}")
             raise
+
+
+class GeminiGridQueue:
+    """
+    Geminiに送信するカードの待ち行列
+
+    複数画像から未解析のカード (抽出結果キャッシュにないカード) を集め、グリッドの作成方法に従って
+    グリッド画像にまとめて送信します。同じカードは1回だけ送信します。
+    送信は1スレッドで順番に行うため、グリッドは追加した順に完了します。
+    """
+
+    def __init__(self, analyzer: CardAnalyzer, image_paths: list, executor, report):
+        self.analyzer = analyzer
+        self.packer = analyzer.grid_packer
+        self.cache = analyzer.result_cache
+        self.image_paths = image_paths
+        self.executor = executor
+        self.report = report
+        # ハッシュ -> 抽出結果 (キャッシュから取得したもの、およびGeminiで解析したもの)
+        self.known = {}
+        # 送信待ちのカード [(ハッシュ, 切り抜き画像, 画像インデックス)]
+        self.pending = []
+        # ハッシュ -> 送信待ちに加えた順番
+        self.sequence = {}
+        self.grids = []
+        self._lock = threading.Lock()
+        self._done_upto = 0 # この順番より前のカードは解析済み
+        self._waiting = {} # 画像インデックス -> 解析を待っているカードの最後の順番
+
+    def add_image(self, index: int, cropped_images: list) -> int:
+        """
+        画像1枚分の切り抜き画像を追加し、グリッドが埋まっていれば送信する
+
+        Returns:
+            int: 抽出結果キャッシュから解決できたカードの枚数
+        """
+        digests = list(dict.fromkeys(crop['hash'] for crop in cropped_images))
+        lookup = [d for d in digests if d not in self.known and d not in self.sequence]
+        if self.cache and lookup:
+            self.known.update(self.cache.lookup_crops(lookup))
+
+        required = []
+        for crop in cropped_images:
+            digest = crop['hash']
+            if digest in self.known:
+                continue
+            if digest not in self.sequence:
+                self.sequence[digest] = len(self.sequence)
+                self.pending.append((digest, crop, index))
+            required.append(self.sequence[digest])
+
+        if not required:
+            logger.info(f"All {len(cropped_images)} cards resolved from cache: {self.image_paths[index]}")
+            self.report('gridded', index)
+        self._wait_for(index, max(required, default=-1))
+
+        ready, self.pending = self.packer.take_ready(self.pending)
+        for entries in ready:
+            self._send(entries)
+
+        return sum(1 for crop in cropped_images if crop['hash'] in self.known)
+
+    def flush(self):
+        """送信待ちのカードをすべて送信する"""
+        for entries in self.packer.split(self.pending):
+            self._send(entries)
+        self.pending = []
+
+    def collect(self) -> dict:
+        """
+        送信したグリッドの結果を回収し、抽出結果を known に加える
+
+        Returns:
+            dict: 解析に失敗したカードのハッシュ -> 例外
+        """
+        failures = {}
+        for grid in self.grids:
+            raw_response = None
+            try:
+                if grid['cached'] is not None:
+                    items = grid['cached']
+                else:
+                    raw_response = grid['future'].result()
+                    items = self._parse_items(raw_response, len(grid['digests']))
+                    if self.cache:
+                        self.cache.store(grid['hash'], grid['digests'], items)
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON Parse Error: {e}")
+                logger.error(f"Raw Response: {raw_response}")
+                failures.update((digest, e) for digest in grid['digests'])
+            except Exception as e:
+                failures.update((digest, e) for digest in grid['digests'])
+            else:
+                self.known.update((d, item) for d, item in zip(grid['digests'], items) if item is not None)
+        return failures
+
+    def request_count(self) -> int:
+        """Geminiに問い合わせたグリッドの数"""
+        return sum(1 for grid in self.grids if grid['cached'] is None)
+
+    def sent_count(self) -> int:
+        """Geminiに問い合わせたカードの枚数"""
+        return sum(len(grid['digests']) for grid in self.grids if grid['cached'] is None)
+
+    def _send(self, entries: list):
+        """カードをグリッド画像にまとめ、Geminiへの問い合わせを登録する"""
+        grid_no = len(self.grids)
+        # グリッド内のIDは0始まりで振り直す (プロンプトの指示に合わせる)
+        grid_crops = [dict(crop, id=i) for i, (_, crop, _) in enumerate(entries)]
+        grid_path = Path(self.image_paths[entries[0][2]]).parent / f"grid_{grid_no:02d}.jpg"
+        grid = {
+            'path': str(grid_path),
+            'digests': [digest for digest, _, _ in entries],
+            'bytes': self.packer.save(grid_crops, grid_path),
+            'hash': None,
+            'cached': None,
+        }
+        for index in dict.fromkeys(owner for _, _, owner in entries):
+            self.report('gridded', index)
+
+        # 同じグリッド画像を以前に送信していれば、その結果を使う
+        if self.cache:
+            grid['hash'] = file_hash(grid_path)
+            grid['cached'] = self.cache.lookup_grid(grid['hash'])
+
+        logger.info(f"Grid {grid_no}: {len(entries)} cards, {grid['bytes']} bytes ({self.packer.name})")
+        # キャッシュから解決できた場合も、完了順を保つため同じスレッドを経由させる
+        done_upto = self.sequence[entries[-1][0]] + 1
+        grid['future'] = self.executor.submit(self._run, grid, done_upto)
+        self.grids.append(grid)
+
+    def _run(self, grid: dict, done_upto: int):
+        """Geminiへの問い合わせ (バックグラウンドスレッドで実行される)"""
+        try:
+            if grid['cached'] is None:
+                return self.analyzer._request_gemini(grid['path'])
+            return None
+        finally:
+            self._mark_done(done_upto)
+            # スレッドごとに開いたDB接続を閉じる
+            connection.close()
+
+    def _parse_items(self, raw_response: str, count: int) -> list:
+        """Geminiの抽出結果をグリッド内のID順に並べる (返されなかったカードは None)"""
+        items = [None] * count
+        for position, item in enumerate(self.analyzer.parse_response(raw_response)):
+            if not isinstance(item, dict):
+                continue
+            try:
+                local_id = int(item.get('id'))
+            except (TypeError, ValueError):
+                local_id = position
+            if 0 <= local_id < count:
+                items[local_id] = {key: value for key, value in item.items() if key != 'id'}
+        return items
+
+    def _wait_for(self, index: int, last: int):
+        with self._lock:
+            if last < self._done_upto:
+                self.report('ai_parsed', index)
+            else:
+                self._waiting[index] = last
+
+    def _mark_done(self, done_upto: int):
+        """指定した順番までのカードが解析済みになった画像の進捗を報告する"""
+        with self._lock:
+            self._done_upto = done_upto
+            ready = [index for index, last in self._waiting.items() if last < done_upto]
+            for index in ready:
+                del self._waiting[index]
+                self.report('ai_parsed', index)
+
+
+_model_pool = None
+_analyzer = None
+_registry_lock = threading.RLock()
+
+
+def get_yolo_model_pool() -> YoloModelPool:
+    """プロセス内で共有するYOLOモデルプールを取得する (初回呼び出し時に生成)"""
+    global _model_pool
+    if _model_pool is None:
+        with _registry_lock:
+            if _model_pool is None:
+                _model_pool = YoloModelPool(
+                    CardAnalyzer.load_yolo_model,
+                    size=settings.YOLO_MODEL_POOL_SIZE,
+                )
+    return _model_pool
+
+
+def get_card_analyzer() -> 'CardAnalyzer':
+    """
+    プロセス内で共有するCardAnalyzerを取得する
+
+    リクエストごとにCardAnalyzerを生成するとYOLOモデルのロードが毎回走るため、
+    ビューからは必ずこの関数経由で取得してください。
+    """
+    global _analyzer
+    if _analyzer is None:
+        with _registry_lock:
+            if _analyzer is None:
+                _analyzer = CardAnalyzer()
+    return _analyzer
@@ -1,6 +1,38 @@
+import logging
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# YOLOモデルを事前ロードする管理コマンド (migrate や shell などではロードしない)
+# run_analysis_worker はコマンド内で事前ロードする
+PRELOAD_COMMANDS = ('runserver',)
+
+
+def _is_serving_process() -> bool:
+    """Webサーバー (gunicorn / runserver) として起動しているか"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program in ('manage.py', 'django-admin', 'django-admin.py', '__main__.py'):
+        return len(sys.argv) > 1 and sys.argv[1] in PRELOAD_COMMANDS
+    return True
 
 
 class CardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cards'
+
+    def ready(self):
+        # カードの変更でキャッシュを無効化するシグナルを登録する
+        from . import signals  # noqa: F401
+
+        # gunicorn --preload 時はマスタープロセスでロードされ、フォーク後のワーカーで共有される
+        if settings.YOLO_PRELOAD and _is_serving_process():
+            from .ai_analyzer import get_card_analyzer
+            try:
+                get_card_analyzer().preload()
+            except Exception as e:
+                # 事前ロードに失敗しても、初回解析時に改めてロードされる
+                logger.error(f"Failed to preload YOLO model: {e}")
@@ -0,0 +1,343 @@
+"""
+一括登録 (AI解析) の処理モジュール
+
+アップロード画像の保存、AI解析の実行、解析結果のマッピングと、
+それらを非同期に実行するための解析ジョブ (AnalysisJob) の管理を提供します。
+ビューからの同期実行と run_analysis_worker コマンドからの非同期実行の両方で共有されます。
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from google.api_core.exceptions import ResourceExhausted
+
+from .ai_analyzer import get_card_analyzer
+from .data_mapper import CardDataMapper
+from .models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisError(Exception):
+    """解析結果を利用できない場合のエラー (ユーザー向けメッセージを持つ)"""
+
+    def __init__(self, message: str, code: str = 'error'):
+        super().__init__(message)
+        self.code = code
+
+
+# エラー種別ごとのユーザー向けメッセージ
+ERROR_MESSAGES = {
+    'invalid_response': 'AIからの解析結果を正しく読み取れませんでした(JSON形式エラー)。解析結果を確認し、必要であれば再度お試しください。',
+    'quota': 'AIサービスが混雑しており利用制限にかかりました。申し訳ありませんが、しばらく時間を置いてから再試行してください。',
+    'no_cards': 'カードを検出できませんでした。撮影のコツを参考に、別の画像でお試しください。',
+}
+
+
+def save_uploaded_image(image_file) -> tuple[str, str]:
+    """
+    アップロード画像を一括登録用ディレクトリに保存する
+
+    Returns:
+        tuple[str, str]: (保存先の絶対パス, 画像のURL)
+    """
+    # 日時ベースのディレクトリを作成: bulk_register/YYYY/MM/DD/HHMMSS_ID/
+    # 注意: 本番運用ではS3や専用ストレージへの保存、および定期的なクリーンアップが必要
+    now = datetime.now()
+    timestamp_str = now.strftime('%H%M%S')
+    unique_id = uuid.uuid4().hex[:8]
+
+    relative_dir = os.path.join(
+        'bulk_register',
+        str(now.year),
+        f'{now.month:02d}',
+        f'{now.day:02d}',
+        f'{timestamp_str}_{unique_id}'
+    )
+    save_dir = os.path.join(settings.MEDIA_ROOT, relative_dir)
+    os.makedirs(save_dir, exist_ok=True)
+
+    # ファイル保存
+    ext = os.path.splitext(image_file.name)[1]
+    filename = f"original{ext}"
+    file_path = os.path.join(save_dir, filename)
+    file_url = os.path.join(settings.MEDIA_URL, relative_dir, filename)
+
+    with open(file_path, 'wb+') as destination:
+        for chunk in image_file.chunks():
+            destination.write(chunk)
+
+    return file_path, file_url
+
+
+def map_analysis_items(raw_items: list, cropped_images: list) -> list:
+    """
+    解析結果をプレビュー・登録用の辞書リストに変換する
+
+    モデルインスタンスはセッション等に保存できるようIDに変換し、表示用の名称や色情報も併せて保持します。
+    """
+    mapper = CardDataMapper()
+    mapped_items = []
+    crops_by_id = {crop['id']: crop for crop in cropped_images}
+
+    for i, raw_item in enumerate(raw_items):
+        mapped = mapper.map_item(raw_item)
+        mapped['id'] = str(uuid.uuid4()) # 一時ID
+
+        # モデルインスタンスをIDに変換しつつ、表示用名称も保存
+        if mapped.get('category'):
+            mapped['category_name'] = mapped['category'].name
+            mapped['category'] = mapped['category'].id
+        else:
+            # ポケモンまたはトレーナーズ以外は除外
+            continue
+
+        if mapped.get('evolution_stage'):
+            mapped['evolution_stage_name'] = mapped['evolution_stage'].name
+            mapped['evolution_stage'] = mapped['evolution_stage'].id
+
+        if mapped.get('trainer_type'):
+            mapped['trainer_type_name'] = mapped['trainer_type'].name
+            mapped['trainer_type'] = mapped['trainer_type'].id
+
+        # ManyToManyのリスト(オブジェクト)をIDのリストに変換 & 名称リスト作成
+        for field in ['types', 'special_features', 'move_types', 'special_trainers', 'weakness', 'resistance']:
+            if mapped.get(field):
+                # 表示用名称リスト (例: types_names)
+                mapped[f'{field}_names'] = [obj.name for obj in mapped[field]]
+
+                # types, weakness, resistanceの場合、プレビュー用に色情報も含める
+                if field in ['types', 'weakness', 'resistance', 'move_types']:
+                    mapped[f'{field}_preview'] = [
+                        {
+                            'name': obj.name,
+                            'bg_color': obj.bg_color,
+                            'text_color': obj.text_color
+                        } for obj in mapped[field]
+                    ]
+                mapped[field] = [obj.id for obj in mapped[field]]
+
+        # クロップ画像のURLを紐付ける (idがない場合はインデックスが一致すると仮定)
+        crop = crops_by_id.get(raw_item.get('id'))
+        if crop is None and i < len(cropped_images):
+            crop = cropped_images[i]
+        mapped['image_url'] = crop['media_url'] if crop else None # 画像がない場合はNone
+
+        mapped_items.append(mapped)
+
+    return mapped_items
+
+
+def run_analysis(image_paths: list, progress_callback=None) -> dict:
+    """
+    複数画像のAI解析からマッピングまでを実行する
+
+    一部の画像が失敗しても、解析できた画像の結果は返します (失敗内容は 'warnings' に格納)。
+
+    Args:
+        image_paths: 解析する画像の絶対パスのリスト
+        progress_callback: 各段階の完了時に (段階名, 画像インデックス) を受け取る関数
+
+    Returns:
+        dict: 'items' (マッピング済みのアイテムリスト), 'warnings' (画像ごとの失敗内容),
+              'stats' (画像枚数・カード枚数・所要時間・毎分カード数)
+
+    Raises:
+        AnalysisError: すべての画像で解析結果を利用できない場合
+    """
+    start = time.perf_counter()
+
+    # AI解析実行 (YOLOモデルはワーカープロセス内で共有)
+    analyzer = get_card_analyzer()
+    batch = analyzer.analyze_images(image_paths, progress_callback=progress_callback)
+
+    mapped_items = []
+    errors = []
+    for index, result in enumerate(batch['images']):
+        try:
+            raw_items = _raw_items_from_result(result)
+        except AnalysisError as e:
+            errors.append((index, e))
+            continue
+
+        # データマッピング (抽出結果のidでクロップ画像と紐付ける)
+        items = map_analysis_items(raw_items, result.get('cropped_images', []))
+        for item in items:
+            item['source_image'] = index + 1 # 何枚目の画像から検出したか
+        mapped_items.extend(items)
+
+    if errors and len(errors) == len(image_paths):
+        # すべての画像が失敗した場合は、最初のエラーをそのまま伝える
+        raise errors[0][1]
+
+    if progress_callback:
+        progress_callback(AnalysisJob.STAGE_MAPPED, None)
+
+    # 一括登録全体 (検出〜マッピング) の処理速度
+    elapsed = time.perf_counter() - start
+    stats = dict(batch['stats'])
+    stats.update({
+        'item_count': len(mapped_items),
+        'elapsed_seconds': round(elapsed, 2),
+        'cards_per_minute': round(len(mapped_items) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+    })
+    logger.info(
+        f"Bulk analysis finished: {stats['image_count']} images, {stats['item_count']} items "
+        f"in {elapsed:.1f}s ({stats['cards_per_minute']} cards/min)"
+    )
+
+    return {
+        'items': mapped_items,
+        'warnings': [f"{index + 1}枚目: {error}" for index, error in errors],
+        'stats': stats,
+    }
+
+
+def _raw_items_from_result(result: dict) -> list:
+    """画像1枚分の解析結果からGeminiの抽出データを取り出す (失敗時は AnalysisError)"""
+    if result.get('error'):
+        exception = result.get('exception')
+        if isinstance(exception, ResourceExhausted):
+            logger.error("Gemini API Quota Exceeded")
+            raise AnalysisError(ERROR_MESSAGES['quota'], code='quota')
+        if isinstance(exception, json.JSONDecodeError):
+            raise AnalysisError(ERROR_MESSAGES['invalid_response'], code='invalid_response')
+        if exception is None:
+            raise AnalysisError(ERROR_MESSAGES['no_cards'], code='no_cards')
+        raise AnalysisError(f"エラーが発生しました: {result['error']}")
+
+    return result['items']
+
+
+# ==========================================
+# 解析ジョブ (AnalysisJob)
+# ==========================================
+
+def enqueue_analysis_job(images: list) -> AnalysisJob:
+    """
+    解析ジョブをキューに登録する
+
+    Args:
+        images: save_uploaded_image の戻り値 (絶対パス, URL) のリスト
+    """
+    job = AnalysisJob.objects.create(
+        images=[{'path': path, 'url': url} for path, url in images]
+    )
+    logger.info(f"Analysis job queued: {job.pk} ({len(images)} images)")
+    return job
+
+
+def claim_next_job():
+    """
+    待機中のジョブを1件取得し、解析中に変更する
+
+    状態の更新は「待機中であること」を条件とした1文のUPDATEで行うため、
+    複数のワーカーが同時に動いていても同じジョブを二重に処理しません。
+
+    Returns:
+        AnalysisJob | None: 取得したジョブ (待機中のジョブがない場合は None)
+    """
+    candidates = AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_PENDING
+    ).order_by('created_at').values_list('pk', flat=True)[:5]
+
+    for job_id in candidates:
+        claimed = AnalysisJob.objects.filter(
+            pk=job_id, status=AnalysisJob.STATUS_PENDING
+        ).update(
+            status=AnalysisJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return AnalysisJob.objects.get(pk=job_id)
+    return None
+
+
+def process_job(job: AnalysisJob):
+    """ジョブを実行し、結果または失敗理由を保存する"""
+    def update_stage(stage, index):
+        # 画像ごとの処理は並行して進むため、終わった順に書き込むと進捗が戻ることがある。
+        # 現在の進捗より後の段階の場合のみ進める (1文のUPDATEの条件で判定する)
+        updates = {
+            'stage': Case(When(stage__in=_earlier_stages(stage), then=Value(stage)), default=F('stage')),
+            'updated_at': timezone.now(),
+        }
+        if stage == AnalysisJob.STAGE_AI_PARSED:
+            updates['processed_images'] = F('processed_images') + 1
+        AnalysisJob.objects.filter(pk=job.pk).update(**updates)
+        logger.info(f"Analysis job {job.pk}: {stage} (image {index})")
+
+    try:
+        result = run_analysis([image['path'] for image in job.images], progress_callback=update_stage)
+    except AnalysisError as e:
+        _fail_job(job, e.code, str(e))
+    except Exception as e:
+        logger.error(f"Analysis job {job.pk} failed: {e}", exc_info=True)
+        _fail_job(job, 'error', f"エラーが発生しました: {str(e)}")
+    else:
+        AnalysisJob.objects.filter(pk=job.pk).update(
+            status=AnalysisJob.STATUS_DONE,
+            stage=AnalysisJob.STAGE_MAPPED,
+            result=result,
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        logger.info(f"Analysis job {job.pk} done: {len(result['items'])} items")
+
+
+def _earlier_stages(stage: str) -> list:
+    """進捗の段階より前の段階 (AnalysisJob.STAGE_CHOICES の順)"""
+    stages = [value for value, _ in AnalysisJob.STAGE_CHOICES]
+    return stages[:stages.index(stage)]
+
+
+def _fail_job(job: AnalysisJob, code: str, message: str):
+    AnalysisJob.objects.filter(pk=job.pk).update(
+        status=AnalysisJob.STATUS_FAILED,
+        error_code=code,
+        error_message=message,
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+def requeue_stale_jobs(stale_seconds: int, max_attempts: int = 3) -> int:
+    """
+    ワーカーの強制終了などで解析中のまま残ったジョブを待機中に戻す
+
+    試行回数が上限に達したジョブは失敗扱いにします。
+    """
+    threshold = timezone.now() - timedelta(seconds=stale_seconds)
+    stale = AnalysisJob.objects.filter(status=AnalysisJob.STATUS_RUNNING, updated_at__lt=threshold)
+
+    stale.filter(attempts__gte=max_attempts).update(
+        status=AnalysisJob.STATUS_FAILED,
+        error_code='error',
+        error_message='解析が時間内に完了しませんでした。再度お試しください。',
+        finished_at=timezone.now(),
+    )
+    return stale.filter(attempts__lt=max_attempts).update(
+        status=AnalysisJob.STATUS_PENDING,
+        stage=AnalysisJob.STAGE_QUEUED,
+        processed_images=0,
+        updated_at=timezone.now(),
+    )
+
+
+def delete_old_jobs(keep_days: int) -> int:
+    """終了から一定期間が経過したジョブを削除する"""
+    threshold = timezone.now() - timedelta(days=keep_days)
+    deleted, _ = AnalysisJob.objects.filter(
+        status__in=[AnalysisJob.STATUS_DONE, AnalysisJob.STATUS_FAILED],
+        finished_at__lt=threshold,
+    ).delete()
+    return deleted
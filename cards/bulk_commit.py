@@ -0,0 +1,244 @@
+"""
+一括登録のカード登録処理
+
+プレビュー中のアイテム (BulkRegisterItem) をまとめてカードとして登録します。
+
+- カードは bulk_create で一括作成し、ManyToManyの中間テーブルの行もフィールドごとに1回の bulk_create で作成します
+- 切り抜き画像は読み込んで書き直すのではなく、カード画像の保存先へ移動 (rename) し、一覧表示用の縮小画像を生成します
+- 登録はトランザクション内で行い、DBへの登録に失敗した場合は移動した画像を元に戻します
+- 入力に問題があるアイテム (文字数・数値の範囲を含む) は登録せず、アイテムごとのエラーとして返します
+"""
+
+import logging
+import os
+import shutil
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .cache_versions import notify_cards_changed
+from .master_data import get_master_data
+from .models import (
+    CardCategory, EvolutionStage, MoveType, PokemonCard, SpecialFeature, SpecialTrainer, TrainerType, Type,
+    card_image_upload_to,
+)
+from .query_builder import normalize_card_name
+from .aggregates import refresh_aggregates
+from .csv_import import MAX_INT
+from .search_documents import sync_documents
+from .thumbnails import delete_thumbnails, generate_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# 外部キーの項目と参照先のモデル
+FOREIGN_KEY_FIELDS = {
+    'category': CardCategory,
+    'evolution_stage': EvolutionStage,
+    'trainer_type': TrainerType,
+}
+
+# 文字数を確認する項目
+TEXT_FIELDS = ('name', 'evolves_from')
+
+# 数値の項目と、空欄の場合の値
+INT_FIELDS = {
+    'quantity': 1,
+    'hp': None,
+    'retreat_cost': None,
+}
+
+# ManyToManyの項目と参照先のモデル
+MANY_TO_MANY_FIELDS = {
+    'types': Type,
+    'weakness': Type,
+    'resistance': Type,
+    'special_features': SpecialFeature,
+    'move_types': MoveType,
+    'special_trainers': SpecialTrainer,
+}
+
+
+@dataclass
+class BulkCommitError:
+    """登録できなかったアイテムとその理由"""
+    item_id: str
+    name: str
+    message: str
+
+
+@dataclass
+class BulkCommitResult:
+    created: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+
+class BulkCardCommitter:
+    """
+    プレビュー中のアイテムをまとめてカードとして登録するクラス
+
+    Usage:
+        result = BulkCardCommitter().commit([item.data for item in items])
+    """
+
+    def __init__(self):
+        # 参照先ごとの有効なIDの集合 (存在しないIDを含むアイテムを事前に除外するため)
+        self._valid_ids = {}
+
+    def commit(self, items: list) -> BulkCommitResult:
+        """
+        アイテム (解析結果のdict) のリストをカードとして登録する
+
+        Returns:
+            BulkCommitResult: 作成したカードと、登録できなかったアイテムのエラー
+        """
+        result = BulkCommitResult()
+        prepared = []
+        for item in items:
+            message = self._validate(item)
+            if message:
+                result.errors.append(BulkCommitError(item.get('id', ''), item.get('name') or '名称不明', message))
+                continue
+            prepared.append((item, self._build_card(item)))
+
+        if not prepared:
+            return result
+
+        moved = self._move_images(prepared)
+        try:
+            with transaction.atomic():
+                cards = PokemonCard.objects.bulk_create([card for _, card in prepared])
+                self._create_relations(prepared)
+                # bulk_create ではシグナルが発生しないため、検索用ドキュメント・コレクションの集計もここで反映する
+                sync_documents([card.pk for card in cards])
+                refresh_aggregates([card.pk for card in cards])
+        except Exception:
+            # DBへの登録に失敗した場合は、移動した画像を元の場所に戻す
+            self._restore_images(moved)
+            raise
+
+        notify_cards_changed()
+        result.created = cards
+        return result
+
+    def _validate(self, item: dict) -> str | None:
+        """アイテムの入力に問題がある場合はエラーメッセージを返す"""
+        if not item.get('name'):
+            return "カード名がありません"
+        if not item.get('category'):
+            return "カテゴリがありません"
+        for key, model in FOREIGN_KEY_FIELDS.items():
+            value = item.get(key)
+            if value and value not in self._ids(model):
+                return f"{model._meta.verbose_name}の指定が不正です"
+        for key, model in MANY_TO_MANY_FIELDS.items():
+            invalid = set(item.get(key) or []) - self._ids(model)
+            if invalid:
+                return f"{PokemonCard._meta.get_field(key).verbose_name}の指定が不正です"
+        # データベースが受け付けない値で一括登録全体が失敗しないよう、文字数・数値の範囲もアイテムごとに確認する
+        for key in TEXT_FIELDS:
+            model_field = PokemonCard._meta.get_field(key)
+            if len(str(item.get(key) or '')) > model_field.max_length:
+                return f"{model_field.verbose_name}は{model_field.max_length}文字以内で指定してください"
+        for key, default in INT_FIELDS.items():
+            label = PokemonCard._meta.get_field(key).verbose_name
+            try:
+                value = self._to_int(item.get(key), default=default)
+            except (TypeError, ValueError):
+                return f"{label}に不正な値があります"
+            if value is not None and not 0 <= value <= MAX_INT:
+                return f"{label}は0以上{MAX_INT}以下で指定してください"
+        return None
+
+    def _build_card(self, item: dict) -> PokemonCard:
+        name = item['name']
+        return PokemonCard(
+            name=name,
+            # bulk_create では save() が呼ばれないため、検索用のカード名もここで設定する
+            name_normalized=normalize_card_name(name),
+            quantity=self._to_int(item.get('quantity'), default=INT_FIELDS['quantity']),
+            memo=item.get('memo', ''),
+            category_id=item.get('category'),
+            evolution_stage_id=item.get('evolution_stage'),
+            trainer_type_id=item.get('trainer_type'),
+            evolves_from=item.get('evolves_from'),
+            hp=self._to_int(item.get('hp')),
+            retreat_cost=self._to_int(item.get('retreat_cost')),
+        )
+
+    def _move_images(self, prepared: list) -> list:
+        """
+        切り抜き画像をカード画像の保存先へ移動してカードに設定し、縮小画像を生成する
+
+        Returns:
+            list: 移動した画像の (移動元, 移動先, 画像のパス) のリスト
+        """
+        moved = []
+        for item, card in prepared:
+            source = self._crop_path(item.get('image_url'))
+            if source is None:
+                continue
+            name = default_storage.get_available_name(card_image_upload_to(card, source.name))
+            destination = default_storage.path(name)
+            try:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                try:
+                    os.replace(source, destination)
+                except OSError:
+                    # 別のファイルシステムの場合はコピーして削除する
+                    shutil.move(source, destination)
+            except OSError as e:
+                logger.warning(f"Failed to move image for saving: {e}")
+                continue
+            card.image.name = name
+            # bulk_create では save() が呼ばれないため、縮小画像もここで生成する
+            card.image_thumbnails = generate_thumbnails(name)
+            moved.append((source, destination, name))
+        return moved
+
+    @staticmethod
+    def _restore_images(moved: list):
+        for source, destination, name in moved:
+            delete_thumbnails(name)
+            try:
+                shutil.move(destination, source)
+            except OSError as e:
+                logger.error(f"Failed to restore image {destination}: {e}")
+
+    @staticmethod
+    def _crop_path(image_url: str):
+        """切り抜き画像のURL (/media/bulk_register/...) から、存在するファイルのパスを返す"""
+        if not image_url:
+            return None
+        # 相対パスを取得 (/media/bulk_register/cropped/xxx.jpg -> bulk_register/cropped/xxx.jpg)
+        relative_path = image_url.replace(settings.MEDIA_URL, '')
+        full_path = settings.MEDIA_ROOT / relative_path
+        return full_path if full_path.is_file() else None
+
+    @staticmethod
+    def _create_relations(prepared: list):
+        """ManyToManyの中間テーブルの行を、項目ごとに1回の bulk_create で作成する"""
+        for key in MANY_TO_MANY_FIELDS:
+            m2m_field = PokemonCard._meta.get_field(key)
+            through = m2m_field.remote_field.through
+            source_column = f'{m2m_field.m2m_field_name()}_id'
+            target_column = f'{m2m_field.m2m_reverse_field_name()}_id'
+            rows = [
+                through(**{source_column: card.pk, target_column: target_id})
+                for item, card in prepared
+                for target_id in dict.fromkeys(item.get(key) or [])
+            ]
+            if rows:
+                through.objects.bulk_create(rows)
+
+    def _ids(self, model) -> set:
+        if model not in self._valid_ids:
+            self._valid_ids[model] = set(get_master_data().by_pk(model))
+        return self._valid_ids[model]
+
+    @staticmethod
+    def _to_int(value, default=None):
+        if value is None or value == '':
+            return default
+        return int(value)
@@ -0,0 +1,69 @@
+"""
+キャッシュの無効化用バージョン管理モジュール
+
+カードデータから作る派生データ (進化系統の索引など) は、カードデータのバージョンをキーに含めてキャッシュします。
+カードが変更されるとバージョンが更新され、古いキャッシュは以降使われなくなります。
+バージョンは共有キャッシュに保存するため、gunicornの他のワーカーにも反映されます。
+派生データのエントリ数が上限を超えてもバージョンが削除されないよう、バージョンは専用のキャッシュ (versions) に保存します。
+
+マスタデータ (タイプ・進化段階など) についても、同じ方法でバージョンを管理します
+(カードの表示部品のキャッシュはマスタの名前や色を含むため)。
+
+save() / delete() による変更はシグナル (cards.signals) で自動的に反映されます。
+bulk_create() や QuerySet.update() など、シグナルが発生しない方法でカードを変更した場合は
+notify_cards_changed() を呼び出してください。
+"""
+
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+# バージョンを保存するキャッシュ (settings.CACHES)
+VERSION_CACHE_ALIAS = 'versions'
+
+CARDS_VERSION_KEY = 'cards:version'
+MASTER_VERSION_KEY = 'cards:master_version'
+
+
+def get_cards_version() -> str:
+    """現在のカードデータのバージョンを返す"""
+    return _get_version(CARDS_VERSION_KEY)
+
+
+def get_master_version() -> str:
+    """現在のマスタデータのバージョンを返す"""
+    return _get_version(MASTER_VERSION_KEY)
+
+
+def _get_version(key: str) -> str:
+    cache = caches[VERSION_CACHE_ALIAS]
+    version = cache.get(key)
+    if version is None:
+        # 初回 (またはキャッシュ消去後) は新しいバージョンを発行する。同時に発行された場合は先着を使う
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def notify_cards_changed():
+    """
+    カードデータが変更されたことを通知し、バージョンを更新する
+
+    トランザクション内で呼び出された場合は、コミット後に更新します
+    (コミット前のデータで派生データが作り直されるのを防ぐため)。
+    """
+    transaction.on_commit(_bump_cards_version)
+
+
+def _bump_cards_version():
+    caches[VERSION_CACHE_ALIAS].set(CARDS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def notify_master_changed():
+    """マスタデータが変更されたことを通知し、バージョンを更新する (コミット後に更新する)"""
+    transaction.on_commit(_bump_master_version)
+
+
+def _bump_master_version():
+    caches[VERSION_CACHE_ALIAS].set(MASTER_VERSION_KEY, uuid.uuid4().hex, timeout=None)
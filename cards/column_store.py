@@ -0,0 +1,204 @@
+"""
+カードの列ストア (NumPy)
+
+全カードの絞り込み・集計に使う項目 (カテゴリ・進化段階・トレーナーズ種別・HP・にげるエネルギー・枚数と、
+検索用ドキュメントのタイプ・弱点などのビットマスク) を、項目ごとの NumPy 配列としてワーカープロセスのメモリに保持します。
+複数の項目を組み合わせた絞り込みや集計を、SQLを実行せずに配列の演算 (真偽値の配列の AND) で求められます。
+
+- 絞り込み: 検索フォームの条件を列ストアで評価し、ファセットの件数を集計します (cards.facets)
+- 集計: 条件に該当するカードの種類数・所持枚数、項目ごとの内訳、HPの分布などを求めます
+
+カードが変更されると、カードデータのバージョン (cards.cache_versions) が更新されます。
+参照時にバージョンを確認し、変わっていれば全カードを1回のクエリで読み直します。
+ビットマスクは検索用ドキュメント (cards.search_documents) を使用するため、ドキュメントを使用しない場合は使えません。
+
+Usage:
+    from cards.column_store import get_column_store
+
+    store = get_column_store()
+    # 弱点が水タイプ・たねポケモン・HP120以上
+    selection = (
+        store.has_any('weakness', [water.pk])
+        & store.isin('evolution_stage', [basic.pk])
+        & store.range('hp', lower=120)
+    )
+    store.count(selection), store.copies(selection)    # 種類数・所持枚数
+    store.count_by('evolution_stage', selection)       # {進化段階のID: (種類数, 所持枚数)}
+    store.count_by_bit('types', selection)             # {タイプのID: (種類数, 所持枚数)}
+"""
+
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .cache_versions import get_cards_version
+from .master_data import get_master_data
+from .models import PokemonCard
+from .search_documents import MASK_FIELDS, MAX_BIT, documents_enabled, to_mask
+
+# 外部キー・数値の項目 (未設定は NULL_VALUE で保持する)
+FOREIGN_KEY_COLUMNS = ('category', 'evolution_stage', 'trainer_type')
+NUMBER_COLUMNS = ('hp', 'retreat_cost')
+NULL_VALUE = -1
+
+# ビットマスクの各ビット (0〜MAX_BIT)
+BITS = np.arange(MAX_BIT + 1, dtype=np.int64)
+
+
+def column_store_enabled() -> bool:
+    """ファセットなどの集計を列ストアで行うか"""
+    return settings.CARD_COLUMN_STORE and documents_enabled()
+
+
+class CardColumnStore:
+    """ある時点の全カードの列データ (読み込み後は変更しない)"""
+
+    def __init__(self, version: str):
+        self.version = version
+        mask_fields = [mask_field for mask_field, _ in MASK_FIELDS.values()]
+        rows = list(
+            PokemonCard.objects.order_by('pk').values_list(
+                'pk', 'quantity',
+                *[f'{name}_id' for name in FOREIGN_KEY_COLUMNS],
+                *NUMBER_COLUMNS,
+                *[f'search_document__{mask_field}' for mask_field in mask_fields],
+            )
+        )
+        columns = list(zip(*rows)) if rows else [()] * (2 + len(FOREIGN_KEY_COLUMNS) + len(NUMBER_COLUMNS) + len(mask_fields))
+        columns = iter(columns)
+
+        self.pk = np.array(next(columns), dtype=np.int64)
+        self.quantity = np.array(next(columns), dtype=np.int64)
+        self._columns = {}
+        self._nulls = {}
+        for name in (*FOREIGN_KEY_COLUMNS, *NUMBER_COLUMNS):
+            values = next(columns)
+            self._nulls[name] = np.array([value is None for value in values], dtype=bool)
+            self._columns[name] = np.array(
+                [NULL_VALUE if value is None else value for value in values], dtype=np.int64
+            )
+        # ドキュメントのないカードはビットマスクを0とする (検索用ドキュメントでの絞り込みと同じ)
+        self._masks = {
+            attribute: np.array([value or 0 for value in next(columns)], dtype=np.int64)
+            for attribute in MASK_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.pk)
+
+    # --- 絞り込み (真偽値の配列を返す) ---
+
+    def all(self) -> np.ndarray:
+        return np.ones(len(self), dtype=bool)
+
+    def isin(self, column: str, ids) -> np.ndarray:
+        """項目の値 (主キー・外部キーのID・数値) が ids のいずれかであるカード"""
+        values = self.pk if column == 'pk' else self._columns[column]
+        return np.isin(values, np.fromiter(ids, dtype=np.int64)) & ~self._null(column)
+
+    def has_any(self, attribute: str, ids) -> np.ndarray:
+        """ManyToManyの項目に ids のいずれかを含むカード"""
+        return (self._masks[attribute] & to_mask(ids)) != 0
+
+    def has_all(self, attribute: str, ids) -> np.ndarray:
+        """ManyToManyの項目に ids をすべて含むカード"""
+        mask = to_mask(ids)
+        return (self._masks[attribute] & mask) == mask
+
+    def range(self, column: str, lower=None, upper=None, include_null: bool = False) -> np.ndarray:
+        """数値の項目が lower 以上 upper 以下のカード (include_null の場合は未設定のカードも含める)"""
+        values, nulls = self._columns[column], self._nulls[column]
+        selection = ~nulls
+        if lower is not None:
+            selection &= values >= lower
+        if upper is not None:
+            selection &= values <= upper
+        if include_null:
+            selection |= nulls
+        return selection
+
+    # --- 集計 ---
+
+    def count(self, selection) -> int:
+        return int(np.count_nonzero(selection))
+
+    def copies(self, selection) -> int:
+        return int(self.quantity[selection].sum())
+
+    def pks(self, selection) -> list:
+        return self.pk[selection].tolist()
+
+    def count_by(self, column: str, selection) -> dict:
+        """外部キー・数値の項目の値ごとの (種類数, 所持枚数) (未設定のカードは含めない)"""
+        selection = selection & ~self._null(column)
+        values = self._columns[column][selection]
+        if not len(values):
+            return {}
+        cards = np.bincount(values)
+        copies = np.bincount(values, weights=self.quantity[selection])
+        return {int(value): (int(cards[value]), int(copies[value])) for value in np.flatnonzero(cards)}
+
+    def count_by_bit(self, attribute: str, selection) -> dict:
+        """ManyToManyの項目の値 (マスタのID) ごとの (種類数, 所持枚数)"""
+        masks = self._masks[attribute][selection]
+        # カード × ビットの真偽値の行列にして、ビットごとに合計する
+        bits = ((masks[:, np.newaxis] >> BITS) & 1).astype(bool)
+        cards = bits.sum(axis=0)
+        copies = self.quantity[selection] @ bits
+        return {int(bit): (int(cards[bit]), int(copies[bit])) for bit in np.flatnonzero(cards)}
+
+    def histogram(self, column: str, bins, selection) -> list:
+        """
+        数値の項目の分布 (未設定のカードは含めない)
+
+        Returns:
+            list: [(区間の下限, 種類数, 所持枚数)] (最後の区間は上限を含む)
+        """
+        selection = selection & ~self._nulls[column]
+        values = self._columns[column][selection]
+        cards, edges = np.histogram(values, bins=bins)
+        copies, _ = np.histogram(values, bins=edges, weights=self.quantity[selection])
+        return [(int(edge), int(card_count), int(copy_count)) for edge, card_count, copy_count in zip(edges, cards, copies)]
+
+    def _null(self, column: str) -> np.ndarray:
+        if column == 'pk':
+            return np.zeros(len(self), dtype=bool)
+        return self._nulls[column]
+
+
+def filtered_selection(filterset, category: str):
+    """
+    FilterSet の絞り込み条件とカテゴリに該当するカードを、列ストアで求める
+
+    列ストアで評価できない条件 (カード名・メモ) がある場合のみ、その条件に該当するカードをSQLで求めます。
+
+    Returns:
+        tuple: (列ストア, 該当するカードの真偽値の配列)
+    """
+    store = get_column_store()
+    selection, unsupported = filterset.column_selection(store)
+    selection &= store.isin('category', [get_master_data().category(category).pk])
+    if unsupported:
+        queryset = filterset.queryset
+        for name, value in unsupported.items():
+            queryset = filterset.filters[name].filter(queryset, value)
+        selection &= store.isin('pk', queryset.order_by().values_list('pk', flat=True))
+    return store, selection
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def get_column_store() -> CardColumnStore:
+    """現在の列ストアを返す (カードデータのバージョンが変わっていれば読み直す)"""
+    global _current
+    version = get_cards_version()
+    current = _current
+    if current is not None and current.version == version:
+        return current
+    with _lock:
+        if _current is None or _current.version != version:
+            _current = CardColumnStore(version)
+        return _current
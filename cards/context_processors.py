@@ -0,0 +1,14 @@
+"""テンプレートで共通して使用する値"""
+
+from django.utils.functional import SimpleLazyObject
+
+from .cache_versions import get_master_version
+
+
+def cache_versions(request):
+    """
+    マスタデータのバージョン (カードの表示部品のキャッシュのキーに使用する)
+
+    テンプレートで使用された場合のみ取得します。
+    """
+    return {'master_version': SimpleLazyObject(get_master_version)}
@@ -0,0 +1,54 @@
+"""
+カード一覧のCSVエクスポート
+
+PokemonCardResource と同じ列・同じ表記のCSVを、1行ずつ組み立てながら出力します。
+全件のデータセットをメモリ上に作成しないため、件数が多くてもメモリ使用量は一定で、
+先頭の行からすぐにダウンロードが始まります。
+"""
+
+import csv
+
+from .resources import PokemonCardResource
+
+# 1回のクエリで取得する件数 (ManyToManyはこの件数ごとにまとめて取得する)
+CHUNK_SIZE = 200
+
+# エクスポートで参照する関連項目
+EXPORT_SELECT_RELATED = ('category', 'evolution_stage', 'trainer_type')
+EXPORT_PREFETCH_RELATED = (
+    'types', 'weakness', 'resistance', 'special_features', 'move_types', 'special_trainers',
+)
+
+
+class _Echo:
+    """csv.writer の書き込み先 (書き込まれた文字列をそのまま返す)"""
+
+    def write(self, value):
+        return value
+
+
+def iter_cards_csv(queryset, chunk_size: int = CHUNK_SIZE):
+    """
+    カードのCSVを、チャンクごとの文字列として順に返すジェネレータ
+
+    StreamingHttpResponse に渡して使用します。
+    先頭にはExcelで文字化けしないようにBOM (Byte Order Mark) を出力します。
+    """
+    resource = PokemonCardResource()
+    writer = csv.writer(_Echo())
+
+    yield '\ufeff' + writer.writerow(resource.get_export_headers())
+
+    if not queryset.query.order_by:
+        # 並び替えの指定がない場合は、従来のエクスポートと同じく id 順に出力する
+        queryset = queryset.order_by('pk')
+    queryset = queryset.select_related(*EXPORT_SELECT_RELATED).prefetch_related(*EXPORT_PREFETCH_RELATED)
+    lines = []
+    # iterator() は chunk_size 件ごとに取得し、prefetch_related もその単位で実行される
+    for card in queryset.iterator(chunk_size=chunk_size):
+        lines.append(writer.writerow(resource.export_resource(card)))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
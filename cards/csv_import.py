@@ -0,0 +1,357 @@
+"""
+カードのCSVインポート
+
+PokemonCardResource と同じ形式のCSV (エクスポートしたCSV) を取り込みます。
+
+- マスタ (カテゴリ・タイプ・進化段階など) はプロセス内のキャッシュ (cards.master_data) から参照し、名前からIDへの変換はメモリ上で行います
+- 既存のカードは id でまとめて取得して差分を求め、変更のない行はスキップします
+- 新規登録は bulk_create、更新は bulk_update、ManyToManyの変更は項目ごとにまとめて反映します
+- 1件でもエラーがある場合は何も保存しません (全件ロールバック)
+- 文字数・数値の範囲・id の重複など、データベースが受け付けない値は保存する前に行ごとのエラーにします
+"""
+
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache_versions import notify_cards_changed
+from .master_data import get_master_data
+from .models import (
+    CardCategory, EvolutionStage, MoveType, PokemonCard, SpecialFeature, SpecialTrainer, TrainerType, Type,
+)
+from .query_builder import normalize_card_name
+from .aggregates import refresh_aggregates
+from .search_documents import sync_documents
+
+logger = logging.getLogger(__name__)
+
+# ManyToManyの区切り文字 (PokemonCardResource の ManyToManyWidget と同じ)
+SEPARATOR = '|'
+
+# 列名 → (モデルの項目名, 種別, 参照先のモデル)
+COLUMNS = {
+    '名前': ('name', 'text', None),
+    '枚数': ('quantity', 'int', None),
+    'カテゴリ': ('category', 'fk', CardCategory),
+    'HP': ('hp', 'int', None),
+    'にげる': ('retreat_cost', 'int', None),
+    '進化元': ('evolves_from', 'text', None),
+    '進化段階': ('evolution_stage', 'fk', EvolutionStage),
+    'トレーナーズ種別': ('trainer_type', 'fk', TrainerType),
+    'タイプ': ('types', 'm2m', Type),
+    '弱点': ('weakness', 'm2m', Type),
+    '抵抗力': ('resistance', 'm2m', Type),
+    '特別な分類_ポケモン': ('special_features', 'm2m', SpecialFeature),
+    'わざのエネルギータイプ': ('move_types', 'm2m', MoveType),
+    '特別な分類_トレーナーズ': ('special_trainers', 'm2m', SpecialTrainer),
+    'メモ': ('memo', 'text', None),
+}
+
+# 表示するエラーの最大件数
+MAX_ERROR_MESSAGES = 5
+
+# 数値の項目・id の上限 (PostgreSQL の integer の最大値)
+MAX_INT = 2147483647
+
+
+class RowError(Exception):
+    """行の内容に問題がある場合のエラー"""
+
+
+@dataclass
+class CsvImportResult:
+    total_rows: int = 0
+    new_count: int = 0
+    update_count: int = 0
+    skip_count: int = 0
+    error_count: int = 0
+    # 先頭から MAX_ERROR_MESSAGES 件までの「カード名: エラー内容」
+    error_messages: list = field(default_factory=list)
+
+    @property
+    def has_errors(self) -> bool:
+        return self.error_count > 0
+
+
+def _to_int(raw: str, label: str, minimum: int) -> int:
+    """
+    CSVの値を整数に変換する (「3.0」などの小数点以下が0の値は許可する)
+
+    Raises:
+        RowError: 数値でない・整数でない・範囲外の場合
+    """
+    try:
+        number = Decimal(raw)
+    except InvalidOperation:
+        raise RowError(f"{label}「{raw}」は数値ではありません")
+    if not number.is_finite() or number != number.to_integral_value():
+        raise RowError(f"{label}「{raw}」は整数で指定してください")
+    value = int(number)
+    if value < minimum or value > MAX_INT:
+        raise RowError(f"{label}「{raw}」は{minimum}以上{MAX_INT}以下で指定してください")
+    return value
+
+
+class CardCsvImporter:
+    """
+    CSV (tablib.Dataset) をカードとして取り込むクラス
+
+    Usage:
+        result = CardCsvImporter().import_dataset(dataset)
+    """
+
+    def __init__(self):
+        # 参照先のモデルごとの {名前: ID}
+        self._lookups = {}
+
+    def import_dataset(self, dataset) -> CsvImportResult:
+        return self.import_rows(list(dataset.headers or []), list(dataset))
+
+    def import_rows(self, headers: list, rows: list) -> CsvImportResult:
+        """
+        ヘッダーと行 (値のリスト) を取り込む
+
+        大きなCSVをチャンクごとに取り込む場合は、同じインスタンスで繰り返し呼び出します (マスタの読み込みは1回のみ)。
+        """
+        rows = [dict(zip(headers, row)) for row in rows]
+        columns = {column: spec for column, spec in COLUMNS.items() if column in headers}
+        result = CsvImportResult(total_rows=len(rows))
+
+        existing = self._load_existing(rows, columns)
+        creates, updates = [], []
+        seen_ids = set()
+        for row in rows:
+            try:
+                card_id = self._parse_id(row.get('id'))
+                self._check_duplicate_id(card_id, seen_ids)
+                values, relations = self._parse_row(row, columns)
+                current = existing.get(card_id)
+                if current is None:
+                    creates.append(self._build_card(card_id, values, relations))
+                else:
+                    card, current_relations = current
+                    changed_fields, changed_relations = self._diff(card, values, current_relations, relations)
+                    if not changed_fields and not changed_relations:
+                        result.skip_count += 1
+                        continue
+                    for name in changed_fields:
+                        setattr(card, name, values[name])
+                    updates.append((card, changed_fields, changed_relations))
+            except RowError as e:
+                self._add_error(result, row, headers, e)
+
+        if result.has_errors:
+            # 1件でもエラーがある場合は何も保存しない
+            result.skip_count = 0
+            return result
+
+        with transaction.atomic():
+            self._apply(creates, updates, columns)
+        if creates or updates:
+            notify_cards_changed()
+        result.new_count = len(creates)
+        result.update_count = len(updates)
+        return result
+
+    def validate_rows(self, headers: list, rows: list) -> CsvImportResult:
+        """保存せずに、各行の値 (数値・マスタの名前など) の形式のみを検査する"""
+        rows = [dict(zip(headers, row)) for row in rows]
+        columns = {column: spec for column, spec in COLUMNS.items() if column in headers}
+        result = CsvImportResult(total_rows=len(rows))
+        seen_ids = set()
+        for row in rows:
+            try:
+                self._check_duplicate_id(self._parse_id(row.get('id')), seen_ids)
+                self._parse_row(row, columns)
+            except RowError as e:
+                self._add_error(result, row, headers, e)
+        return result
+
+    @staticmethod
+    def _check_duplicate_id(card_id, seen_ids: set):
+        """同じ id の行が複数ある場合はエラーにする (新規登録では id が重複して保存できないため)"""
+        if card_id is None:
+            return
+        if card_id in seen_ids:
+            raise RowError(f"id「{card_id}」の行が複数あります")
+        seen_ids.add(card_id)
+
+    def _add_error(self, result: CsvImportResult, row: dict, headers: list, error: RowError):
+        result.error_count += 1
+        if len(result.error_messages) < MAX_ERROR_MESSAGES:
+            result.error_messages.append(f"{self._display_name(row, headers)}: {error}")
+
+    def _load_existing(self, rows, columns) -> dict:
+        """CSVに含まれる id の既存カードと、現在のManyToManyのIDをまとめて取得する"""
+        ids = set()
+        for row in rows:
+            try:
+                card_id = self._parse_id(row.get('id'))
+            except RowError:
+                continue
+            if card_id is not None:
+                ids.add(card_id)
+        if not ids:
+            return {}
+
+        cards = PokemonCard.objects.in_bulk(ids)
+        relations = {card_id: {} for card_id in cards}
+        for attribute, kind, _ in columns.values():
+            if kind != 'm2m':
+                continue
+            for card_id in cards:
+                relations[card_id][attribute] = set()
+            through, source_column, target_column = self._through(attribute)
+            for card_id, target_id in through.objects.filter(
+                **{f'{source_column}__in': cards.keys()}
+            ).values_list(source_column, target_column):
+                relations[card_id][attribute].add(target_id)
+        return {card_id: (card, relations[card_id]) for card_id, card in cards.items()}
+
+    def _parse_row(self, row: dict, columns: dict):
+        """1行分の値をモデルの値に変換する (ManyToManyは別に返す)"""
+        values, relations = {}, {}
+        for column, (attribute, kind, model) in columns.items():
+            text = '' if row.get(column) is None else str(row[column])
+            raw = text.strip()
+            if kind == 'text':
+                model_field = PokemonCard._meta.get_field(attribute)
+                if model_field.max_length is not None and len(text) > model_field.max_length:
+                    raise RowError(f"{model_field.verbose_name}は{model_field.max_length}文字以内で指定してください")
+                # 未設定を許可する項目 (進化元・メモ) の空欄は未設定として扱う
+                values[attribute] = None if model_field.null and raw == '' else text
+            elif kind == 'int':
+                values[attribute] = self._parse_int(attribute, raw)
+            elif kind == 'fk':
+                if raw == '':
+                    if attribute == 'category':
+                        raise RowError("カテゴリがありません")
+                    values[f'{attribute}_id'] = None
+                else:
+                    target_id = self._lookup(model).get(raw)
+                    if target_id is None:
+                        raise RowError(f"{model._meta.verbose_name}「{raw}」が見つかりません")
+                    values[f'{attribute}_id'] = target_id
+            else:
+                # 登録されていない名前は無視する (従来のインポートと同じ)
+                names = [name.strip() for name in raw.split(SEPARATOR) if name.strip()]
+                lookup = self._lookup(model)
+                relations[attribute] = {lookup[name] for name in names if name in lookup}
+        return values, relations
+
+    def _parse_int(self, attribute: str, raw: str):
+        if raw == '':
+            # 枚数の空欄は1枚、HP・にげるの空欄は未設定として扱う
+            return 1 if attribute == 'quantity' else None
+        label = PokemonCard._meta.get_field(attribute).verbose_name
+        return _to_int(raw, label, minimum=0)
+
+    @staticmethod
+    def _parse_id(raw):
+        if raw is None or str(raw).strip() == '':
+            return None
+        return _to_int(str(raw).strip(), 'id', minimum=1)
+
+    def _build_card(self, card_id, values: dict, relations: dict) -> PokemonCard:
+        if 'category_id' not in values:
+            raise RowError("カテゴリがありません")
+        card = PokemonCard(**values)
+        if card_id is not None:
+            card.pk = card_id
+        card._csv_relations = relations
+        return card
+
+    @staticmethod
+    def _diff(card, values: dict, current_relations: dict, relations: dict):
+        """変更された項目と、変更されたManyToManyの項目を返す"""
+        changed_fields = [name for name, value in values.items() if getattr(card, name) != value]
+        changed_relations = {
+            attribute: ids for attribute, ids in relations.items() if ids != current_relations.get(attribute)
+        }
+        return changed_fields, changed_relations
+
+    def _apply(self, creates: list, updates: list, columns: dict):
+        """新規登録・更新・ManyToManyの変更をまとめて反映する"""
+        # bulk_create / bulk_update では save() が呼ばれないため、検索用のカード名もここで設定する
+        for card in creates:
+            card.name_normalized = normalize_card_name(card.name)
+        for card, changed_fields, _ in updates:
+            if 'name' in changed_fields:
+                card.name_normalized = normalize_card_name(card.name)
+                changed_fields.append('name_normalized')
+
+        if creates:
+            has_explicit_ids = any(card.pk is not None for card in creates)
+            PokemonCard.objects.bulk_create(creates, batch_size=500)
+            if has_explicit_ids:
+                self._reset_sequence()
+
+        # 更新する項目の組み合わせごとにまとめて更新する (bulk_update では auto_now が反映されないため更新日時も設定する)
+        # ManyToManyのみが変更されたカードも、表示部品のキャッシュ (cards.fragment_cache) を作り直すため更新日時を更新する
+        now = timezone.now()
+        by_fields = {}
+        for card, changed_fields, _ in updates:
+            card.updated_at = now
+            by_fields.setdefault(tuple(sorted(changed_fields)), []).append(card)
+        for fields, cards in by_fields.items():
+            PokemonCard.objects.bulk_update(cards, list(fields) + ['updated_at'], batch_size=500)
+
+        for attribute, kind, _ in columns.values():
+            if kind != 'm2m':
+                continue
+            through, source_column, target_column = self._through(attribute)
+            changed = {card.pk: relations[attribute] for card, _, relations in updates if attribute in relations}
+            if changed:
+                through.objects.filter(**{f'{source_column}__in': changed.keys()}).delete()
+            rows = [
+                through(**{source_column: card_id, target_column: target_id})
+                for card_id, ids in changed.items() for target_id in ids
+            ]
+            rows += [
+                through(**{source_column: card.pk, target_column: target_id})
+                for card in creates for target_id in card._csv_relations.get(attribute, ())
+            ]
+            if rows:
+                through.objects.bulk_create(rows, batch_size=1000)
+
+        # bulk_create / bulk_update ではシグナルが発生しないため、検索用ドキュメント・コレクションの集計もここで反映する
+        sync_documents(
+            [card.pk for card in creates] + [card.pk for card, _, relations in updates if relations]
+        )
+        refresh_aggregates([card.pk for card in creates] + [card.pk for card, _, _ in updates])
+
+    @staticmethod
+    def _reset_sequence():
+        """id を指定して登録した場合に、以降の自動採番と重複しないよう連番を進める (PostgreSQL)"""
+        statements = connection.ops.sequence_reset_sql(no_style(), [PokemonCard])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    @staticmethod
+    def _through(attribute: str):
+        m2m_field = PokemonCard._meta.get_field(attribute)
+        return (
+            m2m_field.remote_field.through,
+            f'{m2m_field.m2m_field_name()}_id',
+            f'{m2m_field.m2m_reverse_field_name()}_id',
+        )
+
+    def _lookup(self, model) -> dict:
+        if model not in self._lookups:
+            self._lookups[model] = {name: obj.pk for name, obj in get_master_data().by_name(model).items()}
+        return self._lookups[model]
+
+    @staticmethod
+    def _display_name(row: dict, headers: list) -> str:
+        """エラー表示用の行の名前 (「名前」列、なければ先頭の列)"""
+        if '名前' in row:
+            return row['名前'] or "名称不明"
+        if headers:
+            return row.get(headers[0]) or "名称不明"
+        return "名称不明"
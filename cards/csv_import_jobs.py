@@ -0,0 +1,392 @@
+"""
+CSVインポートのジョブ (CsvImportJob) の処理モジュール
+
+アップロードされたCSVはファイルとして保存し、ワーカー (run_csv_import_worker コマンド) が
+先頭から chunk_size 行ずつ読み込んで取り込みます。CSV全体をメモリ上に読み込むことはありません。
+
+- atomic 方式: 全行を検査して一時テーブル (CsvImportStagingRow) に保存した後、
+  1つのトランザクションで取り込みます。1件でもエラーがあれば何も保存しません (従来と同じ)
+- chunked 方式: チャンクごとに取り込んで確定します。エラーのあったチャンクの手前までが保存されます
+
+チャンクの処理結果と処理済みの行数 (チェックポイント) は同じトランザクションで保存するため、
+ワーカーが途中で停止した場合や失敗したジョブを再開した場合は、チェックポイントの続きから処理します。
+
+取り込み中のトランザクションではジョブの行をロックします。atomic 方式の取り込みは1つのトランザクションで行うため、
+取り込み中は updated_at が更新されませんが、ロック中のジョブは requeue_stale_jobs で再実行されません。
+"""
+
+import csv
+import itertools
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .csv_import import MAX_ERROR_MESSAGES, CardCsvImporter, CsvImportResult
+from .models import CsvImportJob, CsvImportStagingRow
+
+logger = logging.getLogger(__name__)
+
+# atomic 方式の取り込み中の進捗 (取り込み中はトランザクションが確定しないため、キャッシュで共有する)
+PROGRESS_CACHE_KEY = 'cards:csv_import:{job_id}:progress'
+
+
+class CsvImportAborted(Exception):
+    """atomic 方式の取り込み中にエラーのある行が見つかった場合のエラー (トランザクションを取り消すため)"""
+
+    def __init__(self, result: CsvImportResult):
+        super().__init__("CSVにエラーがあります")
+        self.result = result
+
+
+def save_uploaded_csv(csv_file) -> str:
+    """
+    アップロードされたCSVをインポート用ディレクトリに保存する (チャンクごとに書き込む)
+
+    Returns:
+        str: 保存先の絶対パス
+    """
+    save_dir = os.path.join(settings.MEDIA_ROOT, 'csv_import')
+    os.makedirs(save_dir, exist_ok=True)
+    path = os.path.join(save_dir, f'{uuid.uuid4().hex}.csv')
+    with open(path, 'wb') as f:
+        for chunk in csv_file.chunks():
+            f.write(chunk)
+    return path
+
+
+def enqueue_csv_import_job(csv_file, mode: str = CsvImportJob.MODE_ATOMIC) -> CsvImportJob:
+    """CSVを保存し、インポートジョブをキューに登録する"""
+    job = CsvImportJob.objects.create(
+        file_path=save_uploaded_csv(csv_file),
+        original_name=os.path.basename(csv_file.name or '')[:255],
+        mode=mode,
+        chunk_size=max(1, settings.CSV_IMPORT_CHUNK_SIZE),
+    )
+    logger.info(f"CSV import job queued: {job.pk} ({job.original_name}, {job.get_mode_display()})")
+    return job
+
+
+def claim_next_job():
+    """
+    待機中のジョブを1件取得し、取り込み中に変更する
+
+    状態の更新は「待機中であること」を条件とした1文のUPDATEで行うため、
+    複数のワーカーが同時に動いていても同じジョブを二重に処理しません。
+
+    Returns:
+        CsvImportJob | None: 取得したジョブ (待機中のジョブがない場合は None)
+    """
+    candidates = CsvImportJob.objects.filter(
+        status=CsvImportJob.STATUS_PENDING
+    ).order_by('created_at').values_list('pk', flat=True)[:5]
+
+    for job_id in candidates:
+        if claim_job(job_id):
+            return CsvImportJob.objects.get(pk=job_id)
+    return None
+
+
+def claim_job(job_id) -> bool:
+    """指定したジョブが待機中であれば取り込み中に変更する (同期実行用)"""
+    return bool(CsvImportJob.objects.filter(
+        pk=job_id, status=CsvImportJob.STATUS_PENDING
+    ).update(
+        status=CsvImportJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now(),
+    ))
+
+
+def process_job(job: CsvImportJob):
+    """ジョブをチェックポイントの続きから実行し、結果または失敗理由を保存する"""
+    try:
+        if job.total_rows is None:
+            _prepare(job)
+        if job.mode == CsvImportJob.MODE_ATOMIC:
+            _process_atomic(job)
+        else:
+            _process_chunked(job)
+    except FileNotFoundError:
+        _fail_job(job, "アップロードされたファイルが見つかりません。再度インポートしてください。")
+    except UnicodeDecodeError:
+        _fail_job(job, "CSVファイルの文字コードはUTF-8にしてください。")
+        _remove_file(job)
+    except csv.Error as e:
+        _fail_job(job, f"CSVファイルの形式が正しくありません: {e}")
+        _remove_file(job)
+    except (DataError, IntegrityError) as e:
+        # データベースが受け付けない値がある場合は、同じファイルで再開しても成功しないため再開できなくする
+        logger.error(f"CSV import job {job.pk} failed: {e}", exc_info=True)
+        job.staging_rows.all().delete()
+        _fail_job(job, f"データベースに保存できない値があります: {str(e)}")
+        _remove_file(job)
+    except Exception as e:
+        logger.error(f"CSV import job {job.pk} failed: {e}", exc_info=True)
+        _fail_job(job, f"エラーが発生しました: {str(e)}")
+
+
+def _prepare(job: CsvImportJob):
+    """ヘッダーと全行数 (進捗表示用) を求める"""
+    headers, total = [], 0
+    with open(job.file_path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        headers = next(reader, [])
+        for row in reader:
+            if row:
+                total += 1
+    CsvImportJob.objects.filter(pk=job.pk).update(headers=headers, total_rows=total, updated_at=timezone.now())
+    job.headers, job.total_rows = headers, total
+
+
+def _iter_chunks(job: CsvImportJob, start: int):
+    """
+    CSVの start 行目 (0始まり・ヘッダーを除く) 以降を chunk_size 行ずつ返す
+
+    空の行は読み飛ばし、列が足りない行は空欄で補う (tablib でのCSVの読み込みと同じ)。
+
+    Yields:
+        tuple[int, list]: (チャンクの先頭の行番号, 行のリスト)
+    """
+    width = len(job.headers)
+    with open(job.file_path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        rows = (row + [''] * (width - len(row)) for row in reader if row)
+        rows = itertools.islice(rows, start, None)
+        offset = start
+        while True:
+            chunk = list(itertools.islice(rows, job.chunk_size))
+            if not chunk:
+                return
+            yield offset, chunk
+            offset += len(chunk)
+
+
+def _process_chunked(job: CsvImportJob):
+    """チャンクごとに取り込み、取り込み結果とチェックポイントを同じトランザクションで保存する"""
+    CsvImportJob.objects.filter(pk=job.pk).update(stage=CsvImportJob.STAGE_IMPORTING, updated_at=timezone.now())
+    importer = CardCsvImporter()
+    for offset, rows in _iter_chunks(job, job.processed_rows):
+        with transaction.atomic():
+            _lock_job(job)
+            result = importer.import_rows(job.headers, rows)
+            if result.has_errors:
+                # エラーのあるチャンクは保存されないため、チェックポイントは進めない
+                _fail_with_row_errors(job, result)
+                return
+            CsvImportJob.objects.filter(pk=job.pk).update(
+                processed_rows=offset + len(rows),
+                new_count=F('new_count') + result.new_count,
+                update_count=F('update_count') + result.update_count,
+                skip_count=F('skip_count') + result.skip_count,
+                updated_at=timezone.now(),
+            )
+        logger.info(f"CSV import job {job.pk}: {offset + len(rows)}/{job.total_rows} rows")
+    _finish_job(job)
+
+
+def _process_atomic(job: CsvImportJob):
+    """全行を検査して一時テーブルに保存した後、1つのトランザクションで取り込む"""
+    if job.stage != CsvImportJob.STAGE_IMPORTING:
+        _validate_and_stage(job)
+        job.refresh_from_db()
+        if job.error_count:
+            # 従来と同じく、1件でもエラーがあれば何も取り込まない
+            job.staging_rows.all().delete()
+            _fail_job(job, '')
+            _remove_file(job)
+            return
+        CsvImportJob.objects.filter(pk=job.pk).update(stage=CsvImportJob.STAGE_IMPORTING, updated_at=timezone.now())
+
+    # 取り込みは一時テーブルから行う (途中で失敗した場合はすべて取り消されるため、再開時も先頭から)
+    importer = CardCsvImporter()
+    result = CsvImportResult()
+    progress_key = PROGRESS_CACHE_KEY.format(job_id=job.pk)
+    try:
+        with transaction.atomic():
+            _lock_job(job)
+            for offset, rows in _iter_staged_chunks(job):
+                chunk_result = importer.import_rows(job.headers, rows)
+                if chunk_result.has_errors:
+                    raise CsvImportAborted(chunk_result)
+                result.new_count += chunk_result.new_count
+                result.update_count += chunk_result.update_count
+                result.skip_count += chunk_result.skip_count
+                cache.set(progress_key, offset + len(rows), timeout=3600)
+            CsvImportJob.objects.filter(pk=job.pk).update(
+                processed_rows=job.total_rows,
+                new_count=result.new_count,
+                update_count=result.update_count,
+                skip_count=result.skip_count,
+                updated_at=timezone.now(),
+            )
+            job.staging_rows.all().delete()
+    except CsvImportAborted as e:
+        job.staging_rows.all().delete()
+        _fail_with_row_errors(job, e.result)
+        return
+    finally:
+        cache.delete(progress_key)
+    _finish_job(job)
+
+
+def _lock_job(job: CsvImportJob):
+    """トランザクションの終了までジョブの行をロックする (取り込み中のジョブを requeue_stale_jobs で再実行しないため)"""
+    list(CsvImportJob.objects.select_for_update().filter(pk=job.pk).values_list('pk', flat=True))
+
+
+def _validate_and_stage(job: CsvImportJob):
+    """チャンクごとに各行を検査して一時テーブルに保存し、チェックポイントとエラーの件数を記録する"""
+    CsvImportJob.objects.filter(pk=job.pk).update(stage=CsvImportJob.STAGE_VALIDATING, updated_at=timezone.now())
+    importer = CardCsvImporter()
+    error_messages = list(job.error_messages)
+    for offset, rows in _iter_chunks(job, job.processed_rows):
+        result = importer.validate_rows(job.headers, rows)
+        error_messages = (error_messages + result.error_messages)[:MAX_ERROR_MESSAGES]
+        with transaction.atomic():
+            CsvImportStagingRow.objects.bulk_create(
+                [
+                    CsvImportStagingRow(job_id=job.pk, row_number=offset + i, values=row)
+                    for i, row in enumerate(rows)
+                ],
+                batch_size=1000,
+            )
+            CsvImportJob.objects.filter(pk=job.pk).update(
+                processed_rows=offset + len(rows),
+                error_count=F('error_count') + result.error_count,
+                error_messages=error_messages,
+                updated_at=timezone.now(),
+            )
+
+
+def _iter_staged_chunks(job: CsvImportJob):
+    """一時テーブルの行を行番号順に chunk_size 行ずつ返す"""
+    last = -1
+    while True:
+        chunk = list(
+            job.staging_rows.filter(row_number__gt=last).order_by('row_number').values_list('row_number', 'values')[:job.chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk[0][0], [values for _, values in chunk]
+        last = chunk[-1][0]
+
+
+def _fail_with_row_errors(job: CsvImportJob, result: CsvImportResult):
+    """エラーのある行が見つかったチャンクの内容を記録して、ジョブを失敗にする"""
+    CsvImportJob.objects.filter(pk=job.pk).update(
+        error_count=F('error_count') + result.error_count,
+        error_messages=result.error_messages,
+    )
+    _fail_job(job, '')
+    _remove_file(job)
+
+
+def _finish_job(job: CsvImportJob):
+    CsvImportJob.objects.filter(pk=job.pk).update(
+        status=CsvImportJob.STATUS_DONE,
+        error_message='',
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    _remove_file(job)
+    logger.info(f"CSV import job {job.pk} done")
+
+
+def _fail_job(job: CsvImportJob, message: str):
+    CsvImportJob.objects.filter(pk=job.pk).update(
+        status=CsvImportJob.STATUS_FAILED,
+        error_message=message,
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+def _remove_file(job: CsvImportJob):
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+
+
+def can_resume(job: CsvImportJob) -> bool:
+    """
+    ジョブを再開できるかどうか
+
+    エラーのある行が原因で失敗したジョブは、同じファイルでは成功しないため再開できません。
+    (データベースが受け付けない値が原因で失敗したジョブは、アップロードファイルを削除しているため再開できません)
+    """
+    return (
+        job.status == CsvImportJob.STATUS_FAILED
+        and job.error_count == 0
+        and os.path.exists(job.file_path)
+    )
+
+
+def resume_job(job: CsvImportJob) -> bool:
+    """失敗したジョブを待機中に戻す (チェックポイントは維持する)"""
+    if not can_resume(job):
+        return False
+    return bool(CsvImportJob.objects.filter(pk=job.pk, status=CsvImportJob.STATUS_FAILED).update(
+        status=CsvImportJob.STATUS_PENDING,
+        error_message='',
+        attempts=0,
+        finished_at=None,
+        updated_at=timezone.now(),
+    ))
+
+
+def get_processed_rows(job: CsvImportJob) -> int:
+    """進捗表示用の処理済み行数 (atomic 方式の取り込み中はキャッシュから取得する)"""
+    if job.mode == CsvImportJob.MODE_ATOMIC and job.stage == CsvImportJob.STAGE_IMPORTING and not job.is_finished:
+        return cache.get(PROGRESS_CACHE_KEY.format(job_id=job.pk), 0)
+    return job.processed_rows
+
+
+def requeue_stale_jobs(stale_seconds: int, max_attempts: int = 3) -> int:
+    """
+    ワーカーの強制終了などで取り込み中のまま残ったジョブを待機中に戻す
+
+    チェックポイントは維持するため、再実行時は続きから処理します。
+    試行回数が上限に達したジョブは失敗扱いにします (画面から再開できます)。
+    取り込み中のトランザクションがジョブの行をロックしている場合 (ワーカーが処理中) は対象にしません。
+    """
+    threshold = timezone.now() - timedelta(seconds=stale_seconds)
+    with transaction.atomic():
+        stale_ids = list(
+            CsvImportJob.objects.select_for_update(skip_locked=True).filter(
+                status=CsvImportJob.STATUS_RUNNING, updated_at__lt=threshold,
+            ).values_list('pk', flat=True)
+        )
+        stale = CsvImportJob.objects.filter(pk__in=stale_ids)
+
+        stale.filter(attempts__gte=max_attempts).update(
+            status=CsvImportJob.STATUS_FAILED,
+            error_message='インポートが時間内に完了しませんでした。',
+            finished_at=timezone.now(),
+        )
+        return stale.filter(attempts__lt=max_attempts).update(
+            status=CsvImportJob.STATUS_PENDING,
+            updated_at=timezone.now(),
+        )
+
+
+def delete_old_jobs(keep_days: int) -> int:
+    """終了から一定期間が経過したジョブと、そのアップロードファイルを削除する"""
+    threshold = timezone.now() - timedelta(days=keep_days)
+    old_jobs = CsvImportJob.objects.filter(
+        status__in=[CsvImportJob.STATUS_DONE, CsvImportJob.STATUS_FAILED],
+        finished_at__lt=threshold,
+    )
+    for job in old_jobs.only('pk', 'file_path'):
+        _remove_file(job)
+    _, deleted = old_jobs.delete()
+    return deleted.get(CsvImportJob._meta.label, 0)
@@ -3,6 +3,7 @@ from .models import (
     SpecialFeature, SpecialTrainer, MoveType
 )
 from django.db.models import Q
+from .master_data import get_master_data
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,28 +25,18 @@ class CardDataMapper:
         self._load_master_data()
 
     def _load_master_data(self):
-        """マスタデータをメモリにロードする"""
-        for obj in CardCategory.objects.all():
+        """マスタデータを読み込む (プロセス内のキャッシュ cards.master_data から参照する)"""
+        master = get_master_data()
+        for obj in master.all(CardCategory):
             self._categories[obj.name] = obj
             self._categories[obj.slug] = obj # slugでも引けるように
 
-        for obj in Type.objects.all():
-            self._types[obj.name] = obj
-
-        for obj in EvolutionStage.objects.all():
-            self._evolution_stages[obj.name] = obj
-
-        for obj in TrainerType.objects.all():
-            self._trainer_types[obj.name] = obj
-            
-        for obj in SpecialFeature.objects.all():
-            self._special_features[obj.name] = obj
-            
-        for obj in SpecialTrainer.objects.all():
-            self._special_trainers[obj.name] = obj
-            
-        for obj in MoveType.objects.all():
-            self._move_types[obj.name] = obj
+        self._types = dict(master.by_name(Type))
+        self._evolution_stages = dict(master.by_name(EvolutionStage))
+        self._trainer_types = dict(master.by_name(TrainerType))
+        self._special_features = dict(master.by_name(SpecialFeature))
+        self._special_trainers = dict(master.by_name(SpecialTrainer))
+        self._move_types = dict(master.by_name(MoveType))
 
     def map_item(self, raw_item: dict) -> dict:
         """
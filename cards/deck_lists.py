@@ -0,0 +1,271 @@
+"""
+デッキリストのまとめて取り込み
+
+大会の上位デッキの一覧など、複数のデッキリストを貼り付けたテキストを1つずつのデッキリストに分け、
+所持しているカードで組めるか (登録されていないカード・不足している枚数) をまとめて確認します。
+
+テキストの形式:
+- カードの行は cards.decks.parse_deck_line と同じ形式 (「4 ピカチュウex」「ピカチュウex ×4」など)
+- 「ポケモン (15)」「グッズ:」などの区分の見出しは読み飛ばす
+- カードの行でも区分の見出しでもない行はデッキ名とし、その行から次のデッキリストを始める
+  (カードを読み込み中のデッキリストが60枚に満たない場合は、読み取れない行としてエラーにする)
+- 「---」「===」などの区切り線、または60枚以上読み込んだ後の空行でデッキリストを区切る
+- 読み取れない行や保存できないカード (カード名が長すぎる・枚数が多すぎる) があるデッキリストは保存しない
+
+カード名は normalize_card_name で正規化した名前 (カード検索と同じ、ひらがな/カタカナ・全角/半角の揺らぎを吸収した名前) で
+所持しているカードと対応付けます。全デッキリストのカード名を1回のクエリでまとめて解決し、
+解決結果はカードデータのバージョンごとにプロセス内に保持します (NameResolver)。
+同じカード名が何百回出てきても、2回目以降はクエリを実行しません。
+
+Usage:
+    importer = DeckListImporter()
+    deck_lists = importer.parse(text)
+    importer.check(deck_lists)          # deck_list.check に DeckCheck を設定する
+    importer.save(deck_lists)           # デッキとして保存する
+"""
+
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .cache_versions import get_cards_version
+from .decks import (
+    DECK_SIZE, CollectionIndex, add_entry, check_entries, entry_error, load_owned_cards, parse_deck_line,
+)
+from .models import Deck, DeckEntry
+from .query_builder import normalize_card_name
+
+# 一度に取り込めるデッキリストの数
+MAX_LISTS = 1000
+
+# 名前の解決結果を保持する上限 (超えた場合は消去して読み直す)
+MAX_CACHED_NAMES = 20000
+
+# 区分の見出し (例: ポケモン (15) / グッズ: / Trainer - 30)
+SECTION_PATTERN = re.compile(
+    r'^(?:ポケモン|トレーナーズ|グッズ|ポケモンのどうぐ|サポート|スタジアム|(?:基本)?エネルギー|特殊エネルギー'
+    r'|pok[eé]mon|trainers?|energy)\s*(?:[:：\-]\s*)?(?:[(（]\s*\d+\s*枚?\s*[)）]|\d+\s*枚?)?\s*[:：]?$',
+    re.IGNORECASE,
+)
+
+# 区切り線 (例: --- / ===== / ＊＊＊)
+SEPARATOR_PATTERN = re.compile(r'^[-=_*~]{3,}$')
+
+
+@dataclass
+class DeckListResult:
+    """取り込んだデッキリスト1件"""
+    name: str
+    # [(カード名, 枚数)]
+    entries: list = field(default_factory=list)
+    # 読み取れなかった行のエラーメッセージ
+    errors: list = field(default_factory=list)
+    # 所持しているカードとの確認結果 (DeckListImporter.check で設定する)
+    check: object = None
+
+    @property
+    def is_savable(self) -> bool:
+        """デッキとして保存できるか (読み取れない行や保存できないカードがない)"""
+        return not self.errors
+
+    @property
+    def total(self) -> int:
+        return sum(quantity for _, quantity in self.entries)
+
+    @property
+    def missing(self) -> list:
+        """1枚も登録されていないカード (基本エネルギーを除く)"""
+        if self.check is None:
+            return []
+        return [card for card in self.check.cards if not card.owned and not card.is_basic_energy]
+
+    @property
+    def short(self) -> list:
+        """登録されているが枚数が足りないカード"""
+        if self.check is None:
+            return []
+        return [card for card in self.check.cards if card.owned and card.shortage]
+
+
+class NameResolver:
+    """
+    正規化したカード名から所持しているカード (cards.decks.OwnedCard) への解決結果を保持する
+
+    解決していない名前だけを1回のクエリでまとめて読み込み、登録されていない名前も「なし」として保持します。
+    カードデータのバージョンごとに作り直すため、カードが変更されると以降は新しい解決結果が使われます。
+    """
+
+    def __init__(self, version: str):
+        self.version = version
+        # {正規化したカード名: OwnedCard または None (登録されていない)}
+        self._owned_cards = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, names) -> dict:
+        """
+        カード名 (正規化済み) を所持しているカードに解決する
+
+        Returns:
+            dict: {正規化したカード名: OwnedCard} (登録されていない名前は含まない)
+        """
+        names = set(names)
+        with self._lock:
+            resolved = {name: self._owned_cards[name] for name in names if name in self._owned_cards}
+        unresolved = names - resolved.keys()
+        if unresolved:
+            owned_cards = load_owned_cards(unresolved)
+            loaded = {name: owned_cards.get(name) for name in unresolved}
+            resolved.update(loaded)
+            with self._lock:
+                if len(self._owned_cards) + len(loaded) > MAX_CACHED_NAMES:
+                    self._owned_cards.clear()
+                self._owned_cards.update(loaded)
+        return {name: owned_card for name, owned_card in resolved.items() if owned_card is not None}
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def get_name_resolver() -> NameResolver:
+    """現在の名前の解決結果を返す (カードデータのバージョンが変わっていれば作り直す)"""
+    global _current
+    version = get_cards_version()
+    current = _current
+    if current is not None and current.version == version:
+        return current
+    with _lock:
+        if _current is None or _current.version != version:
+            _current = NameResolver(version)
+        return _current
+
+
+def split_deck_lists(text: str) -> list:
+    """
+    テキストをデッキリストに分け、カードの行を読み込む
+
+    Returns:
+        list: DeckListResult のリスト (カードが1枚もないデッキリストは含まない)
+    """
+    deck_lists = []
+    name = None
+    entries = {}
+    errors = []
+
+    def close():
+        nonlocal name, entries, errors
+        # 同じ名前の行の枚数を合計した後の上限
+        for entry_name, quantity in entries.values():
+            if quantity > DECK_SIZE:
+                errors.append(entry_error(entry_name, quantity))
+        if entries:
+            deck_lists.append(DeckListResult(
+                name=name or f"デッキ{len(deck_lists) + 1}", entries=list(entries.values()), errors=errors,
+            ))
+        name, entries, errors = None, {}, []
+
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        # 全角の数字・記号・空白を半角にする
+        line = unicodedata.normalize('NFKC', line).strip()
+        total = sum(quantity for _, quantity in entries.values())
+        if not line:
+            if total >= DECK_SIZE:
+                close()
+            continue
+        if SEPARATOR_PATTERN.match(line):
+            close()
+            continue
+        if SECTION_PATTERN.match(line):
+            continue
+
+        parsed = parse_deck_line(line)
+        # 60枚を超える枚数はカードの行ではない (デッキ名の末尾の年などを枚数と読み違えないため)
+        if parsed is not None and parsed[1] <= DECK_SIZE:
+            error = entry_error(*parsed)
+            if error:
+                errors.append(f"{line_number}行目: {error}")
+            else:
+                add_entry(entries, *parsed)
+            continue
+
+        if entries and total < DECK_SIZE:
+            errors.append(f"{line_number}行目: 「{line}」の枚数とカード名を読み取れません")
+            continue
+        # デッキ名 (カードを読み込む前の行が複数ある場合は最後の行)
+        close()
+        name = line.lstrip('#').strip()[:Deck._meta.get_field('name').max_length] or None
+    close()
+    return deck_lists
+
+
+class DeckListImporter:
+    """複数のデッキリストを読み込み、所持しているカードと照合する"""
+
+    def __init__(self, resolver: NameResolver = None):
+        self.resolver = resolver
+
+    def parse(self, text: str) -> list:
+        """テキストをデッキリスト (DeckListResult) に分ける"""
+        deck_lists = split_deck_lists(text)
+        if len(deck_lists) > MAX_LISTS:
+            raise ValueError(f"一度に取り込めるデッキリストは{MAX_LISTS}件までです ({len(deck_lists)}件)")
+        return deck_lists
+
+    def check(self, deck_lists) -> list:
+        """
+        各デッキリストの確認結果 (DeckCheck) を設定する
+
+        全デッキリストのカード名をまとめて解決し、組んでいるデッキで使用中の枚数も1回のクエリで読み込みます。
+        """
+        names = {normalize_card_name(name) for deck_list in deck_lists for name, _ in deck_list.entries}
+        resolver = self.resolver or get_name_resolver()
+        index = CollectionIndex(names, owned_cards=resolver.resolve(names))
+        for deck_list in deck_lists:
+            deck_list.check = check_entries(deck_list.entries, index=index)
+        return deck_lists
+
+    def save(self, deck_lists, is_allocated: bool = False) -> list:
+        """
+        デッキリストをデッキとして保存する (デッキとカードをそれぞれまとめて登録する)
+
+        保存できないデッキリスト (is_savable が False) は保存しません。
+        """
+        deck_lists = [deck_list for deck_list in deck_lists if deck_list.is_savable]
+        if not deck_lists:
+            return []
+        with transaction.atomic():
+            decks = Deck.objects.bulk_create([
+                Deck(name=deck_list.name, is_allocated=is_allocated) for deck_list in deck_lists
+            ])
+            DeckEntry.objects.bulk_create([
+                # bulk_create では save() が呼ばれないため、正規化したカード名もここで設定する
+                DeckEntry(deck=deck, name=name, name_normalized=normalize_card_name(name), quantity=quantity, position=position)
+                for deck, deck_list in zip(decks, deck_lists)
+                for position, (name, quantity) in enumerate(deck_list.entries)
+            ])
+        return decks
+
+
+def shortage_summary(deck_lists) -> list:
+    """
+    全デッキリストで足りないカードの集計
+
+    Returns:
+        list: [{'name', 'lists' (足りないデッキリストの数), 'shortage' (最大の不足枚数), 'owned'}] (デッキリストの数が多い順)
+    """
+    summary = {}
+    for deck_list in deck_lists:
+        if deck_list.check is None:
+            continue
+        for card in deck_list.check.cards:
+            if not card.shortage:
+                continue
+            row = summary.setdefault(normalize_card_name(card.name), {
+                'name': card.name, 'lists': 0, 'shortage': 0, 'owned': card.owned,
+            })
+            row['lists'] += 1
+            row['shortage'] = max(row['shortage'], card.shortage)
+    return sorted(summary.values(), key=lambda row: (-row['lists'], -row['shortage'], row['name']))
@@ -0,0 +1,306 @@
+"""
+デッキの作成と、所持しているカードで組めるかの確認
+
+デッキのカードは名前 (normalize_card_name で正規化したカード名) で所持しているカードと対応付けます。
+同じ名前のカードが複数登録されている場合 (収録弾違いなど) は、所持枚数を合計します。
+
+確認するルール:
+- デッキの枚数は60枚
+- 同じ名前のカードは4枚まで (基本エネルギーを除く)
+- ACE SPEC のカードはデッキに1枚まで (特別な分類が ACE SPEC のカード)
+- 所持枚数から、「組んでいる」他のデッキで使用中の枚数を差し引いた枚数で足りるか
+  (基本エネルギーはカードとして管理していないため確認しない)
+
+複数のデッキをまとめて確認する場合も、デッキのカード・所持枚数・使用中の枚数をそれぞれ1回のクエリで読み込み、
+カード名ごとの索引 (CollectionIndex) で判定します (デッキやカードごとにクエリを実行しない)。
+
+Usage:
+    checks = check_decks(Deck.objects.all())
+    entries, errors = parse_deck_text("4 ピカチュウex\\n2 ボスの指令")
+    check = check_entries(entries)            # 保存前のデッキ
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
+
+from .master_data import get_master_data
+from .models import DeckEntry, PokemonCard, SpecialTrainer
+from .query_builder import normalize_card_name
+
+DECK_SIZE = 60
+MAX_COPIES = 4
+MAX_ACE_SPEC = 1
+
+# 特別な分類の ACE SPEC のマスタ名
+ACE_SPEC_NAME = 'ACE SPEC'
+
+# 基本エネルギー (正規化したカード名。例: 基本草エネルギー → 基本草えねるぎー)
+BASIC_ENERGY_PATTERN = re.compile(r'^基本.+えねるぎー$')
+
+# デッキリストの1行 (枚数とカード名)
+LINE_PATTERNS = (
+    # 4 ピカチュウex / 4枚 ピカチュウex
+    re.compile(r'^(?P<quantity>\d+)\s*枚?\s+(?P<name>.+)$'),
+    # ピカチュウex ×4 / ピカチュウex x4 (x はカード名の末尾 (ex など) と区別するため空白の後のみ)
+    re.compile(r'^(?P<name>.+?)\s*(?:×|\s[x*])\s*(?P<quantity>\d+)\s*枚?$', re.IGNORECASE),
+    # ピカチュウex 4 / ピカチュウex 4枚
+    re.compile(r'^(?P<name>.+?)\s+(?P<quantity>\d+)\s*枚?$'),
+)
+
+
+@dataclass
+class DeckCardCheck:
+    """デッキの1種類のカードの確認結果"""
+    name: str
+    quantity: int
+    # 所持枚数 (同じ名前のカードの合計)
+    owned: int = 0
+    # 組んでいる他のデッキで使用中の枚数
+    in_use: int = 0
+    is_ace_spec: bool = False
+    is_basic_energy: bool = False
+
+    @property
+    def available(self) -> int:
+        return max(self.owned - self.in_use, 0)
+
+    @property
+    def shortage(self) -> int:
+        if self.is_basic_energy:
+            return 0
+        return max(self.quantity - self.available, 0)
+
+
+@dataclass
+class DeckCheck:
+    """デッキの確認結果"""
+    deck: object = None
+    cards: list = field(default_factory=list)
+    rule_errors: list = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(card.quantity for card in self.cards)
+
+    @property
+    def shortage(self) -> int:
+        return sum(card.shortage for card in self.cards)
+
+    @property
+    def is_buildable(self) -> bool:
+        """ルールを満たし、所持しているカードで組めるか"""
+        return not self.rule_errors and not self.shortage
+
+
+def parse_deck_text(text: str):
+    """
+    デッキリストの文字列を、カード名と枚数のリストに変換する
+
+    1行に1種類ずつ「4 ピカチュウex」「ピカチュウex ×4」「ピカチュウex 4」の形式で記述します。
+    空行と # で始まる行は無視し、同じ名前 (正規化したカード名) の行は枚数を合計します。
+
+    Returns:
+        tuple: ([(カード名, 枚数)], [読み取れなかった行のエラーメッセージ])
+    """
+    entries = {}
+    errors = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        # 全角の数字・記号・空白を半角にする
+        line = unicodedata.normalize('NFKC', line).strip()
+        if not line or line.startswith('#'):
+            continue
+        parsed = parse_deck_line(line)
+        if parsed is None:
+            errors.append(f"{line_number}行目: 「{line}」の枚数とカード名を読み取れません")
+            continue
+        error = entry_error(*parsed)
+        if error:
+            errors.append(f"{line_number}行目: {error}")
+            continue
+        add_entry(entries, *parsed)
+    # 同じ名前の行の枚数を合計した後の上限
+    for name, quantity in entries.values():
+        if quantity > DECK_SIZE:
+            errors.append(entry_error(name, quantity))
+    return list(entries.values()), errors
+
+
+def entry_error(name: str, quantity: int):
+    """デッキのカード (カード名, 枚数) として保存できない場合のエラーメッセージ (保存できる場合は None)"""
+    max_length = DeckEntry._meta.get_field('name').max_length
+    if len(name) > max_length:
+        return f"「{name[:20]}…」のカード名が長すぎます ({max_length}文字まで)"
+    if quantity > DECK_SIZE:
+        return f"「{name}」が{quantity}枚あります (1種類{DECK_SIZE}枚まで)"
+    return None
+
+
+def add_entry(entries: dict, name: str, quantity: int):
+    """{正規化したカード名: (カード名, 枚数)} にカードを追加する (同じ名前の場合は枚数を合計する)"""
+    key = normalize_card_name(name)
+    if key in entries:
+        entries[key] = (entries[key][0], entries[key][1] + quantity)
+    else:
+        entries[key] = (name, quantity)
+
+
+def parse_deck_line(line: str):
+    """デッキリストの1行を (カード名, 枚数) に変換する (読み取れない場合は None)"""
+    for pattern in LINE_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            quantity = int(match.group('quantity'))
+            name = match.group('name').strip()
+            if quantity > 0 and name:
+                return name, quantity
+            return None
+    return None
+
+
+@dataclass
+class OwnedCard:
+    """同じ名前の所持しているカード (収録弾違いなどをまとめたもの)"""
+    name: str
+    card_ids: list = field(default_factory=list)
+    # 所持枚数の合計
+    quantity: int = 0
+    is_ace_spec: bool = False
+
+
+def load_owned_cards(names) -> dict:
+    """
+    正規化したカード名ごとの所持しているカードを1回のクエリで読み込む
+
+    Returns:
+        dict: {正規化したカード名: OwnedCard} (登録されていない名前は含まない)
+    """
+    names = set(names)
+    if not names:
+        return {}
+    ace_spec = get_master_data().by_name(SpecialTrainer).get(ACE_SPEC_NAME)
+    through = PokemonCard.special_trainers.through
+    cards = PokemonCard.objects.filter(name_normalized__in=names).annotate(
+        is_ace_spec=Exists(through.objects.filter(pokemoncard_id=OuterRef('pk'), specialtrainer_id=ace_spec.pk))
+        if ace_spec else Value(False)
+    ).order_by('pk')
+    owned_cards = {}
+    for pk, name, name_normalized, quantity, is_ace_spec in cards.values_list(
+        'pk', 'name', 'name_normalized', 'quantity', 'is_ace_spec',
+    ):
+        owned_card = owned_cards.setdefault(name_normalized, OwnedCard(name=name))
+        owned_card.card_ids.append(pk)
+        owned_card.quantity += quantity
+        owned_card.is_ace_spec = owned_card.is_ace_spec or is_ace_spec
+    return owned_cards
+
+
+class CollectionIndex:
+    """
+    カード名ごとの所持枚数・ACE SPEC か・組んでいるデッキで使用中の枚数の索引
+
+    指定したカード名について、所持しているカードと組んでいるデッキのカードをそれぞれ1回のクエリで読み込みます。
+    所持しているカードを読み込み済みの場合 (cards.deck_lists.NameResolver) は owned_cards に渡します。
+    """
+
+    def __init__(self, names, owned_cards: dict = None):
+        names = set(names)
+        self.owned = defaultdict(int)
+        self.ace_spec = set()
+        # {カード名: {デッキのID: 枚数}}
+        self.allocations = defaultdict(dict)
+        if not names:
+            return
+
+        if owned_cards is None:
+            owned_cards = load_owned_cards(names)
+        for name in names:
+            owned_card = owned_cards.get(name)
+            if owned_card is None:
+                continue
+            self.owned[name] = owned_card.quantity
+            if owned_card.is_ace_spec:
+                self.ace_spec.add(name)
+
+        rows = DeckEntry.objects.filter(deck__is_allocated=True, name_normalized__in=names).values_list(
+            'name_normalized', 'deck_id', 'quantity',
+        )
+        for name, deck_id, quantity in rows:
+            self.allocations[name][deck_id] = quantity
+
+    def in_use(self, name: str, deck_id=None) -> int:
+        """組んでいるデッキ (deck_id のデッキを除く) で使用中の枚数"""
+        return sum(quantity for other_id, quantity in self.allocations.get(name, {}).items() if other_id != deck_id)
+
+
+def check_entries(entries, deck=None, index: CollectionIndex = None) -> DeckCheck:
+    """
+    デッキのカードを確認する
+
+    Args:
+        entries: [(カード名, 枚数)]
+        deck: 保存済みのデッキ (使用中の枚数から、このデッキの分を除く)
+        index: 所持枚数などの索引 (省略した場合は entries のカード名で作成する)
+    """
+    if index is None:
+        index = CollectionIndex(normalize_card_name(name) for name, _ in entries)
+    deck_id = deck.pk if deck is not None else None
+
+    cards = []
+    for name, quantity in entries:
+        key = normalize_card_name(name)
+        cards.append(DeckCardCheck(
+            name=name,
+            quantity=quantity,
+            owned=index.owned.get(key, 0),
+            in_use=index.in_use(key, deck_id),
+            is_ace_spec=key in index.ace_spec,
+            is_basic_energy=bool(BASIC_ENERGY_PATTERN.match(key)),
+        ))
+
+    check = DeckCheck(deck=deck, cards=cards)
+    if check.total != DECK_SIZE:
+        check.rule_errors.append(f"デッキの枚数が{check.total}枚です ({DECK_SIZE}枚にしてください)")
+    for card in cards:
+        if card.quantity > MAX_COPIES and not card.is_basic_energy:
+            check.rule_errors.append(f"「{card.name}」が{card.quantity}枚あります (同じ名前のカードは{MAX_COPIES}枚まで)")
+    ace_spec_count = sum(card.quantity for card in cards if card.is_ace_spec)
+    if ace_spec_count > MAX_ACE_SPEC:
+        check.rule_errors.append(f"ACE SPEC のカードが{ace_spec_count}枚あります (デッキに{MAX_ACE_SPEC}枚まで)")
+    return check
+
+
+def check_decks(decks) -> list:
+    """
+    複数のデッキをまとめて確認する
+
+    デッキのカードを1回のクエリで読み込み、全デッキのカード名で1つの索引を作って確認します。
+
+    Returns:
+        list: デッキごとの DeckCheck (decks と同じ順)
+    """
+    decks = list(decks)
+    entries = defaultdict(list)
+    names = set()
+    for deck_id, name, name_normalized, quantity in DeckEntry.objects.filter(deck__in=decks).values_list(
+        'deck_id', 'name', 'name_normalized', 'quantity',
+    ):
+        entries[deck_id].append((name, quantity))
+        names.add(name_normalized)
+    index = CollectionIndex(names)
+    return [check_entries(entries[deck.pk], deck=deck, index=index) for deck in decks]
+
+
+def save_deck_entries(deck, entries):
+    """デッキのカードを entries ([(カード名, 枚数)]) で置き換える"""
+    with transaction.atomic():
+        deck.entries.all().delete()
+        DeckEntry.objects.bulk_create([
+            # bulk_create では save() が呼ばれないため、正規化したカード名もここで設定する
+            DeckEntry(deck=deck, name=name, name_normalized=normalize_card_name(name), quantity=quantity, position=position)
+            for position, (name, quantity) in enumerate(entries)
+        ])
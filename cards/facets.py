@@ -0,0 +1,132 @@
+"""
+絞り込み条件ごとの件数 (ファセット) の集計
+
+検索フォームのチェックボックスの選択肢ごとに、現在の絞り込み条件で該当するカードの種類数と所持枚数を求めます。
+選択肢ごとに検索し直すのではなく、ファセットの項目ごとに GROUP BY の集計クエリを1回ずつ実行します。
+ある項目の件数は「その項目以外の絞り込み条件」で集計するため、同じ項目内で選択肢を追加した場合の件数がわかります。
+
+列ストア (cards.column_store) を使用できる場合は、SQLを実行せずにメモリ上の配列の演算で集計します
+(カード名・メモの条件がある場合のみ、その条件に該当するカードをSQLで1回だけ求めます)。
+
+結果は絞り込み条件とカードデータのバージョン (cards.cache_versions) をキーにキャッシュされ、
+カードが変更されると再集計されます。
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .cache_versions import get_cards_version
+from .column_store import column_store_enabled, get_column_store
+from .master_data import get_master_data
+from .models import PokemonCard
+from .search_documents import MASK_FIELDS
+
+# カテゴリごとのファセットの項目 (FilterSet のフィルタ名)
+FACET_FIELDS = {
+    'pokemon': ['types', 'evolution_stage', 'special_features', 'move_types', 'weakness', 'resistance'],
+    'trainers': ['trainer_type', 'special_trainers'],
+}
+
+# 件数に影響しないクエリパラメータ
+IGNORED_PARAMS = {'ordering', 'page', 'cursor'}
+
+FACET_CACHE_KEY = 'cards:facets:{category}:{version}:{signature}'
+
+
+def get_facet_counts(filterset_class, data, queryset, category: str) -> dict:
+    """
+    ファセットの件数を返す
+
+    Args:
+        filterset_class: 絞り込みに使う FilterSet のクラス
+        data: 絞り込み条件 (request.GET)
+        queryset: 絞り込み前のクエリセット
+        category: カテゴリのスラッグ (pokemon / trainers)
+
+    Returns:
+        dict: {フィルタ名: {選択肢のpk(文字列): {'cards': 種類数, 'copies': 所持枚数}}}
+    """
+    params = data.copy()
+    for key in IGNORED_PARAMS:
+        params.pop(key, None)
+    key = FACET_CACHE_KEY.format(category=category, version=get_cards_version(), signature=_signature(params))
+
+    facets = cache.get(key)
+    if facets is None:
+        if column_store_enabled():
+            facets = _count_facets_in_store(filterset_class, params, queryset, category)
+        else:
+            facets = {
+                field: _count_facet(filterset_class, params, queryset, field)
+                for field in FACET_FIELDS[category]
+            }
+        cache.set(key, facets, timeout=60 * 60 * 24)
+    return facets
+
+
+def _count_facet(filterset_class, params, queryset, field: str) -> dict:
+    """1つの項目について、選択肢ごとの件数を1回の集計クエリで求める"""
+    # 集計対象の項目自身の条件は除外する (同じ項目内の選択肢は OR 条件のため)
+    others = params.copy()
+    others.pop(field, None)
+    filterset = filterset_class(others, queryset=queryset)
+
+    # 他の項目の絞り込みで結合が増えても重複して数えないよう、対象カードをサブクエリで限定してから集計する
+    matched = PokemonCard.objects.filter(pk__in=filterset.qs.order_by().values('pk'))
+    rows = matched.order_by().values(field).annotate(
+        cards=Count('pk', distinct=True),
+        copies=Sum('quantity'),
+    )
+
+    counts = {
+        str(pk): {'cards': 0, 'copies': 0}
+        for pk in get_master_data().by_pk(filterset.filters[field].queryset.model)
+    }
+    for row in rows:
+        if row[field] is None:
+            continue
+        counts[str(row[field])] = {'cards': row['cards'], 'copies': row['copies'] or 0}
+    return counts
+
+
+def _count_facets_in_store(filterset_class, params, queryset, category: str) -> dict:
+    """全項目の選択肢ごとの件数を、列ストアで求める"""
+    store = get_column_store()
+    in_category = store.isin('category', [get_master_data().category(category).pk])
+    # カード名などSQLでのみ絞り込める条件は、ファセットの項目ではないため全項目で共通になる
+    sql_matched = None
+
+    facets = {}
+    for field in FACET_FIELDS[category]:
+        others = params.copy()
+        others.pop(field, None)
+        filterset = filterset_class(others, queryset=queryset)
+        selection, unsupported = filterset.column_selection(store)
+        selection &= in_category
+        if unsupported:
+            if sql_matched is None:
+                matched = queryset
+                for name, value in unsupported.items():
+                    matched = filterset.filters[name].filter(matched, value)
+                sql_matched = store.isin('pk', matched.order_by().values_list('pk', flat=True))
+            selection &= sql_matched
+
+        filter_ = filterset.filters[field]
+        if filter_.field_name in MASK_FIELDS:
+            rows = store.count_by_bit(filter_.field_name, selection)
+        else:
+            rows = store.count_by(filter_.field_name, selection)
+        facets[field] = {
+            str(pk): {'cards': rows.get(pk, (0, 0))[0], 'copies': rows.get(pk, (0, 0))[1]}
+            for pk in get_master_data().by_pk(filter_.queryset.model)
+        }
+    return facets
+
+
+def _signature(params) -> str:
+    """絞り込み条件を、パラメータの順序や選択肢の並びによらない文字列に変換する"""
+    normalized = sorted((key, sorted(v for v in params.getlist(key) if v)) for key in params)
+    normalized = [(key, values) for key, values in normalized if values]
+    return hashlib.sha1(repr(normalized).encode('utf-8')).hexdigest()
@@ -1,11 +1,142 @@
 import django_filters
 from django import forms
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from django_filters.fields import ModelChoiceIterator, ModelMultipleChoiceField
 from .models import PokemonCard, Type, EvolutionStage, SpecialFeature, MoveType, TrainerType, SpecialTrainer
 from .widgets import RangeSliderWidget
 from .query_builder import build_fuzzy_query
+from .master_data import get_master_data
+from .search_documents import MASK_FIELDS, documents_enabled, has_any
 
-class PokemonCardFilter(django_filters.FilterSet):
+
+class MasterChoiceIterator(ModelChoiceIterator):
+    """選択肢をマスタデータのキャッシュ (cards.master_data) から作る (データベースを参照しない)"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        if self.field.null_label is not None:
+            yield (self.field.null_value, self.field.null_label)
+        for obj in self._objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return (
+            len(self._objects())
+            + (1 if self.field.empty_label is not None else 0)
+            + (1 if self.field.null_label is not None else 0)
+        )
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _objects(self):
+        return get_master_data().all(self.queryset.model)
+
+
+class MasterMultipleChoiceField(ModelMultipleChoiceField):
+    """選択肢の表示と選択された値の検証を、マスタデータのキャッシュで行う複数選択フィールド"""
+    iterator = MasterChoiceIterator
+
+    def _check_values(self, value):
+        if self.null_label is not None or self.to_field_name:
+            return super()._check_values(value)
+        try:
+            value = frozenset(value)
+        except TypeError:
+            raise ValidationError(self.error_messages['invalid_list'], code='invalid_list')
+        objects = {str(pk): obj for pk, obj in get_master_data().by_pk(self.queryset.model).items()}
+        for val in value:
+            self.validate_no_null_characters(val)
+            if str(val) not in objects:
+                raise ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': val},
+                )
+        return [objects[str(val)] for val in value]
+
+
+class MasterMultipleChoiceFilter(django_filters.ModelMultipleChoiceFilter):
+    """マスタの複数選択フィルタ (queryset は対象のモデルの指定にのみ使い、選択肢はキャッシュから作る)"""
+    field_class = MasterMultipleChoiceField
+
+    def filter(self, qs, value):
+        # ManyToManyの項目は、検索用ドキュメントのビットマスクで絞り込む (中間テーブルの結合・DISTINCT が不要)
+        if (
+            not value or self.field_name not in MASK_FIELDS or self.conjoined or self.exclude
+            or self.is_noop(qs, value) or not documents_enabled()
+        ):
+            return super().filter(qs, value)
+        return has_any(qs, self.field_name, [obj.pk for obj in value])
+
+
+# 範囲の絞り込みの上限の最大値 (この値以上を選択した場合は上限なしとする)
+RANGE_MAX_LIMITS = {'hp': 400, 'retreat_cost': 5}
+
+
+def range_bounds(name: str, value):
+    """
+    範囲の絞り込み (filter_range_with_null) の条件を求める
+
+    Returns:
+        tuple: (下限, 上限, 未設定のカードを含むか)。下限・上限が None の場合は条件なし
+    """
+    start, stop = value.start, value.stop
+    lower = upper = None
+    # 下限・上限の条件がなければ、未設定のカードも対象とする
+    include_null = True
+
+    # 下限の設定
+    if start is not None:
+        # 0を含む場合はnull（未設定）も対象に含める
+        lower = max(start, 0)
+        include_null = start <= 0
+
+    # 上限の設定
+    # 最大値に達している場合は、上限フィルタを適用しない（400+ の意味を持たせる）
+    max_limit = RANGE_MAX_LIMITS.get(name)
+    if stop is not None and not (max_limit is not None and stop >= max_limit):
+        upper = stop
+        include_null = False
+    return lower, upper, include_null
+
+
+class ColumnStoreFilterMixin:
+    """FilterSet の絞り込み条件を、カードの列ストア (cards.column_store) で評価する"""
+
+    def column_selection(self, store):
+        """
+        絞り込み条件に該当するカードを列ストアで求める (並び替えの条件は無視する)
+
+        Returns:
+            tuple: (該当するカードの真偽値の配列, 列ストアで評価できない条件 {フィルタ名: 値})
+                列ストアで評価できない条件 (カード名・メモ) は、呼び出し側でSQLで絞り込んでください
+        """
+        # 入力を検証して cleaned_data を作る (不正な値の条件は、SQLでの絞り込みと同様に無視される)
+        self.is_valid()
+        selection = store.all()
+        unsupported = {}
+        for name, value in self.form.cleaned_data.items():
+            filter_ = self.filters[name]
+            # 未選択の複数選択の値は空のクエリセットになる (真偽値の判定でSQLを組み立てないよう型で判定する)
+            if isinstance(filter_, django_filters.OrderingFilter) or isinstance(value, QuerySet) or not value:
+                continue
+            if isinstance(filter_, MasterMultipleChoiceFilter) and not filter_.conjoined and not filter_.exclude:
+                ids = [obj.pk for obj in value]
+                if filter_.field_name in MASK_FIELDS:
+                    selection &= store.has_any(filter_.field_name, ids)
+                else:
+                    selection &= store.isin(filter_.field_name, ids)
+            elif filter_.method == 'filter_range_with_null':
+                selection &= store.range(name, *range_bounds(name, value))
+            else:
+                unsupported[name] = value
+        return selection, unsupported
+
+
+class PokemonCardFilter(ColumnStoreFilterMixin, django_filters.FilterSet):
     """ポケモンカードの絞り込みを行うためのFilterSet"""
     name = django_filters.CharFilter(
         method='filter_by_name_fuzzy',
@@ -13,37 +144,37 @@ class PokemonCardFilter(django_filters.FilterSet):
         widget=forms.TextInput(attrs={'class': 'input input-bordered w-full'})
     )
 
-    types = django_filters.ModelMultipleChoiceFilter(
+    types = MasterMultipleChoiceFilter(
         queryset=Type.objects.all(),
         label='タイプ',
         widget=forms.CheckboxSelectMultiple
     )
 
-    evolution_stage = django_filters.ModelMultipleChoiceFilter(
+    evolution_stage = MasterMultipleChoiceFilter(
         queryset=EvolutionStage.objects.all(),
         label='進化段階',
         widget=forms.CheckboxSelectMultiple
     )
 
-    special_features = django_filters.ModelMultipleChoiceFilter(
+    special_features = MasterMultipleChoiceFilter(
         queryset=SpecialFeature.objects.all(),
         label='特別',
         widget=forms.CheckboxSelectMultiple
     )
 
-    move_types = django_filters.ModelMultipleChoiceFilter(
+    move_types = MasterMultipleChoiceFilter(
         queryset=MoveType.objects.all(),
         label='わざのエネルギータイプ',
         widget=forms.CheckboxSelectMultiple
     )
 
-    weakness = django_filters.ModelMultipleChoiceFilter(
+    weakness = MasterMultipleChoiceFilter(
         queryset=Type.objects.all(),
         label='弱点',
         widget=forms.CheckboxSelectMultiple
     )
 
-    resistance = django_filters.ModelMultipleChoiceFilter(
+    resistance = MasterMultipleChoiceFilter(
         queryset=Type.objects.all(),
         label='抵抗力',
         widget=forms.CheckboxSelectMultiple
@@ -113,36 +244,22 @@ class PokemonCardFilter(django_filters.FilterSet):
         また、選択された上限が最大値（HPなら400、にげるなら5）の場合は、上限なしとして処理する。
         """
         if value:
-            start = value.start
-            stop = value.stop
-
-            # フィルタ対象に応じた最大リミットの設定
-            max_limit = 400 if name == 'hp' else 5 if name == 'retreat_cost' else None
+            lower, upper, include_null = range_bounds(name, value)
 
             # フィルタ条件の構築
             q_objects = Q()
-
-            # 下限の設定
-            if start is not None:
-                if start <= 0:
-                    # 0を含む場合はnull（未設定）も対象に含める
-                    q_objects &= (Q(**{f"{name}__gte": 0}) | Q(**{f"{name}__isnull": True}))
-                else:
-                    q_objects &= Q(**{f"{name}__gte": start})
-
-            # 上限の設定
-            if stop is not None:
-                # 最大値に達している場合は、上限フィルタを適用しない（400+ の意味を持たせる）
-                if max_limit is not None and stop >= max_limit:
-                    pass
-                else:
-                    q_objects &= Q(**{f"{name}__lte": stop})
+            if lower is not None:
+                q_objects &= Q(**{f"{name}__gte": lower})
+            if upper is not None:
+                q_objects &= Q(**{f"{name}__lte": upper})
+            if include_null and q_objects:
+                q_objects |= Q(**{f"{name}__isnull": True})
 
             return queryset.filter(q_objects)
         return queryset
 
 
-class TrainersCardFilter(django_filters.FilterSet):
+class TrainersCardFilter(ColumnStoreFilterMixin, django_filters.FilterSet):
     """トレーナーズカードの絞り込みを行うためのFilterSet"""
     name = django_filters.CharFilter(
         method='filter_by_name_fuzzy',
@@ -150,13 +267,13 @@ class TrainersCardFilter(django_filters.FilterSet):
         widget=forms.TextInput(attrs={'class': 'input input-bordered w-full'})
     )
 
-    trainer_type = django_filters.ModelMultipleChoiceFilter(
+    trainer_type = MasterMultipleChoiceFilter(
         queryset=TrainerType.objects.all(),
         label='トレーナーズ種別',
         widget=forms.CheckboxSelectMultiple
     )
 
-    special_trainers = django_filters.ModelMultipleChoiceFilter(
+    special_trainers = MasterMultipleChoiceFilter(
         queryset=SpecialTrainer.objects.all(),
         label='特別な分類',
         widget=forms.CheckboxSelectMultiple
@@ -1,5 +1,6 @@
 from django import forms
-from .models import PokemonCard, Type, EvolutionStage, SpecialFeature, MoveType
+from .models import PokemonCard, Type, EvolutionStage, SpecialFeature, MoveType, Deck
+from .decks import parse_deck_text
 
 class CustomClearableFileInput(forms.ClearableFileInput):
     clear_checkbox_label = '画像クリア'
@@ -26,3 +27,40 @@ class PokemonCardForm(forms.ModelForm):
             'image': CustomClearableFileInput(attrs={'class': 'file-input file-input-bordered file-input-secondary w-full'}),
             'category': forms.HiddenInput(),
         }
+
+
+class DeckForm(forms.ModelForm):
+    # デッキのカード (1行に1種類ずつ「4 ピカチュウex」の形式)
+    card_list = forms.CharField(
+        label='カード',
+        widget=forms.Textarea(attrs={
+            'class': 'textarea textarea-bordered textarea-primary w-full font-mono', 'rows': 14,
+            'placeholder': '4 ピカチュウex\n2 ボスの指令\n...',
+        }),
+    )
+
+    class Meta:
+        model = Deck
+        fields = ['name', 'is_allocated', 'memo']
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'input input-bordered input-primary w-full', 'placeholder': '例: ピカチュウexデッキ'}),
+            'is_allocated': forms.CheckboxInput(attrs={'class': 'checkbox checkbox-primary'}),
+            'memo': forms.Textarea(attrs={'class': 'textarea textarea-bordered textarea-neutral w-full', 'rows': 2}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and not self.is_bound:
+            self.initial['card_list'] = '\n'.join(
+                f"{entry.quantity} {entry.name}" for entry in self.instance.entries.all()
+            )
+
+    def clean_card_list(self):
+        """カードの一覧を [(カード名, 枚数)] に変換する (cleaned_data['entries'])"""
+        entries, errors = parse_deck_text(self.cleaned_data['card_list'])
+        if errors:
+            raise forms.ValidationError(errors)
+        if not entries:
+            raise forms.ValidationError('カードを入力してください')
+        self.cleaned_data['entries'] = entries
+        return self.cleaned_data['card_list']
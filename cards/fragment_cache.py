@@ -0,0 +1,66 @@
+"""
+カード一覧の表示部品 (カード・表の行) のフラグメントキャッシュ
+
+_card_item.html / _pokemon_card_table_row.html / _trainers_card_table_row.html は、
+{% cache %} タグで部品ごとにレンダリング結果をキャッシュします (キャッシュの設定は 'template_fragments')。
+
+キャッシュのキーは「カードID・更新日時・マスタデータのバージョン・縮小画像の状態」で決まるため、
+カードの保存 (枚数の変更を含む) やマスタの編集の後は、自動的に新しい内容で作り直されます。
+
+一覧のビューでは、キャッシュにない部品のカードにだけ関連データを設定します
+(ManyToManyは検索用ドキュメントのビットマスクから求めます。cards.search_documents)。
+"""
+
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+
+from .search_documents import attach_relations
+
+FRAGMENT_CACHE_ALIAS = 'template_fragments'
+
+# 表示モードごとの部品 (テンプレートの {% cache %} に指定する名前)
+CARD_ITEM_FRAGMENT = 'card_item'
+TABLE_ROW_FRAGMENT = '{category}_card_table_row'
+
+
+def card_fragment_version(card, master_version='') -> str:
+    """
+    カードの表示部品のキャッシュを区別する値
+
+    テンプレートでは card_fragment_version フィルタ (card_fragments) から使用します。
+    """
+    thumbnails = card.image_thumbnails or {}
+    return ':'.join((
+        str(card.pk),
+        card.updated_at.isoformat() if card.updated_at else '',
+        str(master_version),
+        thumbnails.get('source', ''),
+        str(len(thumbnails.get('widths', ()))),
+        str(thumbnails.get('version', '')),
+    ))
+
+
+def fragment_name(view_mode: str, category_slug: str) -> str:
+    if view_mode == 'table':
+        return TABLE_ROW_FRAGMENT.format(category=category_slug)
+    return CARD_ITEM_FRAGMENT
+
+
+def prefetch_uncached(cards: list, name: str, lookups, master_version='') -> int:
+    """
+    表示部品がキャッシュにないカードにだけ関連データを設定する
+
+    Returns:
+        int: キャッシュから表示できるカードの件数
+    """
+    if not cards:
+        return 0
+    keys = {
+        make_template_fragment_key(name, [card_fragment_version(card, master_version)]): card
+        for card in cards
+    }
+    cached = caches[FRAGMENT_CACHE_ALIAS].get_many(list(keys))
+    missing = [card for key, card in keys.items() if key not in cached]
+    if missing:
+        attach_relations(missing, lookups)
+    return len(cards) - len(missing)
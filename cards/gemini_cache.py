@@ -0,0 +1,167 @@
+"""
+Gemini抽出結果キャッシュモジュール
+
+カード切り抜き画像の画素と、Geminiに送信するグリッド画像の
+コンテンツハッシュ (SHA-256) をキーに、パース済みの抽出結果をDBに保存します。
+知覚ハッシュ (dHash など) は再録・レアリティ違い・テキストだけが異なるカードで一致することがあり、
+別のカードの抽出結果を返してしまうため、キーには内容が完全に一致する場合のみ一致するハッシュを使用します。
+以前に解析したカードはAPIを呼ばずに結果を返し、未解析のカードだけをGeminiに送信できるようにします。
+"""
+
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import GeminiExtractionCache
+
+logger = logging.getLogger(__name__)
+
+# キャッシュキーのハッシュ方式 (以前の知覚ハッシュのキーで保存したエントリを使わないため、キーに含める)
+HASH_SCHEME = 'sha256'
+
+
+def crop_hash(image: np.ndarray) -> str:
+    """
+    切り抜き画像の画素のSHA-256を計算する
+
+    画像の大きさ・型も含めるため、画素がすべて一致する切り抜き画像 (同じ画像の再アップロード) のみ一致します。
+    """
+    digest = hashlib.sha256(f"{image.shape}:{image.dtype}".encode('utf-8'))
+    digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()
+
+
+def file_hash(path) -> str:
+    """ファイル内容のSHA-256を計算する (グリッド画像用)"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class GeminiResultCache:
+    """
+    Geminiの抽出結果キャッシュ
+
+    キーにはプロンプトとモデル名から求めた版数を含めるため、
+    プロンプトを変更すると以前の結果は使われなくなります (古いエントリは期限切れで削除されます)。
+    """
+
+    def __init__(self, prompt_version: str, max_age_days: int = None, max_entries: int = None):
+        self.prompt_version = prompt_version
+        self.max_age_days = settings.GEMINI_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        self.max_entries = settings.GEMINI_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._lock = threading.Lock()
+        # プロセス内のヒット/ミス数 (カード単位。グリッドのヒットは含まれるカード数で数える)
+        self._metrics = {'hits': 0, 'misses': 0, 'grid_hits': 0, 'stores': 0, 'evictions': 0}
+
+    def key(self, kind: str, digest: str) -> str:
+        return f"{kind}:{HASH_SCHEME}:{self.prompt_version}:{digest}"
+
+    def lookup_crops(self, digests: list) -> dict:
+        """
+        カードの抽出結果をまとめて取得する
+
+        Returns:
+            dict: {ハッシュ: 抽出結果} (見つかったもののみ)
+        """
+        keys = {self.key(GeminiExtractionCache.KIND_CROP, digest): digest for digest in digests}
+        entries = GeminiExtractionCache.objects.filter(cache_key__in=keys).values_list('cache_key', 'data')
+        found = {keys[cache_key]: data for cache_key, data in entries}
+
+        self._touch([self.key(GeminiExtractionCache.KIND_CROP, digest) for digest in found])
+        with self._lock:
+            self._metrics['hits'] += len(found)
+            self._metrics['misses'] += len(digests) - len(found)
+        return found
+
+    def lookup_grid(self, digest: str):
+        """
+        グリッド画像単位の抽出結果を取得する
+
+        Returns:
+            list | None: グリッド内のID順の抽出結果 (見つからない場合は None)
+        """
+        cache_key = self.key(GeminiExtractionCache.KIND_GRID, digest)
+        data = GeminiExtractionCache.objects.filter(cache_key=cache_key).values_list('data', flat=True).first()
+        if data is None:
+            return None
+
+        self._touch([cache_key])
+        with self._lock:
+            # カード単位ではミスとして数えた分をヒットに振り替える
+            found = sum(1 for item in data if item is not None)
+            self._metrics['grid_hits'] += 1
+            self._metrics['hits'] += found
+            self._metrics['misses'] -= found
+        return data
+
+    def store(self, grid_digest: str, digests: list, items: list):
+        """
+        Geminiの抽出結果を保存する
+
+        Args:
+            grid_digest: 送信したグリッド画像のハッシュ
+            digests: グリッドに並べたカードのハッシュ (グリッド内のID順)
+            items: digests と同じ順の抽出結果 (Geminiが返さなかったカードは None)
+        """
+        now = timezone.now()
+        entries = [
+            GeminiExtractionCache(
+                cache_key=self.key(GeminiExtractionCache.KIND_CROP, digest),
+                kind=GeminiExtractionCache.KIND_CROP,
+                data=item,
+                last_used_at=now,
+            )
+            for digest, item in zip(digests, items) if item is not None
+        ]
+        entries.append(GeminiExtractionCache(
+            cache_key=self.key(GeminiExtractionCache.KIND_GRID, grid_digest),
+            kind=GeminiExtractionCache.KIND_GRID,
+            data=items,
+            last_used_at=now,
+        ))
+        # 同じカードを並行して解析した場合の重複は無視する
+        GeminiExtractionCache.objects.bulk_create(entries, ignore_conflicts=True)
+        with self._lock:
+            self._metrics['stores'] += len(entries)
+
+        self.prune()
+
+    def prune(self) -> int:
+        """期限切れのエントリと、上限を超えた古いエントリを削除する"""
+        threshold = timezone.now() - timedelta(days=self.max_age_days)
+        deleted, _ = GeminiExtractionCache.objects.filter(last_used_at__lt=threshold).delete()
+
+        excess = GeminiExtractionCache.objects.count() - self.max_entries
+        if excess > 0:
+            oldest = GeminiExtractionCache.objects.order_by('last_used_at').values_list('pk', flat=True)[:excess]
+            evicted, _ = GeminiExtractionCache.objects.filter(pk__in=list(oldest)).delete()
+            deleted += evicted
+
+        if deleted:
+            logger.info(f"Gemini cache evicted {deleted} entries")
+            with self._lock:
+                self._metrics['evictions'] += deleted
+        return deleted
+
+    def metrics(self) -> dict:
+        """ヒット/ミス数などの計測値を返す"""
+        with self._lock:
+            snapshot = dict(self._metrics)
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 3) if lookups else None
+        return snapshot
+
+    def _touch(self, cache_keys):
+        """ヒットしたエントリの利用日時とヒット回数を更新する (削除対象の判定に使用)"""
+        if not cache_keys:
+            return
+        GeminiExtractionCache.objects.filter(cache_key__in=cache_keys).update(
+            hit_count=F('hit_count') + 1,
+            last_used_at=timezone.now(),
+        )
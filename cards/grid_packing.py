@@ -0,0 +1,209 @@
+"""
+グリッド画像の作成モジュール
+
+Geminiに送信するグリッド画像 (切り抜いたカードを並べた1枚の画像) の作成方法を提供します。
+作成方法は GEMINI_GRID_STRATEGY で切り替えられます。
+
+- fixed: 幅400px・4列固定で画像ごとに1枚のグリッドを作成する (従来の方式)
+- dense: カードの縦横比に合わせたセルに詰めて並べ、複数画像のカードを1枚のグリッドにまとめる。
+         上限枚数を超える場合は複数のグリッドに均等に分割する
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# ポケモンカードの縦横比 (63mm x 88mm)
+CARD_ASPECT_RATIO = 88 / 63
+
+# IDラベルの色 (BGR)。プロンプトで「赤字のID」と指示しているため赤字にする
+LABEL_COLOR = (0, 0, 255)
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+class GridPacker:
+    """
+    グリッド画像の作成方法の基底クラス
+
+    crops には切り抜き画像の辞書 ('id': グリッド内のID, 'image': BGR画像) のリストを渡します。
+    """
+
+    name = ''
+    # 1枚のグリッドに並べる最大枚数 (None の場合は無制限)
+    max_cards = None
+    # 複数画像のカードを同じグリッドにまとめるか
+    share_across_images = False
+    jpeg_quality = 95
+
+    def split(self, crops: list) -> list:
+        """最大枚数を超える場合は、枚数が均等になるよう複数のグリッドに分割する"""
+        if not crops:
+            return []
+        if not self.max_cards or len(crops) <= self.max_cards:
+            return [crops]
+
+        count = math.ceil(len(crops) / self.max_cards)
+        size, extra = divmod(len(crops), count)
+        groups = []
+        start = 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            groups.append(crops[start:end])
+            start = end
+        return groups
+
+    def take_ready(self, pending: list) -> tuple[list, list]:
+        """
+        送信待ちのカードから、すぐに送信するグリッドを取り出す
+
+        画像をまたいでまとめない場合はすべて、まとめる場合は最大枚数に達したグリッドのみを取り出します。
+
+        Returns:
+            tuple[list, list]: (送信するグリッドのリスト, 送信待ちとして残すカード)
+        """
+        if not self.share_across_images:
+            return self.split(pending), []
+
+        groups = []
+        while self.max_cards and len(pending) >= self.max_cards:
+            groups.append(pending[:self.max_cards])
+            pending = pending[self.max_cards:]
+        return groups, pending
+
+    def plan(self, crops_per_image: list) -> list:
+        """画像ごとのカードのリストから、送信するグリッドの分け方を返す (ベンチマーク用)"""
+        grids = []
+        pending = []
+        for crops in crops_per_image:
+            ready, pending = self.take_ready(pending + list(crops))
+            grids.extend(ready)
+        grids.extend(self.split(pending))
+        return grids
+
+    def render(self, crops: list) -> np.ndarray:
+        """グリッド画像を作成する"""
+        raise NotImplementedError
+
+    def encode(self, grid: np.ndarray) -> bytes:
+        """グリッド画像をJPEGにエンコードする"""
+        ok, buffer = cv2.imencode('.jpg', grid, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("グリッド画像のエンコードに失敗しました")
+        return buffer.tobytes()
+
+    def save(self, crops: list, save_path) -> int:
+        """グリッド画像を作成して保存し、ファイルサイズ (バイト) を返す"""
+        data = self.encode(self.render(crops))
+        with open(save_path, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+
+class FixedGridPacker(GridPacker):
+    """幅400px・4列固定のグリッド (行の高さは最も高いカードに揃える)"""
+
+    name = 'fixed'
+    target_width = 400
+    cols = 4
+
+    def render(self, crops: list) -> np.ndarray:
+        resized_images = []
+        for item in crops:
+            img = item['image']
+            h, w = img.shape[:2]
+            scale = self.target_width / w
+            resized = cv2.resize(img, (self.target_width, int(h * scale)))
+            cv2.putText(resized, f"ID: {item['id']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, LABEL_COLOR, 2)
+            resized_images.append(resized)
+
+        rows = (len(resized_images) + self.cols - 1) // self.cols
+        max_h = max((img.shape[0] for img in resized_images), default=100)
+        grid = np.full((rows * max_h, self.cols * self.target_width, 3), 255, dtype=np.uint8)
+
+        for idx, img in enumerate(resized_images):
+            y_offset = (idx // self.cols) * max_h
+            x_offset = (idx % self.cols) * self.target_width
+            h, w = img.shape[:2]
+            grid[y_offset:y_offset + h, x_offset:x_offset + w] = img
+        return grid
+
+
+class DenseGridPacker(GridPacker):
+    """
+    カードの縦横比のセルに詰めて並べるグリッド
+
+    列数はグリッド全体が正方形に近くなるよう枚数から決め、1辺は max_side 以下に収めます。
+    Geminiは大きな画像を縮小して読み取るため、1辺を大きくしすぎるとカード内の文字が読めなくなります。
+    """
+
+    name = 'dense'
+    share_across_images = True
+
+    def __init__(self, cell_width: int = 300, max_cards: int = 24, max_side: int = 2048,
+                 gap: int = 6, jpeg_quality: int = 90):
+        self.cell_width = cell_width
+        self.cell_height = round(cell_width * CARD_ASPECT_RATIO)
+        self.gap = gap
+        self.jpeg_quality = jpeg_quality
+        self.max_cols = max(1, (max_side + gap) // (self.cell_width + gap))
+        self.max_rows = max(1, (max_side + gap) // (self.cell_height + gap))
+        self.max_cards = max(1, min(max_cards, self.max_cols * self.max_rows))
+
+    def layout(self, count: int) -> tuple[int, int]:
+        """枚数から (列数, 行数) を決める"""
+        cols = math.ceil(math.sqrt(count * self.cell_height / self.cell_width))
+        cols = max(1, min(self.max_cols, cols, count))
+        rows = math.ceil(count / cols)
+        if rows > self.max_rows:
+            cols = math.ceil(count / self.max_rows)
+            rows = math.ceil(count / cols)
+        return cols, rows
+
+    def render(self, crops: list) -> np.ndarray:
+        cols, rows = self.layout(len(crops))
+        step_x = self.cell_width + self.gap
+        step_y = self.cell_height + self.gap
+        grid = np.full((rows * step_y - self.gap, cols * step_x - self.gap, 3), BACKGROUND_COLOR, dtype=np.uint8)
+
+        for idx, item in enumerate(crops):
+            img = item['image']
+            h, w = img.shape[:2]
+            # セルに収まるよう縦横比を保って縮小し、中央に配置する
+            scale = min(self.cell_width / w, self.cell_height / h)
+            new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+            resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+            x = (idx % cols) * step_x + (self.cell_width - new_w) // 2
+            y = (idx // cols) * step_y + (self.cell_height - new_h) // 2
+            grid[y:y + new_h, x:x + new_w] = resized
+            self._draw_label(grid, f"ID: {item['id']}", x, y)
+        return grid
+
+    def _draw_label(self, grid: np.ndarray, text: str, x: int, y: int):
+        """IDラベルを白背景の上に描画する (カードのイラストに重なっても読めるように)"""
+        font_scale = max(0.6, self.cell_width / 400)
+        thickness = max(2, round(font_scale * 2))
+        (text_w, text_h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        padding = 4
+        cv2.rectangle(
+            grid, (x, y), (x + text_w + padding * 2, y + text_h + baseline + padding * 2), BACKGROUND_COLOR, -1
+        )
+        cv2.putText(
+            grid, text, (x + padding, y + padding + text_h), cv2.FONT_HERSHEY_SIMPLEX, font_scale, LABEL_COLOR, thickness
+        )
+
+
+GRID_PACKERS = {
+    FixedGridPacker.name: FixedGridPacker,
+    DenseGridPacker.name: DenseGridPacker,
+}
+
+
+def build_grid_packer(strategy: str, **options) -> GridPacker:
+    """名前からグリッドの作成方法を生成する"""
+    try:
+        packer_class = GRID_PACKERS[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown grid strategy: {strategy} (choices: {', '.join(GRID_PACKERS)})")
+    return packer_class(**options)
@@ -0,0 +1,146 @@
+"""
+Gemini API KEYのスケジューラ
+
+複数のAPI KEYから使用するキーを選び、使用回数を予約します。
+キーの選択と使用回数の加算は1文の UPDATE ... RETURNING で行うため、
+複数のgunicornワーカーや解析ワーカーが同時に解析しても、上限を超えて同じキーを使うことはありません。
+(PostgreSQL / SQLite 3.35以降で動作します)
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import GeminiApiKeyUsage
+
+logger = logging.getLogger(__name__)
+
+# 別のワーカーと同じキーを取り合って予約できなかった場合の再試行回数
+MAX_RESERVE_ATTEMPTS = 5
+
+
+class GeminiKeyScheduler:
+    """
+    Gemini API KEYの選択・使用回数の予約を行うクラス
+
+    - 使用回数は日付が変わった後の最初の予約時にリセットされます (日次リセットの処理は不要)
+    - キーごとに1日の上限 (daily_limit) を設定できます
+    - 利用制限 (ResourceExhausted) を受けたキーは cool_down() で一定時間使用しないようにできます
+    """
+
+    def __init__(self, api_keys: list, daily_limits: list = None, cooldown_seconds: int = None):
+        self.api_keys = api_keys
+        self.daily_limits = daily_limits or [settings.GEMINI_DAILY_LIMIT] * len(api_keys)
+        self.cooldown_seconds = (
+            settings.GEMINI_KEY_COOLDOWN_SECONDS if cooldown_seconds is None else cooldown_seconds
+        )
+        self._initialized = False
+
+    def reserve(self) -> tuple[str, int] | None:
+        """
+        使用可能なキーを1つ選び、使用回数を1つ予約する
+
+        Returns:
+            tuple[str, int]: (API KEY文字列, キーインデックス)。使用可能なキーがない場合は None
+        """
+        self._ensure_keys()
+        for _ in range(MAX_RESERVE_ATTEMPTS):
+            row = self._reserve_once()
+            if row:
+                key_index, usage_count, daily_limit = row
+                logger.info(f"Using API key {key_index + 1}: {usage_count}/{daily_limit} used today")
+                return self.api_keys[key_index], key_index
+
+            # 他のワーカーと競合しただけで、まだ使用可能なキーが残っている場合は再試行する
+            if not self._has_available_key():
+                break
+
+        logger.error("All Gemini API keys have reached daily limit or are cooling down")
+        return None
+
+    def release(self, key_index: int):
+        """
+        予約した使用回数を取り消す (API呼び出し自体が失敗した場合など)
+
+        日付が変わって既にリセットされている場合は何もしません。
+        """
+        GeminiApiKeyUsage.objects.filter(
+            key_index=key_index,
+            usage_count__gt=0,
+            last_reset_date=timezone.now().date(),
+        ).update(usage_count=F('usage_count') - 1, updated_at=timezone.now())
+
+    def cool_down(self, key_index: int, seconds: int = None):
+        """利用制限を受けたキーを一定時間使用しないようにする"""
+        seconds = self.cooldown_seconds if seconds is None else seconds
+        until = timezone.now() + timedelta(seconds=seconds)
+        GeminiApiKeyUsage.objects.filter(key_index=key_index).update(cooldown_until=until, updated_at=timezone.now())
+        logger.warning(f"API key {key_index + 1} is cooling down until {until.isoformat()}")
+
+    def status(self) -> list:
+        """キーごとの使用状況を返す (日付が変わってまだリセットされていないキーは使用回数0とする)"""
+        self._ensure_keys()
+        today = timezone.now().date()
+        now = timezone.now()
+        return [
+            {
+                'key_index': usage.key_index,
+                'usage_count': usage.usage_count if usage.last_reset_date >= today else 0,
+                'daily_limit': usage.daily_limit,
+                'cooling_down': bool(usage.cooldown_until and usage.cooldown_until > now),
+            }
+            for usage in GeminiApiKeyUsage.objects.filter(key_index__lt=len(self.api_keys)).order_by('key_index')
+        ]
+
+    def _reserve_once(self):
+        """使用可能なキーのうちインデックスが最も小さいものを選び、使用回数を加算する (1文で実行)"""
+        table = connection.ops.quote_name(GeminiApiKeyUsage._meta.db_table)
+        today = connection.ops.adapt_datefield_value(timezone.now().date())
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        # 日付が変わっていれば使用回数を1から数え直す (遅延リセット)
+        available = (
+            "(cooldown_until IS NULL OR cooldown_until <= %s) "
+            "AND (last_reset_date < %s OR usage_count < daily_limit)"
+        )
+        sql = (
+            f"UPDATE {table} SET "
+            f"usage_count = CASE WHEN last_reset_date < %s THEN 1 ELSE usage_count + 1 END, "
+            f"last_reset_date = %s, updated_at = %s "
+            f"WHERE key_index = ("
+            f"SELECT key_index FROM {table} WHERE key_index < %s AND {available} "
+            f"ORDER BY key_index LIMIT 1"
+            f") AND {available} "
+            f"RETURNING key_index, usage_count, daily_limit"
+        )
+        params = [today, today, now, len(self.api_keys), now, today, now, today]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    def _has_available_key(self) -> bool:
+        now = timezone.now()
+        today = now.date()
+        return GeminiApiKeyUsage.objects.filter(
+            Q(cooldown_until__isnull=True) | Q(cooldown_until__lte=now),
+            Q(last_reset_date__lt=today) | Q(usage_count__lt=F('daily_limit')),
+            key_index__lt=len(self.api_keys),
+        ).exists()
+
+    def _ensure_keys(self):
+        """キーごとの行を作成し、1日の上限を設定値に合わせる (プロセスごとに初回のみ)"""
+        if self._initialized:
+            return
+        GeminiApiKeyUsage.objects.bulk_create(
+            [
+                GeminiApiKeyUsage(key_index=i, usage_count=0, daily_limit=limit)
+                for i, limit in enumerate(self.daily_limits)
+            ],
+            ignore_conflicts=True,
+        )
+        for i, limit in enumerate(self.daily_limits):
+            GeminiApiKeyUsage.objects.filter(key_index=i).exclude(daily_limit=limit).update(daily_limit=limit)
+        self._initialized = True
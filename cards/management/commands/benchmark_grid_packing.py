@@ -0,0 +1,112 @@
+"""
+グリッド画像の作成方法を比較するベンチマーク
+
+一括登録で保存された切り抜き画像 (media/bulk_register/**/crops/*.jpg) を使い、
+作成方法ごとにGeminiへの問い合わせ回数・1回あたりのカード枚数・送信サイズを比較します。
+切り抜き画像がない場合は、カードを模した画像を生成して使用します。
+Gemini APIは呼び出しません。
+
+Usage:
+    python manage.py benchmark_grid_packing
+    python manage.py benchmark_grid_packing --images 10 --per-image 9 --cell-widths 240 300 360
+"""
+
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cards.grid_packing import DenseGridPacker, FixedGridPacker
+
+# 1キーあたりの1日の問い合わせ上限 (CardAnalyzer._get_current_api_key と同じ)
+DAILY_REQUESTS_PER_KEY = 20
+
+
+class Command(BaseCommand):
+    help = 'Geminiに送信するグリッド画像の作成方法を比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=10, help='一括登録する画像の枚数')
+        parser.add_argument('--per-image', type=int, default=9, help='画像1枚あたりのカード枚数')
+        parser.add_argument('--cell-widths', type=int, nargs='+', default=[240, 300, 360],
+                            help='dense で比較するセル幅 (px)')
+        parser.add_argument('--max-cards', type=int, default=settings.GEMINI_GRID_MAX_CARDS,
+                            help='dense で1回の問い合わせに含める最大枚数')
+        parser.add_argument('--crops-glob', default=os.path.join(settings.MEDIA_ROOT, 'bulk_register', '**', 'crops', '*.jpg'),
+                            help='使用する切り抜き画像のパス (glob)')
+
+
+    def handle(self, *args, **options):
+        total = options['images'] * options['per_image']
+        crops = self._load_crops(options['crops_glob'], total)
+        crops_per_image = [
+            crops[i:i + options['per_image']] for i in range(0, total, options['per_image'])
+        ]
+
+        packers = [('fixed', FixedGridPacker())]
+        for cell_width in options['cell_widths']:
+            packers.append((
+                f'dense ({cell_width}px)',
+                DenseGridPacker(cell_width=cell_width, max_cards=options['max_cards']),
+            ))
+
+        self.stdout.write(
+            f"{options['images']}枚の画像 x {options['per_image']}枚のカード (計{total}枚) で比較します。"
+        )
+        header = f"{'方式':<16}{'問い合わせ':>10}{'枚/回':>8}{'合計KB':>10}{'KB/枚':>8}{'最大サイズ':>14}{'作成秒':>8}{'枚/日/キー':>12}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for label, packer in packers:
+            start = time.perf_counter()
+            grids = packer.plan(crops_per_image)
+            sizes = []
+            shapes = []
+            for grid_crops in grids:
+                grid_crops = [dict(crop, id=i) for i, crop in enumerate(grid_crops)]
+                grid = packer.render(grid_crops)
+                sizes.append(len(packer.encode(grid)))
+                shapes.append(grid.shape[:2])
+            elapsed = time.perf_counter() - start
+
+            cards_per_request = total / len(grids)
+            largest = max(shapes, key=lambda shape: shape[0] * shape[1])
+            self.stdout.write(
+                f"{label:<16}{len(grids):>10}{cards_per_request:>8.1f}{sum(sizes) / 1024:>10.0f}"
+                f"{sum(sizes) / 1024 / total:>8.1f}{f'{largest[1]}x{largest[0]}':>14}{elapsed:>8.2f}"
+                f"{cards_per_request * DAILY_REQUESTS_PER_KEY:>12.0f}"
+            )
+
+    def _load_crops(self, pattern: str, count: int) -> list:
+        """切り抜き画像を読み込む (足りない分はカードを模した画像で補う)"""
+        crops = []
+        for path in sorted(glob.glob(pattern, recursive=True))[:count]:
+            image = cv2.imread(path)
+            if image is not None:
+                crops.append({'image': image})
+
+        if len(crops) < count:
+            self.stdout.write(
+                self.style.WARNING(f'切り抜き画像が{len(crops)}枚のため、{count - len(crops)}枚は生成した画像を使用します。')
+            )
+            rng = np.random.default_rng(0)
+            crops.extend({'image': self._synthetic_card(rng)} for _ in range(count - len(crops)))
+        return crops
+
+    def _synthetic_card(self, rng) -> np.ndarray:
+        """カードを模した画像 (枠・イラスト・文字行) を生成する"""
+        h, w = int(rng.integers(560, 720)), int(rng.integers(400, 500))
+        card = np.full((h, w, 3), rng.integers(120, 255, 3), dtype=np.uint8)
+        cv2.rectangle(card, (12, 12), (w - 12, h - 12), (40, 40, 40), 4)
+        # イラスト部分 (グラデーション)
+        art = np.linspace(0, 255, w - 60, dtype=np.uint8)[None, :, None]
+        card[70:h // 2, 30:w - 30] = (art + rng.integers(0, 255, 3)).astype(np.uint8)
+        for i, y in enumerate(range(h // 2 + 40, h - 40, 44)):
+            cv2.putText(card, f"Move {i} {rng.integers(10, 200)}", (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+        cv2.putText(card, f"Card {rng.integers(1000)} HP{rng.integers(5, 33) * 10}", (30, 50),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+        return card
@@ -0,0 +1,108 @@
+"""
+カード名検索のベンチマーク
+
+ダミーのカードを指定件数だけ作成し、従来のあいまい検索 (キーワードごとに3通りの icontains)
+と、正規化済みの列 (name_normalized) に対する検索の所要時間を比較します。
+作成したカードは計測後にロールバックされます。
+
+Usage:
+    python manage.py benchmark_name_search
+    python manage.py benchmark_name_search --counts 10000 100000 --repeat 50
+"""
+
+import random
+import time
+
+import jaconv
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from cards.models import CardCategory, PokemonCard
+from cards.query_builder import build_fuzzy_query, normalize_card_name
+
+BASE_NAMES = [
+    'ピカチュウ', 'ライチュウ', 'リザードン', 'フシギバナ', 'カメックス', 'ミュウツー', 'ミュウ', 'ルカリオ',
+    'ゲッコウガ', 'サーナイト', 'ガブリアス', 'ドラパルト', 'パオジアン', 'テツノカイナ', 'キラーメ',
+    'ボスの指令', 'ナンジャモ', 'ペパー', 'ネストボール', 'ハイパーボール', 'ふしぎなアメ', 'ポケギア3.0',
+]
+SUFFIXES = ['', '', '', 'ex', 'V', 'VSTAR', 'GX', 'ＥＸ']
+KANA = 'アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン'
+DEFAULT_KEYWORDS = ['ぴか', 'リザ', 'ﾐｭｳ', 'ex', 'ナンジャモ', 'ミュウ ex', 'ボール']
+
+
+def legacy_fuzzy_query(query_text: str) -> Q:
+    """従来のあいまい検索 (比較用)"""
+    q_obj = Q()
+    for keyword in query_text.split():
+        hira = jaconv.kata2hira(keyword)
+        kata = jaconv.hira2kata(keyword)
+        q_obj &= Q(name__icontains=keyword) | Q(name__icontains=hira) | Q(name__icontains=kata)
+    return q_obj
+
+
+class Command(BaseCommand):
+    help = 'カード名検索 (従来方式と正規化列) の所要時間を比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', type=int, nargs='+', default=[10000, 100000], help='作成するカードの件数')
+        parser.add_argument('--repeat', type=int, default=20, help='キーワードごとの計測回数')
+        parser.add_argument('--keywords', nargs='+', default=DEFAULT_KEYWORDS, help='検索キーワード')
+
+    def handle(self, *args, **options):
+        category = CardCategory.objects.first()
+        if category is None:
+            self.stdout.write(self.style.ERROR('✗ カテゴリがありません。先に seed_master_data を実行してください。'))
+            return
+
+        self.stdout.write(f"DB: {connection.vendor}")
+        for count in options['counts']:
+            with transaction.atomic():
+                self._create_cards(category, count)
+                self._run(count, options['keywords'], options['repeat'])
+                # 作成したダミーデータは破棄する
+                transaction.set_rollback(True)
+
+    def _create_cards(self, category, count: int):
+        self.stdout.write(f"\nダミーカードを{count}件作成中...")
+        rng = random.Random(count)
+        cards = []
+        for _ in range(count):
+            name = f"{rng.choice(BASE_NAMES)}{''.join(rng.choices(KANA, k=2))}{rng.choice(SUFFIXES)}"
+            cards.append(PokemonCard(name=name, name_normalized=normalize_card_name(name), category=category))
+        PokemonCard.objects.bulk_create(cards, batch_size=5000)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE cards_pokemoncard')
+
+    def _run(self, count: int, keywords: list, repeat: int):
+        header = f"{'キーワード':<14}{'件数':>8}{'従来(ms)':>12}{'正規化(ms)':>12}{'倍率':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for keyword in keywords:
+            legacy_count, legacy_ms = self._measure(legacy_fuzzy_query(keyword), repeat)
+            normalized_count, normalized_ms = self._measure(build_fuzzy_query(keyword), repeat)
+            ratio = legacy_ms / normalized_ms if normalized_ms else 0
+            self.stdout.write(
+                f"{keyword:<14}{normalized_count:>8}{legacy_ms:>12.2f}{normalized_ms:>12.2f}{ratio:>7.1f}x"
+            )
+            if legacy_count != normalized_count:
+                # 全角/半角や大文字/小文字の揺らぎは正規化列でのみ一致するため、件数が増えることがある
+                self.stdout.write(f"  (従来方式では {legacy_count} 件)")
+
+        if connection.vendor == 'postgresql':
+            queryset = PokemonCard.objects.filter(build_fuzzy_query(keywords[0])).values('id')
+            self.stdout.write(f"\n実行計画 ({keywords[0]}):")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"  {line}")
+
+    def _measure(self, q_obj, repeat: int) -> tuple[int, float]:
+        """検索件数と、1回あたりの平均所要時間 (ミリ秒) を返す"""
+        queryset = PokemonCard.objects.filter(q_obj)
+        result_count = queryset.count()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            # 一覧表示と同様に、先頭のページ分を取得する
+            list(queryset.values_list('id', flat=True)[:24])
+        return result_count, (time.perf_counter() - start) / repeat * 1000
@@ -0,0 +1,92 @@
+"""
+既存のカード画像の縮小画像を生成するコマンド
+
+画像の保存時や一括登録では自動で生成されるため、
+縮小画像の機能を追加する前に登録したカードや、CARD_THUMBNAIL_WIDTHS・縮小画像の命名規則を変更した場合に実行します。
+
+Usage:
+    python manage.py generate_card_thumbnails
+    python manage.py generate_card_thumbnails --force   # 生成済みのカードも作り直す
+    python manage.py generate_card_thumbnails --cleanup # どのカードからも参照されていない縮小画像を削除する
+"""
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from cards.cache_versions import notify_cards_changed
+from cards.models import PokemonCard
+from cards.thumbnails import (
+    FORMATS, delete_orphaned_thumbnails, delete_thumbnails, generate_thumbnails, is_up_to_date, thumbnail_name,
+)
+
+
+class Command(BaseCommand):
+    help = '既存のカード画像の縮小画像（一覧表示用）を生成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='生成済みのカードも縮小画像を作り直す')
+        parser.add_argument(
+            '--cleanup', action='store_true',
+            help='どのカードからも参照されていない縮小画像 (設定から外した幅・以前の命名規則・削除した画像) を削除する',
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help='まとめて保存するカードの件数')
+
+    def handle(self, *args, **options):
+        cards = PokemonCard.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_thumbnails')
+        pending, generated, skipped, failed = [], 0, 0, 0
+        original_bytes, thumbnail_bytes = 0, 0
+
+        for card in cards.order_by('pk').iterator(chunk_size=options['batch_size']):
+            if not options['force'] and is_up_to_date(card.image_thumbnails, card.image.name):
+                skipped += 1
+                continue
+            # 以前の幅・命名規則で生成した縮小画像を残さないよう、削除してから生成する
+            delete_thumbnails(card.image.name, (card.image_thumbnails or {}).get('widths', ()))
+            card.image_thumbnails = generate_thumbnails(card.image.name)
+            pending.append(card)
+            if not card.image_thumbnails['widths']:
+                failed += 1
+                continue
+            generated += 1
+            original_bytes += self._size(card.image.name)
+            # 一覧で最もよく使われる最小の幅の WebP と比較する
+            thumbnail_bytes += self._size(thumbnail_name(card.image.name, card.image_thumbnails['widths'][0], 'webp'))
+
+            if len(pending) >= options['batch_size']:
+                PokemonCard.objects.bulk_update(pending, ['image_thumbnails'])
+                pending = []
+        if pending:
+            PokemonCard.objects.bulk_update(pending, ['image_thumbnails'])
+        if generated or failed:
+            # 一覧のキャッシュに元の画像のURLが残らないようにする
+            notify_cards_changed()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 縮小画像を生成しました: {generated}件 (生成済み: {skipped}件 / 失敗: {failed}件)'
+        ))
+        if generated:
+            self.stdout.write(
+                f'  元の画像: {original_bytes / 1024:.0f}KB → 縮小画像 (最小の幅・WebP): {thumbnail_bytes / 1024:.0f}KB'
+            )
+        if options['cleanup']:
+            deleted = delete_orphaned_thumbnails(self._used_thumbnail_names(cards))
+            self.stdout.write(self.style.SUCCESS(f'✓ 参照されていない縮小画像を削除しました: {deleted}件'))
+
+    @staticmethod
+    def _used_thumbnail_names(cards) -> set:
+        """カードが参照している (現在の画像から現在の命名規則で生成した) 縮小画像のパス"""
+        used_names = set()
+        for name, thumbnails in cards.values_list('image', 'image_thumbnails').iterator():
+            if not is_up_to_date(thumbnails, name):
+                continue
+            used_names.update(
+                thumbnail_name(name, width, ext) for width in thumbnails['widths'] for ext, _, _ in FORMATS
+            )
+        return used_names
+
+    @staticmethod
+    def _size(name: str) -> int:
+        try:
+            return default_storage.size(name)
+        except OSError:
+            return 0
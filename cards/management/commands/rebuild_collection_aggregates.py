@@ -0,0 +1,26 @@
+"""
+コレクションの集計 (CollectionAggregate) を作り直すコマンド
+
+集計はカードの変更時に差分だけが自動的に反映されますが、シグナルが発生しない方法
+(SQLでの直接の変更・データの復元など) でカードを変更した場合にずれが生じます。
+全カードから集計を作り直し、作り直す前と値が異なっていた行数を表示します。
+
+Usage:
+    python manage.py rebuild_collection_aggregates
+"""
+
+from django.core.management.base import BaseCommand
+
+from cards.aggregates import rebuild_aggregates
+from cards.models import CollectionAggregate, PokemonCard
+
+
+class Command(BaseCommand):
+    help = 'コレクションの集計を全カードから作り直します'
+
+    def handle(self, *args, **options):
+        drift = rebuild_aggregates()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {PokemonCard.objects.count()}件のカードから集計を作り直しました "
+            f"(集計の行: {CollectionAggregate.objects.count()}件 / ずれを修正: {drift}件)"
+        ))
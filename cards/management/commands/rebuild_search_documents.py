@@ -0,0 +1,48 @@
+"""
+カードの検索用ドキュメント (CardSearchDocument) を作り直すコマンド
+
+ドキュメントはカードの保存・ManyToManyの変更時に自動的に更新されますが、
+シグナルが発生しない方法 (SQLでの直接の変更・データの復元など) で変更した場合にずれが生じます。
+全カードのドキュメントを中間テーブルから作り直し、ずれていた件数を表示します。
+
+Usage:
+    python manage.py rebuild_search_documents
+    python manage.py rebuild_search_documents --batch-size 500
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cards.models import CardSearchDocument, PokemonCard
+from cards.search_documents import BATCH_SIZE, MASK_FIELDS, sync_documents
+
+
+class Command(BaseCommand):
+    help = 'カードの検索用ドキュメントを ManyToMany から作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='一度に作り直すカードの件数')
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        mask_fields = [mask_field for mask_field, _ in MASK_FIELDS.values()]
+        card_ids = list(PokemonCard.objects.order_by('pk').values_list('pk', flat=True))
+
+        rebuilt = created = changed = 0
+        for start in range(0, len(card_ids), batch_size):
+            chunk = card_ids[start:start + batch_size]
+            with transaction.atomic():
+                before = self._load(chunk, mask_fields)
+                rebuilt += sync_documents(chunk)
+                after = self._load(chunk, mask_fields)
+            created += sum(1 for card_id in after if card_id not in before)
+            changed += sum(1 for card_id, masks in after.items() if card_id in before and before[card_id] != masks)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {rebuilt}件のドキュメントを作り直しました (新規作成: {created}件 / ずれを修正: {changed}件)"
+        ))
+
+    @staticmethod
+    def _load(card_ids: list, mask_fields: list) -> dict:
+        rows = CardSearchDocument.objects.filter(card_id__in=card_ids).values_list('card_id', *mask_fields)
+        return {row[0]: row[1:] for row in rows}
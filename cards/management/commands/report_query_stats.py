@@ -0,0 +1,163 @@
+"""
+カード一覧のクエリとインデックスの使用状況を表示するコマンド
+
+一覧の並び替えごとに先頭ページを取得するクエリを実行し、所要時間と、実行計画で使用したインデックス・
+並び替え (ソート) 処理の有無を表示します。
+PostgreSQLの場合は、インデックスごとの使用回数 (pg_stat_user_indexes) と、
+pg_stat_statements 拡張が有効であればカードのテーブルを参照する遅いクエリの上位も表示します。
+
+Usage:
+    python manage.py report_query_stats
+    python manage.py report_query_stats --explain      # 実行計画をすべて表示する
+    python manage.py report_query_stats --top 20       # 遅いクエリの表示件数 (PostgreSQL)
+"""
+
+import re
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import RequestFactory
+
+from cards.models import PokemonCard
+from cards.pagination import KeysetPaginator, keyset_pagination_enabled
+from cards.views import PokemonCardListView, TrainersCardListView
+
+# 実行計画から使用したインデックス名を取り出す (PostgreSQL / SQLite)
+INDEX_PATTERN = re.compile(r'(?:Index (?:Only )?Scan (?:Backward )?using|USING (?:COVERING )?INDEX) (\w+)')
+# 実行計画に並び替え処理が含まれるか
+SORT_PATTERN = re.compile(r'(?:^|\s|>)Sort(?:\s|$)|USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY', re.MULTILINE)
+# 統計を表示するテーブル (cards アプリのテーブル)
+TABLE_PATTERN = 'cards\\_%'
+
+
+class Command(BaseCommand):
+    help = 'カード一覧のクエリの所要時間と、インデックスの使用状況を表示します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--explain', action='store_true', help='実行計画をすべて表示する')
+        parser.add_argument('--repeat', type=int, default=5, help='クエリごとの計測回数')
+        parser.add_argument('--top', type=int, default=10, help='遅いクエリの表示件数 (pg_stat_statements)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"DB: {connection.vendor} / カード: {PokemonCard.objects.count()}件")
+        for view_class in (PokemonCardListView, TrainersCardListView):
+            self._report_list_queries(view_class, options)
+
+        if connection.vendor == 'postgresql':
+            self._report_index_usage()
+            self._report_slow_statements(options['top'])
+        else:
+            self.stdout.write(
+                "\nインデックスの使用回数・遅いクエリの統計は PostgreSQL の場合のみ表示します"
+            )
+
+    def _report_list_queries(self, view_class, options):
+        """並び替えごとに、一覧の先頭ページを取得するクエリの所要時間と実行計画を表示する"""
+        category = view_class.facet_category
+        self.stdout.write(f"\n■ 一覧のクエリ ({category})")
+        header = f"{'並び替え':<34}{'時間(ms)':>10}  {'ソート':<6}インデックス"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        view = self._build_view(view_class, {})
+        view.get_queryset()
+        for ordering, label in type(view.filterset).CHOICES:
+            queryset = self._page_queryset(view_class, ordering)
+            plan = queryset.explain()
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset)
+            elapsed_ms = (time.perf_counter() - start) / options['repeat'] * 1000
+
+            indexes = ', '.join(dict.fromkeys(INDEX_PATTERN.findall(plan))) or '(なし)'
+            sort = 'あり' if SORT_PATTERN.search(plan) else '-'
+            self.stdout.write(f"{label:<30}{elapsed_ms:>10.2f}  {sort:<6}{indexes}")
+            if options['explain']:
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+
+    def _page_queryset(self, view_class, ordering: str):
+        """一覧の画面と同じ条件で、先頭ページを取得するクエリセットを作る"""
+        view = self._build_view(view_class, {'ordering': ordering})
+        queryset = view.get_queryset()
+        if keyset_pagination_enabled():
+            return KeysetPaginator(queryset, ordering, per_page=view.paginate_by).page_queryset()
+        return queryset[:view.paginate_by]
+
+    @staticmethod
+    def _build_view(view_class, params: dict):
+        view = view_class()
+        view.setup(RequestFactory().get('/', params))
+        return view
+
+    def _report_index_usage(self):
+        """カードのアプリのテーブルのインデックスごとの使用回数とサイズを表示する"""
+        self.stdout.write("\n■ インデックスの使用状況 (統計の収集開始からの累計)")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT t.relname, t.seq_scan, COALESCE(t.idx_scan, 0), t.n_live_tup
+                FROM pg_stat_user_tables t
+                WHERE t.relname LIKE %s
+                ORDER BY t.seq_scan DESC
+                """,
+                [TABLE_PATTERN],
+            )
+            tables = cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT relname, indexrelname, idx_scan, pg_relation_size(indexrelid)
+                FROM pg_stat_user_indexes
+                WHERE relname LIKE %s
+                ORDER BY relname, idx_scan DESC
+                """,
+                [TABLE_PATTERN],
+            )
+            indexes = cursor.fetchall()
+
+        header = f"{'テーブル':<36}{'全件走査':>10}{'索引走査':>12}{'行数':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for relname, seq_scan, idx_scan, live_rows in tables:
+            self.stdout.write(f"{relname:<40}{seq_scan:>12}{idx_scan:>14}{live_rows:>12}")
+
+        self.stdout.write('')
+        header = f"{'インデックス':<44}{'使用回数':>10}{'サイズ(KB)':>12}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for relname, index_name, idx_scan, size in indexes:
+            mark = '  ← 未使用' if idx_scan == 0 else ''
+            self.stdout.write(f"{index_name:<50}{idx_scan:>12}{size / 1024:>12.0f}{mark}")
+
+    def _report_slow_statements(self, top: int):
+        """pg_stat_statements から、カードのテーブルを参照する平均実行時間の長いクエリを表示する"""
+        self.stdout.write(f"\n■ 遅いクエリ (pg_stat_statements・平均実行時間の上位{top}件)")
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+                if cursor.fetchone() is None:
+                    self.stdout.write(
+                        "pg_stat_statements 拡張が有効ではありません "
+                        "(shared_preload_libraries に追加し、CREATE EXTENSION pg_stat_statements を実行してください)"
+                    )
+                    return
+                cursor.execute(
+                    """
+                    SELECT calls, mean_exec_time, total_exec_time, query
+                    FROM pg_stat_statements
+                    WHERE query ILIKE %s
+                    ORDER BY mean_exec_time DESC
+                    LIMIT %s
+                    """,
+                    ['%cards\\_pokemoncard%', top],
+                )
+                rows = cursor.fetchall()
+        except DatabaseError as e:
+            self.stdout.write(self.style.WARNING(f"pg_stat_statements を参照できません: {e}"))
+            return
+
+        for calls, mean_ms, total_ms, query in rows:
+            query = ' '.join(query.split())
+            self.stdout.write(f"{mean_ms:>10.2f}ms (平均) × {calls}回 = {total_ms:.0f}ms")
+            self.stdout.write(f"    {query[:200]}{'...' if len(query) > 200 else ''}")
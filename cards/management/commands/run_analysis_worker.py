@@ -0,0 +1,69 @@
+"""
+一括登録の画像解析ジョブを処理するワーカー
+
+Webリクエストとは別プロセスで AnalysisJob を順に取り出し、
+YOLOによる検出からGeminiでの解析・マッピングまでを実行します。
+複数プロセスで起動しても同じジョブを二重に処理することはありません。
+
+Usage:
+    python manage.py run_analysis_worker
+    python manage.py run_analysis_worker --once   # 待機中のジョブを処理したら終了
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from cards.ai_analyzer import get_card_analyzer
+from cards.bulk_analysis import claim_next_job, delete_old_jobs, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = '一括登録の画像解析ジョブを処理します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='待機中のジョブがなくなったら終了する')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='ジョブがない場合の待機秒数')
+        parser.add_argument('--stale-seconds', type=int, default=900, help='解析中のまま更新がないジョブを再実行するまでの秒数')
+        parser.add_argument('--keep-days', type=int, default=1, help='終了したジョブを保持する日数')
+        parser.add_argument('--no-preload', action='store_true', help='起動時にYOLOモデルをロードしない')
+
+    def handle(self, *args, **options):
+        if not options['no_preload']:
+            # 最初のジョブでロード待ちが発生しないよう、起動時にモデルを読み込んでおく
+            get_card_analyzer().preload()
+
+        self.stdout.write(self.style.SUCCESS('✓ 画像解析ワーカーを起動しました。'))
+        last_maintenance = 0.0
+
+        try:
+            while True:
+                # 切断・再起動されたデータベースの接続を次のクエリの前に閉じる (Webリクエストの終了時と同じ処理)
+                close_old_connections()
+                try:
+                    # 定期メンテナンス (取り残されたジョブの再実行・古いジョブの削除)
+                    if time.monotonic() - last_maintenance > 60:
+                        requeued = requeue_stale_jobs(options['stale_seconds'])
+                        deleted = delete_old_jobs(options['keep_days'])
+                        if requeued or deleted:
+                            self.stdout.write(f'再実行: {requeued}件 / 削除: {deleted}件')
+                        last_maintenance = time.monotonic()
+
+                    job = claim_next_job()
+                    if job is None:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    self.stdout.write(f'ジョブを処理中: {job.pk}')
+                    process_job(job)
+                except DatabaseError as e:
+                    # データベースの一時的な障害でワーカーが終了し、ジョブが待機中のまま残らないよう、待ってから続ける
+                    self.stderr.write(self.style.ERROR(f'データベースのエラー: {e}'))
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write('画像解析ワーカーを終了しました。')
@@ -0,0 +1,64 @@
+"""
+CSVインポートのジョブを処理するワーカー
+
+Webリクエストとは別プロセスで CsvImportJob を順に取り出し、
+アップロードされたCSVをチャンクごとに取り込みます。
+処理済みの行数を記録しているため、停止したジョブは再起動後に続きから処理されます。
+複数プロセスで起動しても同じジョブを二重に処理することはありません。
+
+Usage:
+    python manage.py run_csv_import_worker
+    python manage.py run_csv_import_worker --once   # 待機中のジョブを処理したら終了
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from cards.csv_import_jobs import claim_next_job, delete_old_jobs, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'CSVインポートのジョブを処理します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='待機中のジョブがなくなったら終了する')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='ジョブがない場合の待機秒数')
+        parser.add_argument('--stale-seconds', type=int, default=900, help='取り込み中のまま更新がないジョブを再実行するまでの秒数')
+        parser.add_argument('--keep-days', type=int, default=1, help='終了したジョブを保持する日数')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('✓ CSVインポートワーカーを起動しました。'))
+        last_maintenance = 0.0
+
+        try:
+            while True:
+                # 切断・再起動されたデータベースの接続を次のクエリの前に閉じる (Webリクエストの終了時と同じ処理)
+                close_old_connections()
+                try:
+                    # 定期メンテナンス (取り残されたジョブの再実行・古いジョブの削除)
+                    if time.monotonic() - last_maintenance > 60:
+                        requeued = requeue_stale_jobs(options['stale_seconds'])
+                        deleted = delete_old_jobs(options['keep_days'])
+                        if requeued or deleted:
+                            self.stdout.write(f'再実行: {requeued}件 / 削除: {deleted}件')
+                        last_maintenance = time.monotonic()
+
+                    job = claim_next_job()
+                    if job is None:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    self.stdout.write(f'ジョブを処理中: {job.pk} ({job.original_name})')
+                    process_job(job)
+                except DatabaseError as e:
+                    # データベースの一時的な障害でワーカーが終了し、ジョブが待機中のまま残らないよう、待ってから続ける
+                    self.stderr.write(self.style.ERROR(f'データベースのエラー: {e}'))
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write('CSVインポートワーカーを終了しました。')
@@ -0,0 +1,76 @@
+"""
+マスタデータのプロセス内キャッシュ
+
+マスタ (カテゴリ・タイプ・進化段階など) は件数が少なく、ほとんど変更されないにもかかわらず、
+検索フォーム (FilterSet) の選択肢・AI解析結果の変換 (CardDataMapper)・関連カードの表示などで
+リクエストのたびに読み込まれていました。
+全マスタをワーカープロセスのメモリに保持し、これらはすべてここから参照します。
+
+マスタが変更されると、マスタデータのバージョン (cards.cache_versions) が更新されます
+(管理画面での編集・seed_master_data による投入はシグナルで自動的に反映されます)。
+参照時にバージョンを確認し、変わっていれば全マスタを読み直すため、他のワーカーの変更も反映されます。
+
+保持しているモデルのインスタンスはリクエスト間で共有されるため、読み取り専用として扱ってください。
+
+Usage:
+    from cards.master_data import get_master_data
+
+    master = get_master_data()
+    master.all(Type)                  # 表示順のリスト
+    master.by_name(EvolutionStage)    # {名前: インスタンス}
+    master.get(Type, pk)              # IDから取得 (存在しなければ None)
+    master.category('pokemon')        # スラッグからカテゴリを取得
+"""
+
+import threading
+
+from .cache_versions import get_master_version
+from .models import CardCategory, EvolutionStage, MoveType, SpecialFeature, SpecialTrainer, TrainerType, Type
+
+# 保持するマスタ (cards.signals.MASTER_MODELS と同じ)
+MODELS = (CardCategory, Type, EvolutionStage, SpecialFeature, MoveType, TrainerType, SpecialTrainer)
+
+
+class MasterData:
+    """ある時点のマスタデータ一式 (読み込み後は変更しない)"""
+
+    def __init__(self, version: str):
+        self.version = version
+        # 各モデルの既定の並び順 (Meta.ordering) で読み込む
+        self._objects = {model: list(model.objects.all()) for model in MODELS}
+        self._by_pk = {model: {obj.pk: obj for obj in objects} for model, objects in self._objects.items()}
+        self._by_name = {model: {obj.name: obj for obj in objects} for model, objects in self._objects.items()}
+
+    def all(self, model) -> list:
+        return self._objects[model]
+
+    def get(self, model, pk):
+        return self._by_pk[model].get(pk)
+
+    def by_pk(self, model) -> dict:
+        return self._by_pk[model]
+
+    def by_name(self, model) -> dict:
+        return self._by_name[model]
+
+    def category(self, slug: str):
+        """スラッグからカテゴリを取得する (存在しなければ None)"""
+        return next((obj for obj in self._objects[CardCategory] if obj.slug == slug), None)
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def get_master_data() -> MasterData:
+    """現在のマスタデータを返す (バージョンが変わっていれば読み直す)"""
+    global _current
+    version = get_master_version()
+    current = _current
+    if current is not None and current.version == version:
+        return current
+    with _lock:
+        if _current is None or _current.version != version:
+            _current = MasterData(version)
+        return _current
+
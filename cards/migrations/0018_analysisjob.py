@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0017_geminiapikeyusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('running', '解析中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=20, verbose_name='状態')),
+                ('stage', models.CharField(choices=[('queued', '受付'), ('detected', 'カード検出'), ('cropped', '切り抜き'), ('gridded', 'グリッド作成'), ('ai_parsed', 'AI解析'), ('mapped', 'データ変換')], default='queued', max_length=20, verbose_name='進捗')),
+                ('image_path', models.CharField(max_length=500, verbose_name='画像パス')),
+                ('image_url', models.CharField(max_length=500, verbose_name='画像URL')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='解析結果')),
+                ('error_code', models.CharField(blank=True, default='', max_length=50, verbose_name='エラー種別')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='エラー内容')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='試行回数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '画像解析ジョブ',
+                'verbose_name_plural': '画像解析ジョブ',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='cards_analy_status_ddd0d7_idx')],
+            },
+        ),
+    ]
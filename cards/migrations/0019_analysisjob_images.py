@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0018_analysisjob'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='analysisjob',
+            name='image_path',
+        ),
+        migrations.RemoveField(
+            model_name='analysisjob',
+            name='image_url',
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='images',
+            field=models.JSONField(default=list, verbose_name='画像'),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='processed_images',
+            field=models.PositiveIntegerField(default=0, verbose_name='AI解析済み画像数'),
+        ),
+    ]
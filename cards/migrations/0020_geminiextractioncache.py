@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0019_analysisjob_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeminiExtractionCache',
+            fields=[
+                ('cache_key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='キャッシュキー')),
+                ('kind', models.CharField(choices=[('crop', 'カード (切り抜き画像)'), ('grid', 'グリッド画像')], max_length=10, verbose_name='種別')),
+                ('data', models.JSONField(verbose_name='抽出結果')),
+                ('hit_count', models.PositiveIntegerField(default=0, verbose_name='ヒット回数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='最終利用日時')),
+            ],
+            options={
+                'verbose_name': 'Gemini抽出結果キャッシュ',
+                'verbose_name_plural': 'Gemini抽出結果キャッシュ',
+                'db_table': 'gemini_extraction_cache',
+                'indexes': [models.Index(fields=['last_used_at'], name='gemini_extr_last_us_ef41e9_idx')],
+            },
+        ),
+    ]
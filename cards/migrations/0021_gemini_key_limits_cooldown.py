@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0020_geminiextractioncache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geminiapikeyusage',
+            name='cooldown_until',
+            field=models.DateTimeField(blank=True, help_text='利用制限 (ResourceExhausted) を受けたキーは、この日時まで使用しません', null=True, verbose_name='一時停止期限'),
+        ),
+        migrations.AddField(
+            model_name='geminiapikeyusage',
+            name='daily_limit',
+            field=models.IntegerField(default=20, help_text='GEMINI_DAILY_LIMIT / GEMINI_API_KEY_n_DAILY_LIMIT の設定値が反映されます', verbose_name='1日の使用上限'),
+        ),
+    ]
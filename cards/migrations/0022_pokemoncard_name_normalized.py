@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:35
+
+import unicodedata
+
+from django.db import migrations, models, transaction
+
+TRGM_INDEX_NAME = 'cards_pokemoncard_name_norm_trgm'
+
+# カタカナ (ァ-ヶ・ヽヾ) → ひらがな (jaconv.kata2hira と同じ変換)
+KATAKANA_TO_HIRAGANA = {
+    code: code - 0x60 for code in [*range(0x30A1, 0x30F7), 0x30FD, 0x30FE]
+}
+
+
+def normalize_card_name(text):
+    """
+    このマイグレーションの時点の cards.query_builder.normalize_card_name
+
+    以降に正規化を変更しても、このマイグレーションの処理が変わらないよう、アプリのコードを参照せずに固定する。
+    """
+    if not text:
+        return ''
+    return unicodedata.normalize('NFKC', text).translate(KATAKANA_TO_HIRAGANA).lower()
+
+
+def fill_name_normalized(apps, schema_editor):
+    """既存カードの検索用カード名を設定する"""
+    PokemonCard = apps.get_model('cards', 'PokemonCard')
+    batch = []
+    for card in PokemonCard.objects.only('id', 'name').iterator(chunk_size=1000):
+        card.name_normalized = normalize_card_name(card.name)
+        batch.append(card)
+        if len(batch) >= 1000:
+            PokemonCard.objects.bulk_update(batch, ['name_normalized'])
+            batch = []
+    if batch:
+        PokemonCard.objects.bulk_update(batch, ['name_normalized'])
+
+
+def create_trgm_index(apps, schema_editor):
+    """
+    PostgreSQLの場合のみ、部分一致検索用の pg_trgm GINインデックスを作成する
+
+    pg_trgm 拡張を作成できない環境 (contribが含まれないPostgreSQLなど) ではインデックスを作成せずに続行する
+    (検索結果は変わらず、速度のみ低下する)。
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except Exception as e:
+        print(f"\n  pg_trgm を有効にできないため、トライグラムインデックスの作成をスキップします: {e}")
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRGM_INDEX_NAME} '
+        f'ON cards_pokemoncard USING gin (name_normalized gin_trgm_ops)'
+    )
+
+
+def drop_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRGM_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0021_gemini_key_limits_cooldown'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemoncard',
+            name='name_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='カード名称 (検索用)'),
+        ),
+        migrations.RunPython(fill_name_normalized, migrations.RunPython.noop),
+        migrations.RunPython(create_trgm_index, drop_trgm_index),
+    ]
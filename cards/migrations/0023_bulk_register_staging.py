@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0022_pokemoncard_name_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkRegisterBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+            options={
+                'verbose_name': '一括登録バッチ',
+                'verbose_name_plural': '一括登録バッチ',
+                'indexes': [models.Index(fields=['created_at'], name='cards_bulkr_created_2fea26_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BulkRegisterItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.CharField(max_length=36, verbose_name='アイテムID')),
+                ('position', models.PositiveIntegerField(verbose_name='表示順')),
+                ('data', models.JSONField(verbose_name='データ')),
+                ('is_excluded', models.BooleanField(default=False, verbose_name='除外')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='cards.bulkregisterbatch', verbose_name='バッチ')),
+            ],
+            options={
+                'verbose_name': '一括登録アイテム',
+                'verbose_name_plural': '一括登録アイテム',
+                'ordering': ['batch', 'position'],
+                'constraints': [models.UniqueConstraint(fields=('batch', 'item_id'), name='unique_bulk_register_item')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:04
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0023_bulk_register_staging'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CsvImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('running', '取り込み中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=20, verbose_name='状態')),
+                ('mode', models.CharField(choices=[('atomic', 'すべて取り込むか、まったく取り込まない'), ('chunked', 'チャンクごとに確定する')], default='atomic', max_length=20, verbose_name='方式')),
+                ('stage', models.CharField(choices=[('queued', '受付'), ('validating', '検査'), ('importing', '取り込み')], default='queued', max_length=20, verbose_name='進捗')),
+                ('file_path', models.CharField(max_length=500, verbose_name='ファイル')),
+                ('original_name', models.CharField(blank=True, default='', max_length=255, verbose_name='元のファイル名')),
+                ('headers', models.JSONField(default=list, verbose_name='ヘッダー')),
+                ('chunk_size', models.PositiveIntegerField(default=1000, verbose_name='チャンクの行数')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='全行数')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='処理済み行数')),
+                ('new_count', models.PositiveIntegerField(default=0, verbose_name='新規登録')),
+                ('update_count', models.PositiveIntegerField(default=0, verbose_name='更新')),
+                ('skip_count', models.PositiveIntegerField(default=0, verbose_name='変更なし')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='エラー行数')),
+                ('error_messages', models.JSONField(default=list, verbose_name='エラー内容 (行)')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='エラー内容')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='試行回数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'CSVインポートジョブ',
+                'verbose_name_plural': 'CSVインポートジョブ',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='cards_csvim_status_511f91_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CsvImportStagingRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.PositiveIntegerField(verbose_name='行番号')),
+                ('values', models.JSONField(verbose_name='値')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staging_rows', to='cards.csvimportjob', verbose_name='ジョブ')),
+            ],
+            options={
+                'verbose_name': 'CSVインポート一時データ',
+                'verbose_name_plural': 'CSVインポート一時データ',
+                'constraints': [models.UniqueConstraint(fields=('job', 'row_number'), name='unique_csv_import_staging_row')],
+            },
+        ),
+    ]
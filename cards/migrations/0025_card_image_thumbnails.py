@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0024_csv_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemoncard',
+            name='image_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='縮小画像'),
+        ),
+    ]
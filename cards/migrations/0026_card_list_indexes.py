@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+# HP・にげるの降順 (未設定は末尾) 用のインデックス (PostgreSQLのみ)
+DESC_INDEXES = {
+    'card_category_hp_desc_idx': 'hp',
+    'card_category_retreat_desc_idx': 'retreat_cost',
+}
+
+
+def create_desc_indexes(apps, schema_editor):
+    """
+    PostgreSQLの場合のみ、HP・にげるの降順用のインデックスを作成する
+
+    降順でも未設定のカードを末尾に並べる (DESC NULLS LAST) ため、昇順のインデックスを逆向きに読むことができない。
+    SQLiteはインデックスに NULLS LAST を指定できないため作成しない。
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in DESC_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} '
+            f'ON cards_pokemoncard (category_id, {column} DESC NULLS LAST, id DESC)'
+        )
+
+
+def drop_desc_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in DESC_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0025_card_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['category', 'name', 'id'], name='card_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['category', 'quantity', 'id'], name='card_category_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['category', 'hp', 'id'], name='card_category_hp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['category', 'retreat_cost', 'id'], name='card_category_retreat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='card_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['category', 'updated_at', 'id'], name='card_category_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['name'], name='card_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemoncard',
+            index=models.Index(fields=['evolves_from'], name='card_evolves_from_idx'),
+        ),
+        migrations.RunPython(create_desc_indexes, drop_desc_indexes),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# ManyToManyの項目 → ビットマスクの列 (cards.search_documents.MASK_FIELDS と同じ)
+MASK_FIELDS = {
+    'types': 'types_mask',
+    'weakness': 'weakness_mask',
+    'resistance': 'resistance_mask',
+    'special_features': 'special_features_mask',
+    'move_types': 'move_types_mask',
+    'special_trainers': 'special_trainers_mask',
+}
+MAX_BIT = 62
+
+
+def create_documents(apps, schema_editor):
+    """既存のカードの検索用ドキュメントを作成する"""
+    PokemonCard = apps.get_model('cards', 'PokemonCard')
+    CardSearchDocument = apps.get_model('cards', 'CardSearchDocument')
+    masks = {card_id: dict.fromkeys(MASK_FIELDS.values(), 0) for card_id in PokemonCard.objects.values_list('pk', flat=True)}
+    for attribute, mask_field in MASK_FIELDS.items():
+        m2m_field = PokemonCard._meta.get_field(attribute)
+        through = m2m_field.remote_field.through
+        source_column = f'{m2m_field.m2m_field_name()}_id'
+        target_column = f'{m2m_field.m2m_reverse_field_name()}_id'
+        for card_id, target_id in through.objects.values_list(source_column, target_column).iterator():
+            if card_id in masks and 0 <= target_id <= MAX_BIT:
+                masks[card_id][mask_field] |= 1 << target_id
+    CardSearchDocument.objects.bulk_create(
+        [CardSearchDocument(card_id=card_id, **values) for card_id, values in masks.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0026_card_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardSearchDocument',
+            fields=[
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='cards.pokemoncard', verbose_name='カード')),
+                ('types_mask', models.BigIntegerField(default=0, verbose_name='タイプ')),
+                ('weakness_mask', models.BigIntegerField(default=0, verbose_name='弱点')),
+                ('resistance_mask', models.BigIntegerField(default=0, verbose_name='抵抗力')),
+                ('special_features_mask', models.BigIntegerField(default=0, verbose_name='特別')),
+                ('move_types_mask', models.BigIntegerField(default=0, verbose_name='わざのエネルギータイプ')),
+                ('special_trainers_mask', models.BigIntegerField(default=0, verbose_name='特別な分類')),
+            ],
+            options={
+                'verbose_name': 'カードの検索用ドキュメント',
+                'verbose_name_plural': 'カードの検索用ドキュメント',
+            },
+        ),
+        migrations.RunPython(create_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# cards.aggregates と同じ集計の項目
+FOREIGN_KEY_DIMENSIONS = {'category': 'category', 'evolution_stage': 'evolution_stage', 'trainer_type': 'trainer_type'}
+RELATION_DIMENSIONS = {'types': 'type', 'special_features': 'special_feature', 'special_trainers': 'special_trainer'}
+HP_BUCKET_SIZE = 50
+
+
+def create_aggregates(apps, schema_editor):
+    """既存のカードを集計する"""
+    PokemonCard = apps.get_model('cards', 'PokemonCard')
+    CollectionAggregate = apps.get_model('cards', 'CollectionAggregate')
+    CollectionAggregateState = apps.get_model('cards', 'CollectionAggregateState')
+
+    cards = {}
+    rows = PokemonCard.objects.values_list('pk', 'quantity', *[f'{name}_id' for name in FOREIGN_KEY_DIMENSIONS], 'hp')
+    for card_id, quantity, *foreign_keys, hp in rows.iterator():
+        keys = {
+            (dimension, target_id)
+            for dimension, target_id in zip(FOREIGN_KEY_DIMENSIONS.values(), foreign_keys)
+            if target_id is not None
+        }
+        if hp is not None and hp >= 0:
+            keys.add(('hp', hp // HP_BUCKET_SIZE * HP_BUCKET_SIZE))
+        cards[card_id] = (quantity, keys)
+    for attribute, dimension in RELATION_DIMENSIONS.items():
+        m2m_field = PokemonCard._meta.get_field(attribute)
+        through = m2m_field.remote_field.through
+        source_column = f'{m2m_field.m2m_field_name()}_id'
+        target_column = f'{m2m_field.m2m_reverse_field_name()}_id'
+        for card_id, target_id in through.objects.values_list(source_column, target_column).iterator():
+            if card_id in cards:
+                cards[card_id][1].add((dimension, target_id))
+
+    totals = defaultdict(lambda: [0, 0])
+    for quantity, keys in cards.values():
+        for key in keys:
+            totals[key][0] += 1
+            totals[key][1] += quantity
+    CollectionAggregate.objects.bulk_create(
+        [CollectionAggregate(dimension=dimension, key=key, cards=c, copies=q) for (dimension, key), (c, q) in totals.items()],
+        batch_size=1000,
+    )
+    CollectionAggregateState.objects.bulk_create(
+        [
+            CollectionAggregateState(card_id=card_id, quantity=quantity, keys=sorted(map(list, keys)))
+            for card_id, (quantity, keys) in cards.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0027_card_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionAggregateState',
+            fields=[
+                ('card_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='カードのID')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='所持枚数')),
+                ('keys', models.JSONField(default=list, verbose_name='集計の項目と値')),
+            ],
+            options={
+                'verbose_name': 'カードの集計済みの内容',
+                'verbose_name_plural': 'カードの集計済みの内容',
+            },
+        ),
+        migrations.CreateModel(
+            name='CollectionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=32, verbose_name='集計の項目')),
+                ('key', models.IntegerField(verbose_name='値')),
+                ('cards', models.IntegerField(default=0, verbose_name='種類数')),
+                ('copies', models.BigIntegerField(default=0, verbose_name='所持枚数')),
+            ],
+            options={
+                'verbose_name': 'コレクションの集計',
+                'verbose_name_plural': 'コレクションの集計',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='unique_collection_aggregate')],
+            },
+        ),
+        migrations.RunPython(create_aggregates, migrations.RunPython.noop),
+    ]
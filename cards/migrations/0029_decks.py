@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0028_collection_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='デッキ名')),
+                ('memo', models.TextField(blank=True, default='', verbose_name='メモ')),
+                ('is_allocated', models.BooleanField(default=False, help_text='組んでいるデッキのカードは、他のデッキで使用できない枚数として数えます', verbose_name='組んでいる')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'デッキ',
+                'verbose_name_plural': 'デッキ',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeckEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='カード名称')),
+                ('name_normalized', models.CharField(editable=False, max_length=255, verbose_name='カード名称 (検索用)')),
+                ('quantity', models.PositiveIntegerField(verbose_name='枚数')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='表示順')),
+                ('deck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='cards.deck', verbose_name='デッキ')),
+            ],
+            options={
+                'verbose_name': 'デッキのカード',
+                'verbose_name_plural': 'デッキのカード',
+                'ordering': ['deck', 'position'],
+                'indexes': [models.Index(fields=['name_normalized'], name='deck_entry_name_idx')],
+                'constraints': [models.UniqueConstraint(fields=('deck', 'name_normalized'), name='unique_deck_entry_name')],
+            },
+        ),
+    ]
@@ -1,7 +1,11 @@
 import os
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.db import models
+from django.utils import timezone
+
+from .query_builder import normalize_card_name
+from .thumbnails import generate_thumbnails, is_up_to_date
 
 
 def card_image_upload_to(instance, filename):
@@ -121,8 +125,12 @@ class PokemonCard(models.Model):
     """ポケモンカード・トレーナーズカード統合モデル"""
     # === 共通フィールド ===
     name = models.CharField("カード名称", max_length=100)
+    # 検索用に正規化したカード名 (save時に自動設定。bulk_create等で保存する場合は normalize_card_name で設定する)
+    name_normalized = models.CharField("カード名称 (検索用)", max_length=255, blank=True, default='', editable=False)
     quantity = models.PositiveIntegerField("所持枚数", default=1)
     image = models.ImageField("画像", upload_to=card_image_upload_to, null=True, blank=True)
+    # 一覧表示用の縮小画像の情報 (cards.thumbnails。画像の保存時に自動で生成する)
+    image_thumbnails = models.JSONField("縮小画像", default=dict, blank=True, editable=False)
     memo = models.TextField("メモ", null=True, blank=True)
 
     # === カテゴリ ===
@@ -178,10 +186,128 @@ class PokemonCard(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_card_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
+        saves_image = update_fields is None or 'image' in update_fields
+        if saves_image and not self.image:
+            self.image_thumbnails = {}
+        super().save(*args, **kwargs)
+
+        # 画像が追加・変更された場合のみ縮小画像を生成する (画像のファイルは super().save() で保存される)
+        # 生成済みの縮小画像が古い命名規則のものなどは generate_card_thumbnails コマンドで作り直す
+        if saves_image and self.image and self.image.name != self._loaded_image_name:
+            if not is_up_to_date(self.image_thumbnails, self.image.name):
+                self.image_thumbnails = generate_thumbnails(self.image.name)
+                PokemonCard.objects.filter(pk=self.pk).update(image_thumbnails=self.image_thumbnails)
+        if saves_image:
+            self._loaded_image_name = self.image.name if self.image else None
+
+    # 読み込んだときの画像のパス (save() で画像が変更されたかを判定する。新規作成・画像を読み込んでいない場合は None)
+    _loaded_image_name = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._loaded_image_name = values[field_names.index('image')] or None
+        return instance
+
     class Meta:
         ordering = ['name']
         verbose_name = "カード"
         verbose_name_plural = "カード"
+        indexes = [
+            # 一覧はカテゴリで絞り込み、並び替えの項目 → id の順に先頭から取得する (cards.pagination)
+            # 降順はインデックスを逆向きに読む
+            models.Index(fields=['category', 'name', 'id'], name='card_category_name_idx'),
+            models.Index(fields=['category', 'quantity', 'id'], name='card_category_quantity_idx'),
+            models.Index(fields=['category', 'hp', 'id'], name='card_category_hp_idx'),
+            models.Index(fields=['category', 'retreat_cost', 'id'], name='card_category_retreat_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='card_category_created_idx'),
+            models.Index(fields=['category', 'updated_at', 'id'], name='card_category_updated_idx'),
+            # HP・にげるは降順でも未設定を末尾に並べるため逆向きには読めず、降順用のインデックスを
+            # PostgreSQLの場合のみマイグレーション (0026) で作成する (SQLiteはインデックスに NULLS LAST を指定できないため)
+            # 進化系統の探索 (cards.utils) でカード名・進化元から検索する
+            models.Index(fields=['name'], name='card_name_idx'),
+            models.Index(fields=['evolves_from'], name='card_evolves_from_idx'),
+        ]
+
+class CardSearchDocument(models.Model):
+    """
+    カードの絞り込み・一覧表示用のドキュメント (cards.search_documents)
+
+    ManyToMany (タイプ・弱点など) を、マスタのIDをビットの位置とするビットマスクで1行に保持します。
+    一覧の絞り込みを中間テーブルの結合や DISTINCT なしで行い、表示するマスタの名前・色は
+    マスタデータのキャッシュ (cards.master_data) からビットマスクをもとに求めます。
+    カードの保存・ManyToManyの変更はシグナルで、一括登録・CSVインポートは直接反映します。
+    """
+    card = models.OneToOneField(
+        PokemonCard,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name="カード"
+    )
+    types_mask = models.BigIntegerField("タイプ", default=0)
+    weakness_mask = models.BigIntegerField("弱点", default=0)
+    resistance_mask = models.BigIntegerField("抵抗力", default=0)
+    special_features_mask = models.BigIntegerField("特別", default=0)
+    move_types_mask = models.BigIntegerField("わざのエネルギータイプ", default=0)
+    special_trainers_mask = models.BigIntegerField("特別な分類", default=0)
+
+    def __str__(self):
+        return f"{self.card_id}"
+
+    class Meta:
+        verbose_name = "カードの検索用ドキュメント"
+        verbose_name_plural = "カードの検索用ドキュメント"
+
+
+class CollectionAggregate(models.Model):
+    """
+    コレクションの集計 (cards.aggregates)
+
+    集計の項目 (タイプ・進化段階・HPの区間など) と値ごとに、カードの種類数と所持枚数を保持します。
+    カードの変更時に差分だけを加減算するため、統計の表示時にカード全体を集計し直す必要はありません。
+    """
+    dimension = models.CharField("集計の項目", max_length=32)
+    # マスタのID、またはHPの区間の下限
+    key = models.IntegerField("値")
+    cards = models.IntegerField("種類数", default=0)
+    copies = models.BigIntegerField("所持枚数", default=0)
+
+    def __str__(self):
+        return f"{self.dimension}:{self.key}"
+
+    class Meta:
+        verbose_name = "コレクションの集計"
+        verbose_name_plural = "コレクションの集計"
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='unique_collection_aggregate'),
+        ]
+
+
+class CollectionAggregateState(models.Model):
+    """
+    カードごとの集計済みの内容 (cards.aggregates)
+
+    カードを集計に加えたときの所持枚数と集計の項目・値を保持し、次の変更時の差分の計算に使います。
+    カードの削除後も集計から差し引けるよう、カードへの外部キーではなくIDで保持します。
+    """
+    card_id = models.BigIntegerField("カードのID", primary_key=True)
+    quantity = models.PositiveIntegerField("所持枚数", default=0)
+    # [[集計の項目, 値], ...]
+    keys = models.JSONField("集計の項目と値", default=list)
+
+    def __str__(self):
+        return f"{self.card_id}"
+
+    class Meta:
+        verbose_name = "カードの集計済みの内容"
+        verbose_name_plural = "カードの集計済みの内容"
 
 class GeminiApiKeyUsage(models.Model):
     """Gemini API KEYの使用状況を管理するモデル"""
@@ -199,6 +325,17 @@ class GeminiApiKeyUsage(models.Model):
         auto_now_add=True,
         verbose_name='最終リセット日'
     )
+    daily_limit = models.IntegerField(
+        default=20,
+        verbose_name='1日の使用上限',
+        help_text='GEMINI_DAILY_LIMIT / GEMINI_API_KEY_n_DAILY_LIMIT の設定値が反映されます'
+    )
+    cooldown_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='一時停止期限',
+        help_text='利用制限 (ResourceExhausted) を受けたキーは、この日時まで使用しません'
+    )
     updated_at = models.DateTimeField(
         auto_now=True,
         verbose_name='最終更新日時'
@@ -210,4 +347,326 @@ class GeminiApiKeyUsage(models.Model):
         verbose_name_plural = 'Gemini API KEY使用状況'
 
     def __str__(self):
-        return f"Key {self.key_index + 1}: {self.usage_count}/20 (最終更新: {self.last_reset_date})"
\ No newline at end of file
+        return f"Key {self.key_index + 1}: {self.usage_count}/{self.daily_limit} (最終更新: {self.last_reset_date})"
+
+class GeminiExtractionCache(models.Model):
+    """
+    Geminiの抽出結果キャッシュ
+
+    カード切り抜き画像の画素のハッシュ (または送信したグリッド画像のハッシュ) をキーに、
+    パース済みの抽出結果を保存します。同じカードを再アップロードした場合にAPI呼び出しを省略するために使用します。
+    """
+
+    KIND_CROP = 'crop'
+    KIND_GRID = 'grid'
+    KIND_CHOICES = [
+        (KIND_CROP, 'カード (切り抜き画像)'),
+        (KIND_GRID, 'グリッド画像'),
+    ]
+
+    # 種別:プロンプト版:画像ハッシュ
+    cache_key = models.CharField("キャッシュキー", max_length=100, primary_key=True)
+    kind = models.CharField("種別", max_length=10, choices=KIND_CHOICES)
+    # crop: カード1枚分の抽出結果 (dict) / grid: グリッド内の全カードの抽出結果 (list)
+    data = models.JSONField("抽出結果")
+    hit_count = models.PositiveIntegerField("ヒット回数", default=0)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    last_used_at = models.DateTimeField("最終利用日時", default=timezone.now)
+
+    class Meta:
+        db_table = 'gemini_extraction_cache'
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+        verbose_name = "Gemini抽出結果キャッシュ"
+        verbose_name_plural = "Gemini抽出結果キャッシュ"
+
+    def __str__(self):
+        return self.cache_key
+
+
+class AnalysisJob(models.Model):
+    """一括登録用の画像解析ジョブ (run_analysis_worker コマンドが処理する)"""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '待機中'),
+        (STATUS_RUNNING, '解析中'),
+        (STATUS_DONE, '完了'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    # 解析の進捗段階 (この順に進む)
+    STAGE_QUEUED = 'queued'
+    STAGE_DETECTED = 'detected'
+    STAGE_CROPPED = 'cropped'
+    STAGE_GRIDDED = 'gridded'
+    STAGE_AI_PARSED = 'ai_parsed'
+    STAGE_MAPPED = 'mapped'
+    STAGE_CHOICES = [
+        (STAGE_QUEUED, '受付'),
+        (STAGE_DETECTED, 'カード検出'),
+        (STAGE_CROPPED, '切り抜き'),
+        (STAGE_GRIDDED, 'グリッド作成'),
+        (STAGE_AI_PARSED, 'AI解析'),
+        (STAGE_MAPPED, 'データ変換'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField("状態", max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    stage = models.CharField("進捗", max_length=20, choices=STAGE_CHOICES, default=STAGE_QUEUED)
+    # 解析対象の画像 ([{'path': 絶対パス, 'url': メディアURL}, ...])
+    images = models.JSONField("画像", default=list)
+    processed_images = models.PositiveIntegerField("AI解析済み画像数", default=0)
+    result = models.JSONField("解析結果", null=True, blank=True)
+    error_code = models.CharField("エラー種別", max_length=50, blank=True, default='')
+    error_message = models.TextField("エラー内容", blank=True, default='')
+    attempts = models.PositiveIntegerField("試行回数", default=0)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    started_at = models.DateTimeField("開始日時", null=True, blank=True)
+    finished_at = models.DateTimeField("終了日時", null=True, blank=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        verbose_name = "画像解析ジョブ"
+        verbose_name_plural = "画像解析ジョブ"
+
+    def __str__(self):
+        return f"{self.id} ({self.get_status_display()} / {self.get_stage_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def image_count(self):
+        return len(self.images)
+
+
+class BulkRegisterBatch(models.Model):
+    """
+    一括登録のプレビュー中のデータ (解析結果1回分)
+
+    セッションにはバッチのIDのみを保存し、カードごとのデータは BulkRegisterItem に保存します。
+    """
+
+    # この時間を過ぎた未登録のバッチは、新しいバッチの作成時に削除する
+    EXPIRE_HOURS = 24
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+        verbose_name = "一括登録バッチ"
+        verbose_name_plural = "一括登録バッチ"
+
+    def __str__(self):
+        return f"{self.id} ({self.created_at:%Y-%m-%d %H:%M})"
+
+    @classmethod
+    def create_with_items(cls, items: list) -> 'BulkRegisterBatch':
+        """解析結果のカード (map_analysis_items の戻り値) からバッチを作成する"""
+        cls.objects.filter(created_at__lt=timezone.now() - timedelta(hours=cls.EXPIRE_HOURS)).delete()
+        batch = cls.objects.create()
+        BulkRegisterItem.objects.bulk_create([
+            BulkRegisterItem(
+                batch=batch,
+                item_id=item['id'],
+                position=position,
+                data=item,
+                is_excluded=item.get('is_excluded', False),
+            )
+            for position, item in enumerate(items)
+        ])
+        return batch
+
+
+class BulkRegisterItem(models.Model):
+    """一括登録のプレビュー中のカード1枚分のデータ"""
+
+    batch = models.ForeignKey(
+        BulkRegisterBatch,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name="バッチ",
+    )
+    # プレビュー画面でカードを識別するID (解析結果の id)
+    item_id = models.CharField("アイテムID", max_length=36)
+    position = models.PositiveIntegerField("表示順")
+    # 解析結果 (カード名・各項目のID・表示用の名称や色など)
+    data = models.JSONField("データ")
+    is_excluded = models.BooleanField("除外", default=False)
+
+    class Meta:
+        ordering = ['batch', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'item_id'], name='unique_bulk_register_item'),
+        ]
+        verbose_name = "一括登録アイテム"
+        verbose_name_plural = "一括登録アイテム"
+
+    def __str__(self):
+        return f"{self.data.get('name') or '名称不明'} ({self.batch_id})"
+
+    def as_preview(self) -> dict:
+        """プレビュー表示用のデータ (除外状態を含む)"""
+        return dict(self.data, is_excluded=self.is_excluded)
+
+
+class CsvImportJob(models.Model):
+    """
+    CSVインポートのジョブ (run_csv_import_worker コマンドが処理する)
+
+    CSVはチャンクごとに読み込み、処理済みの行数 (processed_rows) をチェックポイントとして記録します。
+    失敗・中断したジョブは、チェックポイントから再開できます。
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '待機中'),
+        (STATUS_RUNNING, '取り込み中'),
+        (STATUS_DONE, '完了'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    # atomic: 全行を検査して一時テーブルに保存した後、1つのトランザクションで取り込む (1件でもエラーがあれば何も保存しない)
+    # chunked: チャンクごとに取り込んで確定する (エラーのあったチャンクの手前までは保存される)
+    MODE_ATOMIC = 'atomic'
+    MODE_CHUNKED = 'chunked'
+    MODE_CHOICES = [
+        (MODE_ATOMIC, 'すべて取り込むか、まったく取り込まない'),
+        (MODE_CHUNKED, 'チャンクごとに確定する'),
+    ]
+
+    STAGE_QUEUED = 'queued'
+    STAGE_VALIDATING = 'validating'
+    STAGE_IMPORTING = 'importing'
+    STAGE_CHOICES = [
+        (STAGE_QUEUED, '受付'),
+        (STAGE_VALIDATING, '検査'),
+        (STAGE_IMPORTING, '取り込み'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField("状態", max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    mode = models.CharField("方式", max_length=20, choices=MODE_CHOICES, default=MODE_ATOMIC)
+    stage = models.CharField("進捗", max_length=20, choices=STAGE_CHOICES, default=STAGE_QUEUED)
+    file_path = models.CharField("ファイル", max_length=500)
+    original_name = models.CharField("元のファイル名", max_length=255, blank=True, default='')
+    headers = models.JSONField("ヘッダー", default=list)
+    chunk_size = models.PositiveIntegerField("チャンクの行数", default=1000)
+    total_rows = models.PositiveIntegerField("全行数", null=True, blank=True)
+    # チェックポイント (検査または取り込みが完了した行数)
+    processed_rows = models.PositiveIntegerField("処理済み行数", default=0)
+    new_count = models.PositiveIntegerField("新規登録", default=0)
+    update_count = models.PositiveIntegerField("更新", default=0)
+    skip_count = models.PositiveIntegerField("変更なし", default=0)
+    error_count = models.PositiveIntegerField("エラー行数", default=0)
+    error_messages = models.JSONField("エラー内容 (行)", default=list)
+    error_message = models.TextField("エラー内容", blank=True, default='')
+    attempts = models.PositiveIntegerField("試行回数", default=0)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    started_at = models.DateTimeField("開始日時", null=True, blank=True)
+    finished_at = models.DateTimeField("終了日時", null=True, blank=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        verbose_name = "CSVインポートジョブ"
+        verbose_name_plural = "CSVインポートジョブ"
+
+    def __str__(self):
+        return f"{self.original_name or self.id} ({self.get_status_display()} / {self.processed_rows}行)"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def progress_percent(self):
+        if not self.total_rows:
+            return 0
+        return min(100, self.processed_rows * 100 // self.total_rows)
+
+
+class CsvImportStagingRow(models.Model):
+    """CSVインポート (atomic方式) で、検査済みの行を取り込みまで保持する一時テーブル"""
+
+    job = models.ForeignKey(CsvImportJob, on_delete=models.CASCADE, related_name='staging_rows', verbose_name="ジョブ")
+    row_number = models.PositiveIntegerField("行番号")
+    values = models.JSONField("値")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'row_number'], name='unique_csv_import_staging_row'),
+        ]
+        verbose_name = "CSVインポート一時データ"
+        verbose_name_plural = "CSVインポート一時データ"
+
+
+class Deck(models.Model):
+    """
+    デッキ (cards.decks)
+
+    カードは名前 (正規化したカード名) で所持しているカードと対応付けます。
+    「組んでいる」デッキのカードは、他のデッキを組めるかの確認で使用中の枚数として数えます。
+    """
+    name = models.CharField("デッキ名", max_length=100)
+    memo = models.TextField("メモ", blank=True, default='')
+    is_allocated = models.BooleanField(
+        "組んでいる", default=False, help_text="組んでいるデッキのカードは、他のデッキで使用できない枚数として数えます"
+    )
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+        verbose_name = "デッキ"
+        verbose_name_plural = "デッキ"
+
+    def __str__(self):
+        return self.name
+
+
+class DeckEntry(models.Model):
+    """デッキのカード (カード名ごとの枚数)"""
+    deck = models.ForeignKey(Deck, on_delete=models.CASCADE, related_name='entries', verbose_name="デッキ")
+    name = models.CharField("カード名称", max_length=100)
+    # 所持しているカードとの対応付け用に正規化したカード名 (save時に自動設定)
+    name_normalized = models.CharField("カード名称 (検索用)", max_length=255, editable=False)
+    quantity = models.PositiveIntegerField("枚数")
+    position = models.PositiveIntegerField("表示順", default=0)
+
+    class Meta:
+        ordering = ['deck', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['deck', 'name_normalized'], name='unique_deck_entry_name'),
+        ]
+        indexes = [
+            models.Index(fields=['name_normalized'], name='deck_entry_name_idx'),
+        ]
+        verbose_name = "デッキのカード"
+        verbose_name_plural = "デッキのカード"
+
+    def __str__(self):
+        return f"{self.name} ×{self.quantity}"
+
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_card_name(self.name)
+        super().save(*args, **kwargs)
@@ -0,0 +1,212 @@
+"""
+カード一覧のキーセット (カーソル) ページネーション
+
+OFFSET によるページ送りは、ページが進むほど読み飛ばす行が増えて遅くなり、
+ページごとに COUNT(*) も実行されます。
+キーセット方式では「前のページの最後のカードの並び替えキーと id」より後ろのカードを
+インデックスで直接取得するため、何ページ目でも同じ速さで表示できます。
+
+並び順は 並び替えキー (未設定は常に末尾) → id で一意に決まります。id は並び替えキーと同じ向きに並べるため、
+カテゴリ・並び替えキー・id の複合インデックス (PokemonCard.Meta.indexes) を降順でもそのまま (逆向きに) 読めます。
+"""
+
+import base64
+import binascii
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import F, Q
+
+logger = logging.getLogger(__name__)
+
+SORT_VALUE_ALIAS = '_keyset_value'
+
+# 推定件数がこの件数未満の場合は、正確な件数を数え直す (少ない件数の推定誤差は目立つため)
+EXACT_COUNT_THRESHOLD = 1000
+
+
+class KeysetPage:
+    """キーセットページネーションの1ページ分の結果"""
+
+    def __init__(self, object_list, next_cursor, total=None, total_is_approximate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.total = total
+        self.total_is_approximate = total_is_approximate
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    クエリセットを並び替えキーと id でページ分割するクラス
+
+    Args:
+        queryset: 絞り込み済みのクエリセット
+        ordering: 並び替え指定 (例: 'name', '-hp', 'evolution_stage__display_order')。
+                  None の場合はモデルの既定の並び順を使用する
+        per_page: 1ページあたりの件数
+    """
+
+    def __init__(self, queryset, ordering: str = None, per_page: int = 20):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field_path, self.descending = self._resolve_ordering(queryset.model, ordering)
+        self.field = self._resolve_field(queryset.model, self.field_path)
+        self.nullable = self._is_nullable(queryset.model, self.field_path)
+
+    def get_page(self, cursor: str = None, count_mode: str = 'none') -> KeysetPage:
+        """
+        カーソルの次のページを取得する
+
+        Args:
+            cursor: 前のページの next_cursor。None の場合は先頭ページ
+            count_mode: 合計件数の取得方法 ('approximate' / 'exact' / 'none')。先頭ページでのみ取得する
+        """
+        rows = list(self.page_queryset(cursor))
+
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last = rows[-1]
+            next_cursor = self.encode_cursor(getattr(last, SORT_VALUE_ALIAS), last.pk)
+
+        total, approximate = None, False
+        if cursor is None and count_mode != 'none':
+            if count_mode == 'approximate':
+                total, approximate = approximate_count(self.queryset)
+            else:
+                total = self.queryset.count()
+        return KeysetPage(rows, next_cursor, total, approximate)
+
+    def page_queryset(self, cursor: str = None):
+        """カーソルの次のページを取得するクエリセット (次のページの有無を COUNT(*) なしで判定するため、1件多く取得する)"""
+        position = self.decode_cursor(cursor) if cursor else None
+        queryset = self.queryset.annotate(**{SORT_VALUE_ALIAS: F(self.field_path)})
+        if position is not None:
+            queryset = queryset.filter(self._after(*position))
+
+        sort_key = F(self.field_path)
+        if self.nullable:
+            sort_key = sort_key.desc(nulls_last=True) if self.descending else sort_key.asc(nulls_last=True)
+        else:
+            # 未設定のない項目に NULLS LAST を指定すると、PostgreSQLでは降順にインデックスを逆向きに読めなくなる
+            sort_key = sort_key.desc() if self.descending else sort_key.asc()
+        pk_key = F('pk').desc() if self.descending else F('pk').asc()
+        return queryset.order_by(sort_key, pk_key)[:self.per_page + 1]
+
+    def _after(self, value, pk) -> Q:
+        """並び順でカーソル位置より後ろにあるカードの条件"""
+        path = self.field_path
+        pk_beyond = 'pk__lt' if self.descending else 'pk__gt'
+        if value is None:
+            # 未設定のカードは末尾にまとまっているため、id のみで比較する
+            return Q(**{f'{path}__isnull': True, pk_beyond: pk})
+        beyond = f'{path}__lt' if self.descending else f'{path}__gt'
+        return (
+            Q(**{beyond: value})
+            | Q(**{path: value, pk_beyond: pk})
+            | Q(**{f'{path}__isnull': True})
+        )
+
+    def encode_cursor(self, value, pk) -> str:
+        if value is not None and hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        raw = json.dumps([value, pk], ensure_ascii=False, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor: str):
+        """
+        カーソル文字列を (並び替えキーの値, id) に戻す
+
+        不正なカーソルの場合は None を返す (先頭ページとして扱う)。
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if value is not None:
+                value = self.field.to_python(value)
+            return value, int(pk)
+        except (binascii.Error, UnicodeError, ValueError, TypeError, ValidationError):
+            logger.warning(f"Invalid pagination cursor: {cursor!r}")
+            return None
+
+    @staticmethod
+    def _resolve_ordering(model, ordering):
+        if not ordering:
+            ordering = (model._meta.ordering or ['pk'])[0]
+        descending = ordering.startswith('-')
+        return ordering.lstrip('-'), descending
+
+    @staticmethod
+    def _resolve_field(model, field_path: str):
+        """'evolution_stage__display_order' のような指定から、最後のモデルフィールドを求める"""
+        field = None
+        for name in field_path.split('__'):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ValueError(f"Unknown ordering field: {field_path}")
+            if field.is_relation:
+                model = field.related_model
+        if field.is_relation:
+            # 外部キーそのものでの並び替えは、参照先の主キーで比較する
+            field = field.target_field
+        return field
+
+    @staticmethod
+    def _is_nullable(model, field_path: str) -> bool:
+        """並び替えキーが未設定 (NULL) になり得るか (経由する外部キーが未設定の場合も含む)"""
+        for name in field_path.split('__'):
+            field = model._meta.get_field(name)
+            if field.null:
+                return True
+            if field.is_relation:
+                model = field.related_model
+        return False
+
+
+def approximate_count(queryset) -> tuple[int, bool]:
+    """
+    クエリセットの件数を返す
+
+    PostgreSQLでは実行計画の推定行数を使用し、COUNT(*) の全件走査を避ける。
+    推定が小さい場合や、推定できないDBでは正確な件数を数える。
+
+    Returns:
+        tuple[int, bool]: (件数, 推定値かどうか)
+    """
+    if connection.vendor == 'postgresql':
+        estimate = _estimate_rows(queryset)
+        if estimate is not None and estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate, True
+    return queryset.count(), False
+
+
+def _estimate_rows(queryset):
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+    except Exception as e:
+        logger.warning(f"Failed to estimate row count: {e}")
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_pagination_enabled() -> bool:
+    return settings.CARD_LIST_PAGINATION == 'keyset'
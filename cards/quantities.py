@@ -0,0 +1,75 @@
+"""
+カードの枚数の更新
+
+枚数の増減は、カードを読み込んで Python 側で加算してから保存するのではなく、
+UPDATE 文の中で現在の値に加算します (F式)。同時に複数回クリックされても増減が失われず、
+更新するのは枚数と更新日時のみです。
+
+save() を呼ばないため、シグナルの代わりに notify_cards_changed() でキャッシュを無効化し、
+refresh_aggregates() でコレクションの集計 (cards.aggregates) に反映します。
+表示部品のキャッシュ (cards.fragment_cache) は更新日時をキーに含むため、更新日時も同時に更新します。
+"""
+
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .aggregates import refresh_aggregates
+from .cache_versions import notify_cards_changed
+from .models import PokemonCard
+
+# 一括更新で一度に受け付けるカードの件数
+MAX_BATCH_SIZE = 500
+
+# 1件あたりの増減の上限 (枚数の桁あふれを防ぐ)
+MAX_DELTA = 10000
+
+
+def adjust_quantity(pk: int, delta: int) -> bool:
+    """
+    1枚のカードの枚数を delta だけ増減する (0枚未満にはしない)
+
+    Returns:
+        bool: 更新した場合は True (カードが存在しない・0枚のカードを減らそうとした場合は False)
+    """
+    queryset = PokemonCard.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(quantity__gt=0)
+    updated = queryset.update(
+        quantity=Greatest(F('quantity') + delta, Value(0)),
+        updated_at=timezone.now(),
+    )
+    if updated:
+        notify_cards_changed()
+        refresh_aggregates([pk], relations=False)
+    return bool(updated)
+
+
+def apply_quantity_deltas(deltas: dict) -> dict:
+    """
+    複数のカードの枚数を、1回の UPDATE 文でまとめて増減する (0枚未満にはしない)
+
+    Args:
+        deltas (dict): {カードのID: 増減する枚数}
+
+    Returns:
+        dict: 更新後の {カードのID: 枚数} (存在しないカード・増減が0のカードは含まない)
+    """
+    # 存在し得ないID (主キーの型の範囲外) はSQLに渡さない
+    min_id, max_id = connection.ops.integer_field_range(PokemonCard._meta.pk.get_internal_type())
+    deltas = {pk: delta for pk, delta in deltas.items() if delta and min_id <= pk <= max_id}
+    if deltas:
+        delta_expression = Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        updated = PokemonCard.objects.filter(pk__in=deltas.keys()).update(
+            quantity=Greatest(F('quantity') + delta_expression, Value(0)),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            notify_cards_changed()
+            refresh_aggregates(deltas.keys(), relations=False)
+    return dict(PokemonCard.objects.filter(pk__in=deltas.keys()).values_list('pk', 'quantity'))
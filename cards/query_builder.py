@@ -1,35 +1,48 @@
+import unicodedata
+
 import jaconv
 from django.db.models import Q
 
-def build_fuzzy_query(query_text: str, field_name: str = 'name') -> Q:
+
+def normalize_card_name(text: str) -> str:
+    """
+    カード名を検索用に正規化する
+
+    全角/半角の揺らぎ (NFKC)、カタカナ/ひらがなの揺らぎ (ひらがなに統一)、大文字/小文字の揺らぎを吸収します。
+    PokemonCard.name_normalized の値と、検索キーワードの両方に同じ正規化を適用します。
+    例: "ﾋﾟｶﾁｭｳＥＸ" -> "ぴかちゅうex"
+    """
+    if not text:
+        return ''
+    return jaconv.kata2hira(unicodedata.normalize('NFKC', text)).lower()
+
+
+def build_fuzzy_query(query_text: str, field_name: str = 'name_normalized') -> Q:
     """
     検索文字列から、ひらがな/カタカナ揺らぎを考慮したAND/OR検索クエリを構築する。
-    
+
+    キーワードも正規化した上で、正規化済みの列に対する部分一致1件に変換するため、
+    PostgreSQLでは pg_trgm のGINインデックスが使用されます。
+
     Args:
         query_text: ユーザーが入力した検索キーワード文字列
-        field_name: 検索対象のモデルフィールド名 (デフォルト: 'name')
-        
+        field_name: 検索対象の正規化済みフィールド名 (デフォルト: 'name_normalized')
+
     Returns:
         Qオブジェクト (フィルタ条件)
     """
     if not query_text:
         return Q()
-        
+
     keywords = query_text.split()
     q_obj = Q()
-    
+
     for keyword in keywords:
-        hira = jaconv.kata2hira(keyword)
-        kata = jaconv.hira2kata(keyword)
-        
-        # 部分一致条件をORで結合
-        keyword_q = (
-            Q(**{f"{field_name}__icontains": keyword}) |
-            Q(**{f"{field_name}__icontains": hira}) |
-            Q(**{f"{field_name}__icontains": kata})
-        )
-        
+        normalized = normalize_card_name(keyword)
+        if not normalized:
+            continue
+
         # 各キーワード条件をANDで結合
-        q_obj &= keyword_q
-        
+        q_obj &= Q(**{f"{field_name}__contains": normalized})
+
     return q_obj
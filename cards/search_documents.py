@@ -0,0 +1,194 @@
+"""
+カードの検索用ドキュメント (CardSearchDocument) の管理
+
+タイプ・弱点・抵抗力・特別・わざのエネルギータイプ・特別な分類の ManyToMany を、
+マスタのIDをビットの位置とするビットマスク (BIGINT) でカードごとに1行に保持します。
+
+- 絞り込み: 「いずれかのタイプを含む」は (types_mask & 選択したタイプのビット) != 0 で判定するため、
+  中間テーブルの結合と重複を除く DISTINCT が不要になります (cards.filters)
+- 表示: 一覧の表示部品を作る際の ManyToMany は、ビットマスクとマスタデータのキャッシュ (cards.master_data)
+  から求めるため、中間テーブルへの prefetch が不要になります (cards.fragment_cache)
+
+ビットマスクは符号付き64ビット整数に収めるため、マスタのIDが MAX_BIT を超える場合は使用せず、
+従来の中間テーブルでの絞り込み・prefetch に戻します (CARD_SEARCH_DOCUMENTS=False でも同じ)。
+
+ドキュメントはカードの保存・ManyToManyの変更時にシグナル (cards.signals) で更新されます。
+bulk_create や中間テーブルへの直接の登録など、シグナルが発生しない方法で変更した場合は
+sync_documents() を呼び出してください。ずれが生じた場合は rebuild_search_documents コマンドで作り直せます。
+"""
+
+from django.conf import settings
+from django.db.models import F, prefetch_related_objects
+
+from .master_data import get_master_data
+from .models import CardSearchDocument, MoveType, PokemonCard, SpecialFeature, SpecialTrainer, Type
+
+# ManyToManyの項目 → (ビットマスクの列, 参照先のモデル)
+MASK_FIELDS = {
+    'types': ('types_mask', Type),
+    'weakness': ('weakness_mask', Type),
+    'resistance': ('resistance_mask', Type),
+    'special_features': ('special_features_mask', SpecialFeature),
+    'move_types': ('move_types_mask', MoveType),
+    'special_trainers': ('special_trainers_mask', SpecialTrainer),
+}
+
+# ビットマスクに使用できるIDの上限 (BIGINT の符号ビットは使用しない)
+MAX_BIT = 62
+
+# まとめて作り直すカードの件数
+BATCH_SIZE = 1000
+
+# 一覧の表示で参照する外部キー (マスタデータのキャッシュから設定する)
+FOREIGN_KEYS = ('category', 'evolution_stage', 'trainer_type')
+
+
+def documents_enabled() -> bool:
+    """検索用ドキュメントで絞り込み・表示を行うか (マスタのIDがすべてビットマスクに収まる場合のみ)"""
+    if not settings.CARD_SEARCH_DOCUMENTS:
+        return False
+    master = get_master_data()
+    return all(
+        max(master.by_pk(model), default=0) <= MAX_BIT
+        for model in {model for _, model in MASK_FIELDS.values()}
+    )
+
+
+def to_mask(ids) -> int:
+    """マスタのIDの集合をビットマスクに変換する (MAX_BIT を超えるIDは含めない)"""
+    mask = 0
+    for pk in ids:
+        if pk is not None and 0 <= pk <= MAX_BIT:
+            mask |= 1 << pk
+    return mask
+
+
+def has_any(queryset, attribute: str, ids):
+    """ManyToManyの項目に、指定したIDのいずれかを含むカードに絞り込む"""
+    mask_field, _ = MASK_FIELDS[attribute]
+    alias = f'_{attribute}_match'
+    return queryset.alias(**{
+        alias: F(f'search_document__{mask_field}').bitand(to_mask(ids)),
+    }).exclude(**{alias: 0})
+
+
+def sync_documents(card_ids) -> int:
+    """
+    カードのドキュメントを現在の ManyToMany から作り直す (ドキュメントがなければ作成する)
+
+    ManyToManyの項目ごとに中間テーブルを1回ずつ読み込み、まとめて登録・更新します。
+
+    Returns:
+        int: 作り直したドキュメントの件数 (存在しないカードは含まない)
+    """
+    card_ids = sorted(set(card_ids))
+    return sum(
+        _sync_chunk(card_ids[start:start + BATCH_SIZE]) for start in range(0, len(card_ids), BATCH_SIZE)
+    )
+
+
+def _sync_chunk(card_ids: list) -> int:
+    card_ids = set(PokemonCard.objects.filter(pk__in=card_ids).values_list('pk', flat=True))
+    if not card_ids:
+        return 0
+    masks = {card_id: {mask_field: 0 for mask_field, _ in MASK_FIELDS.values()} for card_id in card_ids}
+    for attribute, (mask_field, _) in MASK_FIELDS.items():
+        for card_id, mask in _load_masks(card_ids, attribute).items():
+            masks[card_id][mask_field] = mask
+    _save(masks, [mask_field for mask_field, _ in MASK_FIELDS.values()])
+    return len(masks)
+
+
+def sync_relation(card_ids, attribute: str):
+    """ManyToManyの1つの項目のビットマスクのみを作り直す (m2m_changed シグナル用)"""
+    mask_field, _ = MASK_FIELDS[attribute]
+    card_ids = set(card_ids)
+    masks = {card_id: {mask_field: 0} for card_id in card_ids}
+    for card_id, mask in _load_masks(card_ids, attribute).items():
+        masks[card_id][mask_field] = mask
+    # 削除済みのカードのドキュメントは作成しない
+    existing = set(PokemonCard.objects.filter(pk__in=card_ids).values_list('pk', flat=True))
+    _save({card_id: values for card_id, values in masks.items() if card_id in existing}, [mask_field])
+
+
+def cards_with_relation(attribute: str, target_id: int) -> list:
+    """ManyToManyの項目に指定したマスタを含むカードのID (マスタ側から中間テーブルを消去した場合の更新用)"""
+    return list(has_any(PokemonCard.objects.all(), attribute, [target_id]).values_list('pk', flat=True))
+
+
+def attach_relations(cards: list, lookups):
+    """
+    一覧の表示に使う関連データを、ドキュメントとマスタデータのキャッシュから設定する
+
+    外部キー (カテゴリ・進化段階・トレーナーズ種別) はマスタデータのキャッシュから設定し、
+    ManyToMany (lookups) はドキュメントのビットマスクから prefetch 済みの状態にします。
+    ドキュメントを使用しない場合や、ドキュメントのないカードは従来どおり prefetch します。
+    """
+    if not cards:
+        return
+    master = get_master_data()
+    for card in cards:
+        for name in FOREIGN_KEYS:
+            field = PokemonCard._meta.get_field(name)
+            target_id = getattr(card, field.attname)
+            target = master.get(field.related_model, target_id) if target_id is not None else None
+            if target_id is None or target is not None:
+                field.set_cached_value(card, target)
+
+    lookups = list(lookups)
+    if not lookups:
+        return
+    if not documents_enabled() or any(lookup not in MASK_FIELDS for lookup in lookups):
+        prefetch_related_objects(cards, *lookups)
+        return
+
+    documents = CardSearchDocument.objects.in_bulk([card.pk for card in cards])
+    without_document = []
+    for card in cards:
+        document = documents.get(card.pk)
+        if document is None:
+            without_document.append(card)
+            continue
+        for attribute in lookups:
+            mask_field, model = MASK_FIELDS[attribute]
+            mask = getattr(document, mask_field)
+            # マスタの表示順で並べる (prefetch した場合と同じ順)
+            _set_prefetched(card, attribute, [obj for obj in master.all(model) if mask & (1 << obj.pk)])
+    if without_document:
+        prefetch_related_objects(without_document, *lookups)
+
+
+def _set_prefetched(card, attribute: str, objects: list):
+    """prefetch_related と同じ形で、ManyToManyの取得結果をカードに設定する"""
+    manager = getattr(card, attribute)
+    queryset = manager.get_queryset()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    if not hasattr(card, '_prefetched_objects_cache'):
+        card._prefetched_objects_cache = {}
+    card._prefetched_objects_cache[manager.prefetch_cache_name] = queryset
+
+
+def _load_masks(card_ids: set, attribute: str) -> dict:
+    """中間テーブルから、カードごとのビットマスクを求める"""
+    m2m_field = PokemonCard._meta.get_field(attribute)
+    through = m2m_field.remote_field.through
+    source_column = f'{m2m_field.m2m_field_name()}_id'
+    target_column = f'{m2m_field.m2m_reverse_field_name()}_id'
+    masks = {}
+    rows = through.objects.filter(**{f'{source_column}__in': card_ids}).values_list(source_column, target_column)
+    for card_id, target_id in rows:
+        masks[card_id] = masks.get(card_id, 0) | to_mask([target_id])
+    return masks
+
+
+def _save(masks: dict, mask_fields: list):
+    if not masks:
+        return
+    CardSearchDocument.objects.bulk_create(
+        [CardSearchDocument(card_id=card_id, **values) for card_id, values in masks.items()],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['card'],
+        update_fields=mask_fields,
+    )
@@ -0,0 +1,91 @@
+"""
+カード・マスタデータの変更を検知するシグナルハンドラ
+
+CardsConfig.ready() で読み込まれます。
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_post_delete
+
+from .aggregates import RELATION_DIMENSIONS, schedule_refresh
+from .cache_versions import notify_cards_changed, notify_master_changed
+from .models import (
+    CardCategory, CardSearchDocument, EvolutionStage, MoveType, PokemonCard, SpecialFeature, SpecialTrainer,
+    TrainerType, Type,
+)
+from .search_documents import MASK_FIELDS, cards_with_relation, sync_relation
+from .thumbnails import delete_thumbnails
+
+
+@receiver(post_save, sender=PokemonCard, dispatch_uid='cards_changed_on_save')
+@receiver(post_delete, sender=PokemonCard, dispatch_uid='cards_changed_on_delete')
+def card_changed(sender, **kwargs):
+    """カードの保存・削除 (フォーム・CSVインポート・一括登録を含む) でキャッシュを無効化する"""
+    notify_cards_changed()
+
+
+@receiver(post_save, sender=PokemonCard, dispatch_uid='cards_search_document_on_save')
+def card_saved(sender, instance, created, **kwargs):
+    """新しいカードの検索用ドキュメントを作成する (ManyToManyは保存後に m2m_changed で反映される)"""
+    if created:
+        CardSearchDocument.objects.bulk_create([CardSearchDocument(card_id=instance.pk)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=PokemonCard, dispatch_uid='cards_aggregates_on_save')
+@receiver(post_delete, sender=PokemonCard, dispatch_uid='cards_aggregates_on_delete')
+def card_aggregates_changed(sender, instance, **kwargs):
+    """カードの保存・削除をコレクションの集計に反映する (トランザクションの確定後に ManyToManyの変更とまとめて反映する)"""
+    schedule_refresh([instance.pk])
+
+
+# 中間テーブル → ManyToManyの項目
+THROUGH_ATTRIBUTES = {
+    PokemonCard._meta.get_field(attribute).remote_field.through: attribute for attribute in MASK_FIELDS
+}
+
+
+def card_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """カードのタイプなどの変更を、検索用ドキュメントのビットマスクとコレクションの集計に反映する"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    attribute = THROUGH_ATTRIBUTES[sender]
+    if not reverse:
+        card_ids = [instance.pk]
+    elif action == 'post_clear':
+        # マスタ側から消去した場合は、そのマスタを含んでいたカードを更新する (ドキュメントの更新前に求める)
+        card_ids = cards_with_relation(attribute, instance.pk)
+    else:
+        card_ids = pk_set or []
+    if not card_ids:
+        return
+    sync_relation(card_ids, attribute)
+    if attribute in RELATION_DIMENSIONS:
+        schedule_refresh(card_ids)
+
+
+for through_model in THROUGH_ATTRIBUTES:
+    m2m_changed.connect(
+        card_relations_changed, sender=through_model, dispatch_uid=f'cards_search_document_{through_model.__name__}'
+    )
+
+
+# カードの表示に名前や色を使用するマスタ
+MASTER_MODELS = (CardCategory, Type, EvolutionStage, SpecialFeature, MoveType, TrainerType, SpecialTrainer)
+
+
+def master_changed(sender, **kwargs):
+    """マスタの保存・削除 (管理画面での編集・マスタデータの投入を含む) でキャッシュを無効化する"""
+    notify_master_changed()
+
+
+for master_model in MASTER_MODELS:
+    post_save.connect(master_changed, sender=master_model, dispatch_uid=f'master_changed_on_save_{master_model.__name__}')
+    post_delete.connect(master_changed, sender=master_model, dispatch_uid=f'master_changed_on_delete_{master_model.__name__}')
+
+
+@receiver(cleanup_post_delete, dispatch_uid='cards_delete_thumbnails')
+def card_image_deleted(sender, **kwargs):
+    """django-cleanup がカード画像を削除した (画像の変更・カードの削除) ときに、縮小画像も削除する"""
+    if sender is PokemonCard and kwargs.get('field_name') == 'image':
+        delete_thumbnails(kwargs['file_name'])
@@ -0,0 +1,42 @@
+"""検索フォームのファセット件数を表示するテンプレートタグ"""
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+def _badge(field, value, count, oob=False):
+    count = count or {'cards': 0, 'copies': 0}
+    css = 'badge badge-sm badge-ghost' if count['cards'] else 'badge badge-sm badge-ghost opacity-40'
+    return format_html(
+        '<span id="facet-{}-{}" class="{}" title="{}種類 / {}枚"{}>{}</span>',
+        field, value, css, count['cards'], count['copies'],
+        format_html(' hx-swap-oob="true"') if oob else '',
+        count['cards'],
+    )
+
+
+@register.simple_tag
+def facet_badge(facets, field, value):
+    """
+    選択肢の件数バッジを表示する
+
+    Usage:
+        {% facet_badge facets 'types' choice.data.value %}
+    """
+    if not facets:
+        return ''
+    return _badge(field, value, facets.get(field, {}).get(str(value)))
+
+
+@register.simple_tag
+def facet_badges_oob(facets):
+    """htmxの部分更新で、検索フォーム内のすべての件数バッジを置き換える (hx-swap-oob)"""
+    if not facets:
+        return ''
+    return format_html_join(
+        '\n', '{}',
+        ((_badge(field, value, count, oob=True),)
+         for field, counts in facets.items() for value, count in counts.items()),
+    )
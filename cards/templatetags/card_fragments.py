@@ -0,0 +1,18 @@
+"""カード一覧の表示部品のフラグメントキャッシュ用のテンプレートフィルタ"""
+
+from django import template
+
+from cards.fragment_cache import card_fragment_version as _card_fragment_version
+
+register = template.Library()
+
+
+@register.filter
+def card_fragment_version(card, master_version=''):
+    """
+    {% cache %} タグで表示部品を区別する値を返す
+
+    Usage:
+        {% cache None card_item card|card_fragment_version:master_version %}
+    """
+    return _card_fragment_version(card, master_version)
@@ -0,0 +1,61 @@
+"""カード画像を縮小画像 (srcset) で表示するテンプレートタグ"""
+
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from cards.thumbnails import FORMATS, is_up_to_date, thumbnail_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_image(card, sizes, css_class=''):
+    """
+    カード画像を <picture> で表示する (WebP / JPEG の縮小画像から、表示サイズに合ったものをブラウザが選ぶ)
+
+    縮小画像がまだない場合は元の画像を表示します。
+    画像をクリックすると、元の画像をプレビューで表示します。
+
+    Args:
+        sizes: 画像の表示幅 (img の sizes 属性。例: '140px')
+
+    Usage:
+        {% card_image card '140px' 'rounded-xl h-48 w-full object-contain' %}
+    """
+    if not card.image:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async" onclick="openImagePreview(this.src)" />',
+            static('images/nonepic.png'), card.name, css_class,
+        )
+
+    full_url = card.image.url
+    thumbnails = card.image_thumbnails or {}
+    widths = thumbnails.get('widths') if is_up_to_date(thumbnails, card.image.name) else None
+    if not widths:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async"'
+            ' data-full-src="{}" onclick="openImagePreview(this.dataset.fullSrc)" />',
+            full_url, card.name, css_class, full_url,
+        )
+
+    srcsets = {
+        ext: ', '.join(
+            f'{default_storage.url(thumbnail_name(card.image.name, width, ext))} {width}w' for width in widths
+        )
+        for ext, _, _ in FORMATS
+    }
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}" />',
+        ((mime_type, srcsets[ext], sizes) for ext, _, mime_type in FORMATS[:-1]),
+    )
+    # 最後の形式 (JPEG) は <source> に対応していないブラウザ向けの img に指定する
+    fallback_ext = FORMATS[-1][0]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"'
+        ' data-full-src="{}" onclick="openImagePreview(this.dataset.fullSrc)" /></picture>',
+        sources,
+        default_storage.url(thumbnail_name(card.image.name, widths[0], fallback_ext)),
+        srcsets[fallback_ext], sizes, card.name, css_class, full_url,
+    )
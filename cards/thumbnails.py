@@ -0,0 +1,171 @@
+"""
+カード画像の縮小画像 (サムネイル) の生成
+
+一覧ではカード画像を高さ12rem程度で表示するため、アップロードした写真や切り抜き画像を
+そのまま配信すると表示サイズに対して大きすぎます。
+CARD_THUMBNAIL_WIDTHS の幅ごとに WebP / JPEG の縮小画像を生成し、テンプレートでは
+<picture> の srcset で表示サイズと画面の解像度に合ったものをブラウザに選ばせます。
+
+縮小画像は元の画像と同じストレージの cards/thumbs/ 以下に保存します。
+ファイル名には元の画像のパス全体のハッシュを含めるため、ディレクトリや拡張子が異なる同じ名前の画像でも重複しません。
+    cards/20250101120000_ab12cd34.jpg
+    → cards/thumbs/20250101120000_ab12cd34_<パスのハッシュ>_w320.webp / ..._w320.jpg
+
+生成済みの幅は PokemonCard.image_thumbnails に {'source': 元の画像のパス, 'widths': [幅, ...], 'version': 命名規則の版}
+の形式で保存します。命名規則の版が異なる縮小画像は生成し直すまで使用しません (generate_card_thumbnails コマンド)。
+"""
+
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'cards/thumbs'
+
+# 縮小画像のファイル名の命名規則の版 (変更した場合は以前の縮小画像を使わない)
+NAMING_VERSION = 2
+
+# (拡張子, Pillowの保存形式, MIMEタイプ)
+FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpg', 'JPEG', 'image/jpeg'),
+)
+
+
+def thumbnail_widths() -> list[int]:
+    return sorted(set(settings.CARD_THUMBNAIL_WIDTHS))
+
+
+def _thumbnail_prefix(name: str) -> str:
+    """元の画像の縮小画像のファイル名に共通する先頭部分 (名前とパス全体のハッシュ)"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:10]
+    return f'{stem}_{digest}_w'
+
+
+def thumbnail_name(name: str, width: int, ext: str) -> str:
+    """元の画像のパスから、縮小画像のパスを求める"""
+    return f'{THUMBNAIL_DIR}/{_thumbnail_prefix(name)}{width}.{ext}'
+
+
+def is_up_to_date(thumbnails: dict, name: str) -> bool:
+    """縮小画像の情報が、現在の画像から現在の命名規則で生成したものかどうか"""
+    return bool(thumbnails) and thumbnails.get('source') == name and thumbnails.get('version') == NAMING_VERSION
+
+
+def generate_thumbnails(name: str) -> dict:
+    """
+    画像の縮小画像を幅ごと・形式ごとに生成する
+
+    元の画像より大きく拡大することはありません。元の画像の幅が設定した幅に満たない場合は、
+    その幅の縮小画像として元の大きさのまま (形式のみ変換して) 保存し、それより大きい幅は生成しません。
+
+    Returns:
+        dict: PokemonCard.image_thumbnails に保存する値
+              (画像を読み込めない場合も、同じ画像で再試行しないよう widths を空にして返す)
+    """
+    widths = []
+    try:
+        with default_storage.open(name, 'rb') as f:
+            with Image.open(f) as original:
+                image = ImageOps.exif_transpose(original)
+                image.load()
+        for width in thumbnail_widths():
+            _save_thumbnail(image, name, width)
+            widths.append(width)
+            if width >= image.width:
+                break
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning(f"Failed to generate thumbnails for {name}: {e}")
+    except Exception as e:
+        # 縮小画像を生成できなくてもカードの保存は続ける (一覧では元の画像を表示する)
+        logger.error(f"Failed to generate thumbnails for {name}: {e}", exc_info=True)
+    return {'source': name, 'widths': widths, 'version': NAMING_VERSION}
+
+
+def _save_thumbnail(image: Image.Image, name: str, width: int):
+    resized = image
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+    has_alpha = resized.mode in ('RGBA', 'LA') or (resized.mode == 'P' and 'transparency' in resized.info)
+    rgba = resized.convert('RGBA') if has_alpha else None
+    rgb = resized.convert('RGB')
+    if rgba is not None:
+        # JPEGは透過に対応していないため、白い背景に合成する
+        rgb = Image.new('RGB', rgba.size, (255, 255, 255))
+        rgb.paste(rgba, mask=rgba.getchannel('A'))
+
+    quality = settings.CARD_THUMBNAIL_QUALITY
+    for ext, image_format, _ in FORMATS:
+        buffer = io.BytesIO()
+        if image_format == 'WEBP':
+            (rgba if rgba is not None else rgb).save(buffer, image_format, quality=quality, method=4)
+        else:
+            rgb.save(buffer, image_format, quality=quality, optimize=True, progressive=True)
+        thumb_name = thumbnail_name(name, width, ext)
+        if default_storage.exists(thumb_name):
+            default_storage.delete(thumb_name)
+        default_storage.save(thumb_name, ContentFile(buffer.getvalue()))
+
+
+def _thumbnail_names(name: str, widths) -> list[str]:
+    """元の画像の縮小画像のパス (現在の命名規則と、以前の命名規則 {名前}_w{幅} の両方)"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return [
+        path
+        for width in widths
+        for ext, _, _ in FORMATS
+        for path in (thumbnail_name(name, width, ext), f'{THUMBNAIL_DIR}/{stem}_w{width}.{ext}')
+    ]
+
+
+def delete_thumbnails(name: str, widths=()):
+    """
+    画像の縮小画像を削除する (存在しないものは無視する)
+
+    現在の CARD_THUMBNAIL_WIDTHS の幅と widths (生成済みの幅) の縮小画像を、ファイル名を求めて直接削除します。
+    設定から外した幅の縮小画像など、どのカードからも参照されていない縮小画像は
+    delete_orphaned_thumbnails (generate_card_thumbnails --cleanup) で削除します。
+    """
+    for thumb_name in _thumbnail_names(name, set(thumbnail_widths()) | set(widths)):
+        try:
+            default_storage.delete(thumb_name)
+        except OSError as e:
+            logger.warning(f"Failed to delete thumbnail {thumb_name}: {e}")
+
+
+def delete_orphaned_thumbnails(used_names) -> int:
+    """
+    縮小画像のディレクトリから、used_names (使用中の縮小画像のパス) に含まれないファイルを削除する
+
+    ディレクトリ全体を読むため、カードの保存時ではなく管理コマンドから1回だけ実行します。
+
+    Returns:
+        int: 削除したファイルの数
+    """
+    used_names = set(used_names)
+    try:
+        _, files = default_storage.listdir(THUMBNAIL_DIR)
+    except (OSError, NotImplementedError):
+        # 縮小画像のディレクトリがない (まだ生成していない) 場合
+        return 0
+    deleted = 0
+    for file_name in files:
+        thumb_name = f'{THUMBNAIL_DIR}/{file_name}'
+        if thumb_name in used_names:
+            continue
+        try:
+            default_storage.delete(thumb_name)
+            deleted += 1
+        except OSError as e:
+            logger.warning(f"Failed to delete thumbnail {thumb_name}: {e}")
+    return deleted
@@ -13,6 +13,7 @@ urlpatterns = [
     path('<int:pk>/edit/', views.card_edit, name='card_edit'),
     path('<int:pk>/increase/', views.increase_card_quantity, name='increase_card_quantity'),
     path('<int:pk>/decrease/', views.decrease_card_quantity, name='decrease_card_quantity'),
+    path('quantities/', views.update_card_quantities, name='update_card_quantities'),
     path('<int:pk>/delete/', views.card_delete, name='card_delete'),
     path('<int:pk>/detail/', views.card_detail_modal, name='card_detail_modal'),
     path('<int:pk>/related/', views.related_cards_modal, name='related_cards_modal'),
@@ -21,6 +22,7 @@ urlpatterns = [
     # Bulk Registration
     path('bulk/upload/', views.bulk_register_upload, name='bulk_register_upload'),
     path('bulk/analyze/', views.bulk_register_analyze, name='bulk_register_analyze'),
+    path('bulk/job/<uuid:job_id>/', views.bulk_register_job_status, name='bulk_register_job_status'),
     path('bulk/item/<str:item_id>/edit/', views.bulk_register_edit_item, name='bulk_register_edit_item'),
     path('bulk/item/<str:item_id>/toggle-exclude/', views.bulk_register_toggle_exclude, name='bulk_register_toggle_exclude'),
     path('bulk/submit/', views.bulk_register_submit, name='bulk_register_submit'),
@@ -28,5 +30,13 @@ urlpatterns = [
     path('export-csv-modal/', views.export_csv_modal, name='export_cards_csv_modal'),
     path('export-csv/', views.export_cards_csv, name='export_cards_csv'),
     path('import-csv/', views.import_cards_csv, name='import_cards_csv'),
+    path('import-csv/jobs/<uuid:job_id>/', views.csv_import_job_status, name='csv_import_job_status'),
+    path('import-csv/jobs/<uuid:job_id>/resume/', views.csv_import_job_resume, name='csv_import_job_resume'),
+    path('stats/', views.collection_stats_modal, name='collection_stats_modal'),
+    path('decks/', views.deck_list_modal, name='deck_list_modal'),
+    path('decks/import/', views.deck_list_import, name='deck_list_import'),
+    path('decks/new/', views.deck_builder, name='deck_create'),
+    path('decks/<int:pk>/edit/', views.deck_builder, name='deck_edit'),
+    path('decks/<int:pk>/delete/', views.deck_delete, name='deck_delete'),
     path('help/', views.help_modal, name='help_modal'),
 ]
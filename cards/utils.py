@@ -1,77 +1,188 @@
-"""進化系統探索のヘルパー関数"""
-from typing import Set, List
-from .models import PokemonCard
-
-
-def find_evolution_root(card_name: str) -> str:
+"""
+進化系統探索のヘルパー関数
+
+ポケモンカードの「カード名 → 進化元 / 進化先」の隣接関係をグラフとして1回のクエリで構築し、
+カードデータのバージョン (cards.cache_versions) をキーにキャッシュします。
+進化系統全体はグラフ上の探索だけで求まるため、1段ごとにクエリを発行する必要はありません。
+
+グラフがまだキャッシュされていない場合は、リクエストを処理しているスレッドでグラフを構築します
+(1回のクエリ)。同じプロセスの他のスレッドが構築中の場合は、再帰CTEの1クエリで進化系統を求めます。
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Set
+
+from django.core.cache import cache
+from django.db import connection
+
+from .cache_versions import get_cards_version
+from .models import CardCategory, PokemonCard
+
+logger = logging.getLogger(__name__)
+
+GRAPH_CACHE_KEY = 'cards:evolution_graph:{version}'
+
+
+class EvolutionGraph:
+    """ポケモンカードの進化関係の隣接リスト"""
+
+    def __init__(self, edges):
+        """
+        Args:
+            edges: (カード名, 進化元カード名) のタプルの列。進化元がない場合は None または空文字
+        """
+        self.parents = defaultdict(set)
+        self.children = defaultdict(set)
+        for name, evolves_from in edges:
+            if evolves_from:
+                self.parents[name].add(evolves_from)
+                self.children[evolves_from].add(name)
+        self.parents = dict(self.parents)
+        self.children = dict(self.children)
+
+    @classmethod
+    def build(cls) -> 'EvolutionGraph':
+        """ポケモンカテゴリの全カードから1回のクエリでグラフを構築する"""
+        edges = PokemonCard.objects.filter(
+            category__slug='pokemon'
+        ).order_by().values_list('name', 'evolves_from').distinct()
+        return cls(edges)
+
+    def find_root(self, card_name: str) -> str:
+        """
+        対象カードから進化元をたどり、進化系統の最も根元となる「たねポケモン」の名前を特定する。
+
+        進化元が複数登録されている場合は、名前順で最初のものをたどります。
+        循環参照がある場合は、起点のカード名を根元とみなします。
+        """
+        visited = set()
+        current_name = card_name
+        while current_name in self.parents:
+            if current_name in visited:
+                return card_name
+            visited.add(current_name)
+            current_name = min(self.parents[current_name])
+        return current_name
+
+    def collect_line(self, root_name: str) -> Set[str]:
+        """
+        根元のカード名から出発して、関連するすべてのカード名を収集する。
+        進化先が複数ある場合（例: イーブイ）も網羅的に探索する。
+        """
+        all_cards = set()
+        to_process = [root_name]
+        while to_process:
+            current_name = to_process.pop()
+            if current_name in all_cards:
+                # 既に処理済み（循環参照対策）
+                continue
+            all_cards.add(current_name)
+            to_process.extend(self.children.get(current_name, ()))
+        return all_cards
+
+    def family(self, card_name: str) -> Set[str]:
+        """対象カードが属する進化系統のすべてのカード名を返す"""
+        return self.collect_line(self.find_root(card_name))
+
+
+_local_graph = (None, None)  # (バージョン, グラフ)
+_build_lock = threading.Lock()
+
+
+def get_evolution_family(card_name: str) -> Set[str]:
     """
-    対象カードから evolves_from を再帰的にたどり、
-    進化系統の最も根元となる「たねポケモン」の名前を特定する。
+    対象カードが属する進化系統のすべてのカード名を返す
 
-    Args:
-        card_name: 起点となるカード名
-
-    Returns:
-        進化系統の根元のカード名（たねポケモン）
+    プロセス内 → 共有キャッシュの順にグラフを探し、どちらにもない場合はグラフを構築してキャッシュする。
+    他のスレッドが構築中の場合は、構築を待たずに再帰CTEで求める。
     """
-    visited = set()
-    current_name = card_name
-
-    while current_name and current_name not in visited:
-        visited.add(current_name)
-
-        # ポケモンカテゴリのカードのみを対象とする
-        card = PokemonCard.objects.filter(
-            name=current_name,
-            category__slug='pokemon'
-        ).values_list('evolves_from', flat=True).first()
-
-        if card is None:
-            # カードが見つからない場合は現在の名前を返す
-            break
-
-        evolves_from = card
+    global _local_graph
+    version = get_cards_version()
 
-        if not evolves_from:
-            # 進化元がない = たねポケモン
-            break
+    local_version, graph = _local_graph
+    if local_version == version:
+        return graph.family(card_name)
 
-        current_name = evolves_from
+    graph = cache.get(GRAPH_CACHE_KEY.format(version=version))
+    if graph is not None:
+        _local_graph = (version, graph)
+        return graph.family(card_name)
 
-    return current_name
+    graph = _build_graph(version)
+    if graph is None:
+        return find_evolution_family_sql(card_name)
+    return graph.family(card_name)
 
 
-def collect_evolution_line(root_name: str) -> Set[str]:
+def _build_graph(version: str):
     """
-    根元のカード名から出発して、関連するすべてのカード名を再帰的に収集する。
-    進化先が複数ある場合（例: イーブイ）も網羅的に探索する。
-
-    Args:
-        root_name: 進化系統の根元となるカード名
+    グラフを構築してキャッシュする (同じプロセスでの同時構築は1つのみ)
 
     Returns:
-        進化系統に含まれるすべてのカード名のセット
+        EvolutionGraph | None: 構築したグラフ (他のスレッドが構築中、または構築に失敗した場合は None)
     """
-    all_cards = set()
-    to_process = [root_name]
-
-    while to_process:
-        current_name = to_process.pop()
-
-        if current_name in all_cards:
-            # 既に処理済み（循環参照対策）
-            continue
-
-        all_cards.add(current_name)
-
-        # このカードから進化するカードをすべて取得
-        evolved_cards = PokemonCard.objects.filter(
-            evolves_from=current_name,
-            category__slug='pokemon'
-        ).values_list('name', flat=True)
-
-        for evolved_name in evolved_cards:
-            if evolved_name not in all_cards:
-                to_process.append(evolved_name)
+    global _local_graph
+    if not _build_lock.acquire(blocking=False):
+        return None
+    try:
+        graph = EvolutionGraph.build()
+        # 構築中にカードが変更された場合は、古いデータのグラフを保存しない
+        if get_cards_version() == version:
+            cache.set(GRAPH_CACHE_KEY.format(version=version), graph, timeout=None)
+            _local_graph = (version, graph)
+        return graph
+    except Exception as e:
+        logger.error(f"Failed to build evolution graph: {e}")
+        return None
+    finally:
+        _build_lock.release()
+
+
+def find_evolution_family_sql(card_name: str) -> Set[str]:
+    """
+    再帰CTEの1クエリで、対象カードが属する進化系統のすべてのカード名を返す
 
-    return all_cards
+    EvolutionGraph.family() と同じ結果になります (PostgreSQL / SQLite で動作します)。
+    ただし進化元が複数登録されている場合は、どれをたどるかがDBの照合順序によって異なることがあります。
+    PostgreSQLの再帰CTEは列の型が一致している必要があるため、カード名はすべて TEXT にそろえます。
+    """
+    qn = connection.ops.quote_name
+    card_table = qn(PokemonCard._meta.db_table)
+    category_column = qn(PokemonCard._meta.get_field('category').column)
+    category_table = qn(CardCategory._meta.db_table)
+    sql = f"""
+        WITH RECURSIVE
+        pokemon(name, evolves_from) AS (
+            SELECT CAST(c.name AS TEXT), CAST(NULLIF(c.evolves_from, '') AS TEXT) FROM {card_table} c
+            JOIN {category_table} cat ON cat.id = c.{category_column}
+            WHERE cat.slug = 'pokemon'
+        ),
+        parent(name, evolves_from) AS (
+            SELECT name, MIN(evolves_from) FROM pokemon
+            WHERE evolves_from IS NOT NULL GROUP BY name
+        ),
+        up(name) AS (
+            SELECT CAST(%s AS TEXT)
+            UNION
+            SELECT p.evolves_from FROM up JOIN parent p ON p.name = up.name
+        ),
+        up_root(name) AS (
+            SELECT up.name FROM up LEFT JOIN parent p ON p.name = up.name
+            WHERE p.name IS NULL
+        ),
+        root(name) AS (
+            SELECT name FROM up_root
+            UNION
+            SELECT CAST(%s AS TEXT) WHERE NOT EXISTS (SELECT 1 FROM up_root)
+        ),
+        down(name) AS (
+            SELECT name FROM root
+            UNION
+            SELECT p.name FROM down JOIN pokemon p ON p.evolves_from = down.name
+        )
+        SELECT name FROM down
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [card_name, card_name])
+        return {row[0] for row in cursor.fetchall()}
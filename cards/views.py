@@ -2,23 +2,38 @@ import os
 from datetime import datetime
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
-from django.core.files.base import ContentFile
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, QueryDict, StreamingHttpResponse
+from django.utils.html import format_html, format_html_join
 from django.views.decorators.http import require_POST, require_http_methods
-from .models import PokemonCard, Type, EvolutionStage, SpecialFeature, MoveType, CardCategory
+from .models import (
+    PokemonCard, Type, EvolutionStage, SpecialFeature, MoveType, CardCategory, AnalysisJob,
+    BulkRegisterBatch, BulkRegisterItem, CsvImportJob, TrainerType, Deck,
+)
 from .filters import PokemonCardFilter, TrainersCardFilter
-from .forms import PokemonCardForm
-from .utils import find_evolution_root, collect_evolution_line
-from .ai_analyzer import CardAnalyzer
-from .data_mapper import CardDataMapper
-from .resources import PokemonCardResource
-from google.api_core.exceptions import ResourceExhausted
+from .forms import PokemonCardForm, DeckForm
+from .utils import get_evolution_family
+from .pagination import KeysetPaginator, keyset_pagination_enabled
+from .facets import get_facet_counts
+from .fragment_cache import fragment_name, prefetch_uncached
+from .cache_versions import get_master_version
+from .master_data import get_master_data
+from .bulk_commit import BulkCardCommitter
+from .csv_export import iter_cards_csv
+from .aggregates import collection_stats
+from .decks import check_decks, check_entries, save_deck_entries
+from .deck_lists import DeckListImporter, shortage_summary
+from .column_store import column_store_enabled, filtered_selection
+from .quantities import MAX_BATCH_SIZE, MAX_DELTA, adjust_quantity, apply_quantity_deltas
+from . import csv_import_jobs
+from .bulk_analysis import (
+    AnalysisError, enqueue_analysis_job, run_analysis, save_uploaded_image
+)
 from django.http import JsonResponse
 import json
 import logging
-import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +42,9 @@ def card_create(request, category_slug):
     if request.method == 'POST':
         form = PokemonCardForm(request.POST, request.FILES)
         if form.is_valid():
-            card = form.save()
+            # カードとManyToManyの保存を1つのトランザクションにし、集計への反映を確定後の1回にまとめる (cards.aggregates)
+            with transaction.atomic():
+                card = form.save()
             # データベースからリレーションを再取得
             card = PokemonCard.objects.select_related(
                 'evolution_stage', 'trainer_type', 'category'
@@ -75,7 +92,9 @@ def card_edit(request, pk):
     if request.method == 'POST':
         form = PokemonCardForm(request.POST, request.FILES, instance=card)
         if form.is_valid():
-            card = form.save()
+            # カードとManyToManyの保存を1つのトランザクションにし、集計への反映を確定後の1回にまとめる (cards.aggregates)
+            with transaction.atomic():
+                card = form.save()
             # データベースからリレーションを再取得
             card = PokemonCard.objects.select_related(
                 'evolution_stage', 'trainer_type', 'category'
@@ -111,29 +130,72 @@ class PokemonCardListView(ListView):
     template_name = 'cards/pokemon_card_list.html'
     context_object_name = 'card_list'
     paginate_by = 20
+    facet_category = 'pokemon'
+    # 表示部品がキャッシュにないカードにだけ設定する関連データ (cards.fragment_cache)
+    # カテゴリ・進化段階などの外部キーも、結合せずにマスタデータのキャッシュから設定する
+    prefetch_lookups = ('types', 'weakness', 'resistance', 'special_features', 'move_types')
 
     def get_queryset(self):
-        queryset = super().get_queryset().filter(category__slug='pokemon').select_related(
-            'evolution_stage'
-        ).prefetch_related(
-            'types', 'special_features', 'move_types'
-        )
+        # カテゴリは id で絞り込む (カテゴリ・並び替えの項目の複合インデックスを使用するため)
+        queryset = super().get_queryset().filter(category=get_master_data().category('pokemon'))
         self.filterset = PokemonCardFilter(self.request.GET, queryset=queryset)
         return self.filterset.qs
 
+    def get_paginate_by(self, queryset):
+        # キーセット方式では get_context_data で独自にページ分割する（OFFSET と COUNT(*) を使わない）
+        if keyset_pagination_enabled():
+            return None
+        return self.paginate_by
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['filter'] = self.filterset
         context['view_mode'] = self.request.session.get('view_mode', 'card')
+        if keyset_pagination_enabled():
+            context.update(self.get_keyset_context())
+        self.prefetch_page(context.get('page_obj'), context['view_mode'])
+        if settings.CARD_LIST_FACETS and 'cursor' not in self.request.GET:
+            # 検索フォームの選択肢ごとの件数（スクロールで続きを読み込む場合は不要）
+            context['facets'] = get_facet_counts(
+                type(self.filterset), self.request.GET, self.filterset.queryset, self.facet_category
+            )
         
         # 現在の検索条件をセッションに保存（エクスポートで使用するため）
         # カテゴリごとに個別に保存する (pokemon / trainers)
         category = 'pokemon'
-        self.request.session[f'last_search_params_{category}'] = self.request.GET.urlencode()
+        self.request.session[f'last_search_params_{category}'] = self.get_search_params()
         
         return context
 
+    def get_keyset_context(self):
+        """キーセットページネーションで現在のページを取得する"""
+        ordering = None
+        if self.filterset.is_valid():
+            ordering = (self.filterset.form.cleaned_data.get('ordering') or [None])[0]
+        paginator = KeysetPaginator(self.object_list, ordering, per_page=self.paginate_by)
+        page = paginator.get_page(self.request.GET.get('cursor'), count_mode=settings.CARD_LIST_COUNT_MODE)
+        return {'keyset': True, 'page_obj': page, 'is_paginated': False}
+
+    def prefetch_page(self, page, view_mode):
+        """現在のページのうち、表示部品がキャッシュにないカードの関連データを取得する"""
+        if page is None:
+            return
+        page.object_list = list(page.object_list)
+        prefetch_uncached(
+            page.object_list, fragment_name(view_mode, self.facet_category), self.prefetch_lookups,
+            get_master_version(),
+        )
+
+    def get_search_params(self):
+        """検索条件のクエリ文字列（ページ位置を除く）"""
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        return params.urlencode()
+
     def get_template_names(self):
+        if self.request.htmx and 'cursor' in self.request.GET:
+            # スクロールで読み込む続きのページ
+            return ['cards/_card_list_page.html']
         if self.request.htmx:
             return ['cards/_card_list_content.html']
         return ['cards/pokemon_card_list.html']
@@ -141,19 +203,19 @@ class PokemonCardListView(ListView):
 
 class TrainersCardListView(PokemonCardListView):
     template_name = 'cards/trainers_card_list.html'
+    facet_category = 'trainers'
+    prefetch_lookups = ('special_trainers',)
 
     def get_queryset(self):
         queryset = super(PokemonCardListView, self).get_queryset().filter(
-            category__slug='trainers'
-        ).select_related(
-            'trainer_type'
-        ).prefetch_related(
-            'special_trainers'
+            category=get_master_data().category('trainers')
         )
         self.filterset = TrainersCardFilter(self.request.GET, queryset=queryset)
         return self.filterset.qs
 
     def get_template_names(self):
+        if self.request.htmx and 'cursor' in self.request.GET:
+            return ['cards/_card_list_page.html']
         if self.request.htmx:
             return ['cards/_card_list_content.html']
         return ['cards/trainers_card_list.html']
@@ -162,31 +224,22 @@ class TrainersCardListView(PokemonCardListView):
         context = super().get_context_data(**kwargs)
         # 親の context_data で pokemon として保存されてしまうため、ここで trainers として上書き
         category = 'trainers'
-        self.request.session[f'last_search_params_{category}'] = self.request.GET.urlencode()
+        self.request.session[f'last_search_params_{category}'] = self.get_search_params()
         return context
 
 @require_POST
 def increase_card_quantity(request, pk):
-    card = get_object_or_404(
-        PokemonCard.objects.select_related(
-            'evolution_stage', 'trainer_type', 'category'
-        ).prefetch_related(
-            'types', 'special_features', 'move_types', 'special_trainers'
-        ),
-        pk=pk
-    )
-    card.quantity += 1
-    card.save() 
-    # 表示モードとカードのカテゴリに応じて適切なテンプレートを返す
-    view_mode = request.session.get('view_mode', 'card')
-    if view_mode == 'table':
-        template_name = f'cards/_{card.category.slug}_card_table_row.html'
-    else:
-        template_name = 'cards/_card_item.html'
-    return render(request, template_name, {'card': card})
+    # 読み込んだ値に加算して保存すると同時にクリックされた場合に増減が失われるため、UPDATE 文で加算する
+    if not adjust_quantity(pk, 1):
+        raise Http404
+    return _render_card_after_quantity_change(request, pk)
 
 @require_POST
 def decrease_card_quantity(request, pk):
+    adjust_quantity(pk, -1)
+    return _render_card_after_quantity_change(request, pk)
+
+def _render_card_after_quantity_change(request, pk):
     card = get_object_or_404(
         PokemonCard.objects.select_related(
             'evolution_stage', 'trainer_type', 'category'
@@ -195,9 +248,6 @@ def decrease_card_quantity(request, pk):
         ),
         pk=pk
     )
-    if card.quantity > 0:
-        card.quantity -= 1
-        card.save()
 
     # 表示モードとカードのカテゴリに応じて適切なテンプレートを返す
     view_mode = request.session.get('view_mode', 'card')
@@ -207,6 +257,42 @@ def decrease_card_quantity(request, pk):
         template_name = 'cards/_card_item.html'
     return render(request, template_name, {'card': card})
 
+@require_POST
+def update_card_quantities(request):
+    """
+    複数のカードの枚数をまとめて増減する (連続したクリックをまとめて送る場合や、スキャナーでの枚数カウント用)
+
+    リクエストの本文に {"カードのID": 増減する枚数, ...} のJSONを指定します。
+    枚数は1回の UPDATE 文で増減し、更新後の枚数を {"quantities": {"カードのID": 枚数, ...}} で返します。
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+        if not isinstance(payload, dict):
+            raise ValueError
+        if len(payload) > MAX_BATCH_SIZE:
+            return JsonResponse({'error': f'一度に更新できるカードは{MAX_BATCH_SIZE}件までです'}, status=400)
+        deltas = {}
+        for key, delta in payload.items():
+            if isinstance(delta, bool) or not isinstance(delta, int) or abs(delta) > MAX_DELTA:
+                raise ValueError
+            # 「41」「041」など同じIDになるキーを合計すると増減の上限を超えられるため、重複は受け付けない
+            pk = int(key)
+            if pk in deltas:
+                raise ValueError
+            deltas[pk] = delta
+    except ValueError:
+        return JsonResponse(
+            {'error': f'{{"カードのID": 増減する枚数}} の形式で、同じカードは1回だけ指定してください (増減は±{MAX_DELTA}枚まで)'},
+            status=400,
+        )
+
+    quantities = apply_quantity_deltas(deltas)
+    missing = sorted(pk for pk, delta in deltas.items() if delta and pk not in quantities)
+    return JsonResponse({
+        'quantities': {str(pk): quantity for pk, quantity in quantities.items()},
+        'missing': missing,
+    })
+
 @require_http_methods(["GET", "DELETE"])
 def card_delete(request, pk):
     card = get_object_or_404(PokemonCard, pk=pk)
@@ -263,11 +349,8 @@ def related_cards_modal(request, pk):
     # 起点となるカードを取得
     card = get_object_or_404(PokemonCard, pk=pk, category__slug='pokemon')
 
-    # 進化系統の根元を探す
-    root_name = find_evolution_root(card.name)
-
-    # 進化系統の全カード名を収集
-    evolution_line_names = collect_evolution_line(root_name)
+    # 進化系統の全カード名を取得（キャッシュ済みの進化グラフから1回で求める）
+    evolution_line_names = get_evolution_family(card.name)
 
     # カード名リストからPokemonCardオブジェクトを取得
     related_cards = PokemonCard.objects.filter(
@@ -280,7 +363,7 @@ def related_cards_modal(request, pk):
     )
 
     # 進化段階ごとにグルーピング
-    evolution_stages = EvolutionStage.objects.all().order_by('display_order')
+    evolution_stages = get_master_data().all(EvolutionStage)
 
     # 各進化段階ごとのカードリストを作成
     stages_with_cards = []
@@ -305,243 +388,125 @@ def related_cards_modal(request, pk):
 
 def bulk_register_upload(request):
     """一括登録用アップロードモーダルを表示"""
-    return render(request, 'cards/_bulk_register_modal.html')
+    return render(request, 'cards/_bulk_register_modal.html', {
+        'max_images': settings.BULK_REGISTER_MAX_IMAGES,
+    })
 
 @require_POST
 def bulk_register_analyze(request):
     """
     アップロードされた画像を解析し、プレビューを表示する
+
+    BULK_ANALYSIS_ASYNC が有効な場合は解析ジョブを登録して進捗表示を返し、
+    解析自体は run_analysis_worker コマンドがバックグラウンドで実行する。
     """
-    if 'image' not in request.FILES:
+    image_files = request.FILES.getlist('image')
+    if not image_files:
         return HttpResponse("画像が選択されていません", status=400)
-
-    image_file = request.FILES['image']
-    
-    # 一時ファイルとして保存
-    # 注意: 本番運用ではS3や専用ストレージへの保存、および定期的なクリーンアップが必要
-    # ここではメディアディレクトリ内の bulk_register/originals に保存
-    import os
-    from datetime import datetime
-    from django.conf import settings
-    from django.core.files.storage import default_storage
-    from django.core.files.base import ContentFile
-
-    # 日時ベースのディレクトリを作成: bulk_register/YYYY/MM/DD/HHMMSS_ID/
-    now = datetime.now()
-    timestamp_str = now.strftime('%H%M%S')
-    unique_id = uuid.uuid4().hex[:8]
-    
-    relative_dir = os.path.join(
-        'bulk_register',
-        str(now.year),
-        f'{now.month:02d}',
-        f'{now.day:02d}',
-        f'{timestamp_str}_{unique_id}'
-    )
-    save_dir = os.path.join(settings.MEDIA_ROOT, relative_dir)
-    os.makedirs(save_dir, exist_ok=True)
-    
-    # ファイル保存
-    ext = os.path.splitext(image_file.name)[1]
-    filename = f"original{ext}"
-    file_path = os.path.join(save_dir, filename)
-    file_url = os.path.join(settings.MEDIA_URL, relative_dir, filename)
-    
-    with open(file_path, 'wb+') as destination:
-        for chunk in image_file.chunks():
-            destination.write(chunk)
+    if len(image_files) > settings.BULK_REGISTER_MAX_IMAGES:
+        return HttpResponse(f"一度に解析できる画像は{settings.BULK_REGISTER_MAX_IMAGES}枚までです", status=400)
+
+    # 一時ファイルとして保存 (メディアディレクトリ内の bulk_register 配下)
+    images = [save_uploaded_image(image_file) for image_file in image_files]
+
+    if settings.BULK_ANALYSIS_ASYNC:
+        job = enqueue_analysis_job(images)
+        # 進捗確認できるのはアップロードしたセッションのみ
+        request.session['bulk_register_job_id'] = str(job.pk)
+        return render(request, 'cards/_bulk_register_progress.html', {
+            'job': job,
+            'stages': _job_stages(job),
+        })
 
     try:
-        # AI解析実行
-        analyzer = CardAnalyzer()
-        analysis_result = analyzer.analyze_image(file_path)
-        
-        raw_items = []
-        try:
-            # Geminiのレスポンス(JSON文字列)をパース
-            # Markdownコードブロックが含まれている場合のクリーニング
-            raw_json = analysis_result['raw_response']
-            if "```json" in raw_json:
-                raw_json = raw_json.split("```json")[1].split("```")[0]
-            elif "```" in raw_json:
-                raw_json = raw_json.split("```")[1].split("```")[0]
-            
-            raw_items = json.loads(raw_json)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON Parse Error: {e}")
-            logger.error(f"Raw Response: {analysis_result['raw_response']}")
-            error_html = f"""
-            <dialog id="bulk-error-modal" class="modal">
-                <div class="modal-box">
-                    <div class="alert alert-error shadow-lg mb-4">
-                        <div>
-                            <svg xmlns="http://www.w3.org/2000/svg" class="stroke-current flex-shrink-0 h-6 w-6" fill="none" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M10 14l2-2m0 0l2-2m-2 2l-2-2m2 2l2 2m7-2a9 9 0 11-18 0 9 9 0 0118 0z" /></svg>
-                            <span>AIからの解析結果を正しく読み取れませんでした(JSON形式エラー)。解析結果を確認し、必要であれば再度お試しください。</span>
-                        </div>
-                    </div>
-                    <div class="text-center">
-                        <button class="btn" onclick="document.getElementById('bulk-error-modal').close()">閉じる</button>
-                    </div>
-                </div>
-                <form method="dialog" class="modal-backdrop">
-                    <button>close</button>
-                </form>
-            </dialog>
-            <script>
-                (function() {{
-                    const modal = document.getElementById('bulk-error-modal');
-                    if(modal) modal.showModal();
-                    modal.addEventListener('close', () => {{
-                        const dialogTarget = document.getElementById('dialog-target');
-                        if (dialogTarget) {{
-                            dialogTarget.innerHTML = '';
-                        }}
-                    }});
-                }})();
-            </script>
-            """
-            return HttpResponse(error_html)
-
-        # データマッピング
-        mapper = CardDataMapper()
-        mapped_items = []
-        
-        # クロップ画像との紐付け (ID順前提)
-        cropped_images = analysis_result.get('cropped_images', [])
-        
-        for i, raw_item in enumerate(raw_items):
-            mapped = mapper.map_item(raw_item)
-            mapped['id'] = str(uuid.uuid4()) # 一時ID
-            
-            # セッション保存のためにモデルインスタンスをIDに変換しつつ、表示用名称も保存
-            if mapped.get('category'):
-                mapped['category_name'] = mapped['category'].name
-                mapped['category'] = mapped['category'].id
-            else:
-                # ポケモンまたはトレーナーズ以外は除外
-                continue
+        result = run_analysis([path for path, _ in images])
+    except AnalysisError as e:
+        return _render_bulk_error(request, str(e))
+    except Exception as e:
+        logger.error(f"Bulk Register Analyze Error: {e}", exc_info=True)
+        return _render_bulk_error(request, f"エラーが発生しました: {str(e)}")
 
-            if mapped.get('evolution_stage'):
-                mapped['evolution_stage_name'] = mapped['evolution_stage'].name
-                mapped['evolution_stage'] = mapped['evolution_stage'].id
-            
-            if mapped.get('trainer_type'):
-                mapped['trainer_type_name'] = mapped['trainer_type'].name
-                mapped['trainer_type'] = mapped['trainer_type'].id
-                
-            # ManyToManyのリスト(オブジェクト)をIDのリストに変換 & 名称リスト作成
-            for field in ['types', 'special_features', 'move_types', 'special_trainers', 'weakness', 'resistance']:
-                if mapped.get(field):
-                    # 表示用名称リスト (例: types_names)
-                    mapped[f'{field}_names'] = [obj.name for obj in mapped[field]]
-                    
-                    # types, weakness, resistanceの場合、プレビュー用に色情報も含める
-                    if field in ['types', 'weakness', 'resistance', 'move_types']:
-                        mapped[f'{field}_preview'] = [
-                            {
-                                'name': obj.name,
-                                'bg_color': obj.bg_color,
-                                'text_color': obj.text_color
-                            } for obj in mapped[field]
-                        ]                    
-                    mapped[field] = [obj.id for obj in mapped[field]]
-
-            # クロップ画像のURLを紐付ける (インデックスが一致すると仮定)
-            if i < len(cropped_images):
-                mapped['image_url'] = cropped_images[i]['media_url']
-            else:
-                mapped['image_url'] = None # 画像がない場合
-                
-            mapped_items.append(mapped)
-            
-        # セッションに保存
-        request.session['bulk_register_items'] = mapped_items
-        
-        return render(request, 'cards/_bulk_register_preview.html', {
-            'items': mapped_items,
-            'original_image_url': file_url
+    return _render_bulk_preview(request, result, [url for _, url in images])
+
+def bulk_register_job_status(request, job_id):
+    """
+    解析ジョブの進捗を返す (htmxのポーリング用)
+    完了・失敗時はダイアログ全体をプレビューまたはエラー表示に差し替える。
+    """
+    if request.session.get('bulk_register_job_id') != str(job_id):
+        return HttpResponse("ジョブが見つかりません", status=404)
+    job = get_object_or_404(AnalysisJob, pk=job_id)
+
+    if not job.is_finished:
+        return render(request, 'cards/_bulk_register_progress_steps.html', {
+            'job': job,
+            'stages': _job_stages(job),
         })
 
-    except ResourceExhausted:
-        logger.error("Gemini API Quota Exceeded")
-        error_html = """
-        <dialog id="bulk-error-modal" class="modal">
-            <div class="modal-box">
-                <div class="alert alert-error shadow-lg mb-4">
-                    <div>
-                        <svg xmlns="http://www.w3.org/2000/svg" class="stroke-current flex-shrink-0 h-6 w-6" fill="none" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M10 14l2-2m0 0l2-2m-2 2l-2-2m2 2l2 2m7-2a9 9 0 11-18 0 9 9 0 0118 0z" /></svg>
-                        <span>AIサービスが混雑しており利用制限にかかりました。申し訳ありませんが、しばらく時間を置いてから再試行してください。</span>
-                    </div>
-                </div>
-                <div class="text-center">
-                    <button class="btn" onclick="document.getElementById('bulk-error-modal').close()">閉じる</button>
-                </div>
-            </div>
-            <form method="dialog" class="modal-backdrop">
-                <button>close</button>
-            </form>
-        </dialog>
-        <script>
-            (function() {
-                const modal = document.getElementById('bulk-error-modal');
-                if(modal) modal.showModal();
-                modal.addEventListener('close', () => {
-                    const dialogTarget = document.getElementById('dialog-target');
-                    if (dialogTarget) {
-                        dialogTarget.innerHTML = '';
-                    }
-                });
-            })();
-        </script>
-        """
-        return HttpResponse(error_html)
+    del request.session['bulk_register_job_id']
+    if job.status == AnalysisJob.STATUS_DONE:
+        response = _render_bulk_preview(request, job.result or {}, [image['url'] for image in job.images])
+    else:
+        response = _render_bulk_error(request, job.error_message or "エラーが発生しました")
 
-    except Exception as e:
-        logger.error(f"Bulk Register Analyze Error: {e}", exc_info=True)
-        error_html = f"""
-        <dialog id="bulk-error-modal" class="modal">
-            <div class="modal-box">
-                <div class="alert alert-error shadow-lg mb-4">
-                    <div>
-                        <svg xmlns="http://www.w3.org/2000/svg" class="stroke-current flex-shrink-0 h-6 w-6" fill="none" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M10 14l2-2m0 0l2-2m-2 2l-2-2m2 2l2 2m7-2a9 9 0 11-18 0 9 9 0 0118 0z" /></svg>
-                        <span>エラーが発生しました: {str(e)}</span>
-                    </div>
-                </div>
-                <div class="text-center">
-                     <button class="btn" onclick="document.getElementById('bulk-error-modal').close()">閉じる</button>
-                </div>
-            </div>
-            <form method="dialog" class="modal-backdrop">
-                <button>close</button>
-            </form>
-        </dialog>
-        <script>
-            (function() {{
-                const modal = document.getElementById('bulk-error-modal');
-                if(modal) modal.showModal();
-                modal.addEventListener('close', () => {{
-                    const dialogTarget = document.getElementById('dialog-target');
-                    if (dialogTarget) {{
-                        dialogTarget.innerHTML = '';
-                    }}
-                }});
-            }})();
-        </script>
-        """
-        return HttpResponse(error_html)
+    # ポーリング要素ではなくダイアログ全体を置き換える
+    response['HX-Retarget'] = '#dialog-target'
+    response['HX-Reswap'] = 'innerHTML'
+    return response
+
+def _job_stages(job):
+    """進捗表示用に、各段階の完了状態を返す"""
+    stage_keys = [key for key, _ in AnalysisJob.STAGE_CHOICES]
+    current = stage_keys.index(job.stage)
+    return [
+        {'label': label, 'done': i <= current}
+        for i, (key, label) in enumerate(AnalysisJob.STAGE_CHOICES)
+    ]
+
+def _render_bulk_preview(request, result, original_image_urls):
+    """
+    解析結果 (run_analysis の戻り値) を一括登録バッチとしてDBに保存し、プレビューを表示する
+    セッションにはバッチのIDのみを保存する (Cookieのサイズを一定に保つため)
+    """
+    mapped_items = result.get('items', [])
+    batch = BulkRegisterBatch.create_with_items(mapped_items)
+
+    # 前回のプレビュー (未登録のまま閉じたもの) は不要になるため削除する
+    previous_batch_id = request.session.get('bulk_register_batch_id')
+    if previous_batch_id:
+        BulkRegisterBatch.objects.filter(pk=previous_batch_id).delete()
+    request.session['bulk_register_batch_id'] = str(batch.pk)
+    # 以前のバージョンでセッションに保存していたデータを削除する
+    request.session.pop('bulk_register_items', None)
+
+    return render(request, 'cards/_bulk_register_preview.html', {
+        'items': mapped_items,
+        'warnings': result.get('warnings', []),
+        'stats': result.get('stats'),
+        'original_image_urls': original_image_urls,
+    })
+
+def _render_bulk_error(request, message):
+    """一括登録のエラーをモーダルで表示する"""
+    return render(request, 'cards/_bulk_register_error.html', {'message': message})
+
+def _get_bulk_item(request, item_id):
+    """セッションの一括登録バッチから、プレビュー中のアイテムを1件取得する"""
+    batch_id = request.session.get('bulk_register_batch_id')
+    if not batch_id:
+        return None
+    return BulkRegisterItem.objects.filter(batch_id=batch_id, item_id=str(item_id)).first()
 
 def bulk_register_edit_item(request, item_id):
     """
     プレビューアイテムの編集 (GET: フォーム表示, POST: 更新)
     モーダルでの編集を行います。
     """
-    items = request.session.get('bulk_register_items', [])
-    target_index = next((i for i, item in enumerate(items) if item['id'] == item_id), None)
-    
-    if target_index is None:
+    bulk_item = _get_bulk_item(request, item_id)
+    if bulk_item is None:
         return HttpResponse("アイテムが見つかりません", status=404)
-        
-    item = items[target_index]
+
+    item = bulk_item.as_preview()
     
     # 既存フォームを利用するために初期データを準備
     initial_data = item.copy()
@@ -558,7 +523,7 @@ def bulk_register_edit_item(request, item_id):
         if form.is_valid():
             cleaned_data = form.cleaned_data
             
-            # セッションデータを更新 (IDと画像URLは維持)
+            # アイテムのデータを更新 (IDと画像URLは維持)
             for key, value in cleaned_data.items():
                 if key == 'image': continue # 画像は変更しない
                 
@@ -601,9 +566,9 @@ def bulk_register_edit_item(request, item_id):
                 else:
                     item[key] = value
 
-            items[target_index] = item
-            request.session['bulk_register_items'] = items
-            request.session.modified = True
+            # 編集したアイテムの行のみを更新する
+            bulk_item.data = item
+            bulk_item.save(update_fields=['data'])
             
             # 更新された行をレンダリングして返す
             response = render(request, 'cards/_bulk_register_preview_row.html', {'item': item})
@@ -627,128 +592,63 @@ def bulk_register_edit_item(request, item_id):
 
 def bulk_register_toggle_exclude(request, item_id):
     """プレビューアイテムの除外状態をトグルする"""
-    items = request.session.get('bulk_register_items', [])
-    target_item = None
-    
-    for item in items:
-        if item['id'] == str(item_id): # uuidは文字列比較
-            item['is_excluded'] = not item.get('is_excluded', False)
-            target_item = item
-            break
-            
-    if target_item:
-        request.session['bulk_register_items'] = items
-        request.session.modified = True
-        
-        # 行のみを再レンダリングして返す
-        return render(request, 'cards/_bulk_register_preview_row.html', {'item': target_item})
-    
-    return HttpResponse(status=404)
+    bulk_item = _get_bulk_item(request, item_id)
+    if bulk_item is None:
+        return HttpResponse(status=404)
+
+    bulk_item.is_excluded = not bulk_item.is_excluded
+    bulk_item.save(update_fields=['is_excluded'])
+
+    # 行のみを再レンダリングして返す
+    return render(request, 'cards/_bulk_register_preview_row.html', {'item': bulk_item.as_preview()})
 
 @require_POST
 def bulk_register_submit(request):
-    """一括登録の実行"""
-    items = request.session.get('bulk_register_items', [])
-    if not items:
+    """一括登録の実行 (除外されていないアイテムをまとめて登録する)"""
+    batch_id = request.session.get('bulk_register_batch_id')
+    batch = BulkRegisterBatch.objects.filter(pk=batch_id).first() if batch_id else None
+    if batch is None or not batch.items.exists():
         return HttpResponse("登録するデータがありません", status=400)
-    
-    registered_count = 0
-    failed_count = 0
-    
-    for item in items:
-        # 除外フラグがある場合はスキップ
-        if item.get('is_excluded'):
-            continue
-
-        # バリデーション: 必須項目チェックなど
-        if not item.get('name') or not item.get('category'):
-            failed_count += 1
-            continue # 名前かカテゴリがないものはスキップ
-
-        # 画像の処理 (一時URLから保存)
-        image_content = None
-        filename = None
-        if item.get('image_url'):
-            # 相対パスを取得 (/media/bulk_register/cropped/xxx.jpg -> bulk_register/cropped/xxx.jpg)
-            relative_path = item['image_url'].replace(settings.MEDIA_URL, '')
-            full_path = settings.MEDIA_ROOT / relative_path
-            
-            if full_path.exists():
-                try:
-                    with open(full_path, 'rb') as f:
-                        image_content = ContentFile(f.read())
-                        filename = full_path.name
-                except Exception as e:
-                    logger.warning(f"Failed to load image for saving: {e}")
-
-        try:
-            # ForeignKeyはIDで指定するために _id サフィックスを使用
-            card = PokemonCard(
-                name=item.get('name') or "名称不明",
-                quantity=item.get('quantity', 1),
-                memo=item.get('memo', ''),
-                # ForeignKey fields (pass IDs directly)
-                category_id=item.get('category'),
-                evolution_stage_id=item.get('evolution_stage'),
-                trainer_type_id=item.get('trainer_type'),
-                # CharFields
-                evolves_from=item.get('evolves_from'),
-                # Pokemon specific
-                hp=item.get('hp'),
-                retreat_cost=item.get('retreat_cost'),
-            )
-            
-            if image_content and filename:
-                card.image.save(filename, image_content, save=False)
-            
-            card.save()
-            
-            # ManyToManyフィールドの設定
-            if item.get('types'):
-                card.types.set(item['types'])
-                
-            if item.get('special_features'):
-                card.special_features.set(item['special_features'])
-                
-            if item.get('move_types'):
-                card.move_types.set(item['move_types'])
-                
-            if item.get('weakness'):
-                card.weakness.set(item['weakness'])
-                
-            if item.get('resistance'):
-                card.resistance.set(item['resistance'])
-                
-            if item.get('special_trainers'):
-                card.special_trainers.set(item['special_trainers'])
 
-            registered_count += 1
+    items = [bulk_item.data for bulk_item in batch.items.filter(is_excluded=False)]
+    try:
+        result = BulkCardCommitter().commit(items)
+    except Exception as e:
+        # 登録はまとめて行うため、DBエラーの場合は1件も登録されない (プレビューはそのまま残す)
+        logger.error(f"Bulk Register Submit Error: {e}", exc_info=True)
+        return _render_bulk_result_toast(
+            request, 'alert-error', format_html("<span>登録に失敗しました: {}</span>", str(e))
+        )
 
-        except Exception as e:
-            logger.error(f"Failed to save card: {item.get('name')}, Error: {e}")
-            failed_count += 1
-            continue # エラーが出ても他のカードは保存を試みる
+    # バッチとセッションのクリア (全ての処理が終わった後)
+    batch.delete()
+    request.session.pop('bulk_register_batch_id', None)
 
-    # セッションクリア (全ての処理が終わった後)
-    if 'bulk_register_items' in request.session:
-        del request.session['bulk_register_items']
-    
     # 結果メッセージの構築
+    registered_count = len(result.created)
+    failed_count = len(result.errors)
     if failed_count > 0:
         alert_class = "alert-warning"
-        message = f"<span>{registered_count}件の登録に成功し、{failed_count}件に失敗しました。</span>"
+        message = format_html(
+            "<span>{}件の登録に成功し、{}件に失敗しました。<ul class='list-disc list-inside text-sm'>{}</ul></span>",
+            registered_count, failed_count,
+            format_html_join('', "<li>{}: {}</li>", ((error.name, error.message) for error in result.errors)),
+        )
     else:
         alert_class = "alert-success"
-        message = f"<span>{registered_count}件のカードをすべて登録しました</span>"
+        message = format_html("<span>{}件のカードをすべて登録しました</span>", registered_count)
 
-    context = {
-        'alert_class': alert_class,
-        'message': message
-    }
-    response = render(request, 'cards/_bulk_register_result_toast.html', context)
+    response = _render_bulk_result_toast(request, alert_class, message)
     response['HX-Trigger'] = json.dumps({'cardCreated': ''}) # リスト更新
     return response
 
+def _render_bulk_result_toast(request, alert_class, message):
+    """一括登録の結果をトーストで表示する"""
+    return render(request, 'cards/_bulk_register_result_toast.html', {
+        'alert_class': alert_class,
+        'message': message,
+    })
+
 def search_cards_by_name_modal(request):
     """名前でカードを検索し、結果をモーダルで表示する"""
     from .query_builder import build_fuzzy_query
@@ -784,147 +684,227 @@ def export_cards_csv(request):
     query_string = request.session.get(session_key, '')
     params = QueryDict(query_string)
     
-    # ベースとなるクエリセットの取得
+    # ベースとなるクエリセットの取得 (関連項目はエクスポート時にまとめて取得する)
     if category_slug == 'trainers':
-        queryset = PokemonCard.objects.filter(category__slug='trainers').select_related(
-            'trainer_type'
-        ).prefetch_related(
-            'special_trainers'
-        )
+        queryset = PokemonCard.objects.filter(category=get_master_data().category('trainers'))
         filterset = TrainersCardFilter(params, queryset=queryset)
     else:
-        queryset = PokemonCard.objects.filter(category__slug='pokemon').select_related(
-            'evolution_stage'
-        ).prefetch_related(
-            'types', 'special_features', 'move_types'
-        )
+        queryset = PokemonCard.objects.filter(category=get_master_data().category('pokemon'))
         filterset = PokemonCardFilter(params, queryset=queryset)
     
     # フィルタの適用
     filtered_queryset = filterset.qs
     
-    # Resourceクラスを使用してエクスポート
-    dataset = PokemonCardResource().export(filtered_queryset)
-    
-    # レスポンスの作成
-    response = HttpResponse(content_type='text/csv')
+    # 1行ずつ書き出しながら送信する (全件をメモリ上に展開しない)
+    response = StreamingHttpResponse(iter_cards_csv(filtered_queryset), content_type='text/csv')
     filename = f"pokeapp_export_{category_slug}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
-    # Excelで文字化けしないようにBOM (Byte Order Mark) を追加
-    response.write('\ufeff')
-    response.write(dataset.csv)
-    
     return response
 
 @require_http_methods(["GET", "POST"])
 def import_cards_csv(request):
     """
     CSVファイルをアップロードし、カード情報をインポートする
+
+    CSVはファイルとして保存してインポートジョブを登録し、チャンクごとに取り込む。
+    CSV_IMPORT_ASYNC が有効な場合は進捗表示を返し、取り込み自体は run_csv_import_worker コマンドが実行する。
     """
     if request.method == "GET":
         # モーダルHTMLを返す
-        return render(request, 'cards/_csv_import_modal.html')
+        return render(request, 'cards/_csv_import_modal.html', {
+            'chunk_size': settings.CSV_IMPORT_CHUNK_SIZE,
+        })
 
     # POST処理
-    import tablib
-    from import_export.results import RowResult
-
     csv_file = request.FILES.get('csv_file')
     if not csv_file:
         return HttpResponseBadRequest("ファイルがありません")
 
+    # 「エラーがあった場合はすべて取り込まない」が選択されていない場合は、チャンクごとに確定する
+    mode = CsvImportJob.MODE_ATOMIC if request.POST.get('all_or_nothing') else CsvImportJob.MODE_CHUNKED
     try:
-        # バイナリを文字列として読み込み (BOM付きUTF-8を考慮)
-        content = csv_file.read().decode('utf-8-sig')
-        dataset = tablib.Dataset().load(content, format='csv')
-        
-        # ヘッダーから「名前」列のインデックスを特定しておく
-        name_idx = -1
-        if '名前' in dataset.headers:
-            name_idx = dataset.headers.index('名前')
-        
-        resource = PokemonCardResource()
-        # インポート実行 (ドライランなしでいきなり保存)
-        # use_transactions=True (デフォルト) の場合、1件でもエラーがあれば全ロールバックされる
-        result = resource.import_data(dataset, dry_run=False, raise_errors=False, use_transactions=True)
-
-        # 結果のサマリーを作成
-        # エラーがあるかどうかを判定
-        has_errors = result.has_errors() or result.has_validation_errors()
-        
-        if has_errors:
-            # エラーがある場合は全ロールバックされているので、成功件数はすべて0とする
-            new_count = 0
-            update_count = 0
-            skip_count = 0
-            error_count = result.totals.get('error', 0) + result.totals.get('invalid', 0)
-            # totalsに載らない例外エラーも加算
-            if error_count == 0:
-                error_count = len(result.row_errors())
-        else:
-            new_count = result.totals.get('new', 0)
-            update_count = result.totals.get('update', 0)
-            skip_count = result.totals.get('skip', 0)
-            error_count = 0
-        
-        # エラー詳細の抽出 (最初の5件程度)
-        error_messages = []
-        for i, row_result in enumerate(result.rows):
-            if row_result.import_type in [RowResult.IMPORT_TYPE_ERROR, RowResult.IMPORT_TYPE_INVALID]:
-                # 元のデータセットから直接その行のデータを読み取る (最も確実)
-                display_val = ""
-                try:
-                    original_row = dataset[i]
-                    if name_idx >= 0:
-                        display_val = original_row[name_idx]
-                    else:
-                        display_val = original_row[0]
-                except:
-                    display_val = "名称不明"
-                
-                line_info = f"{display_val}"
-                
-                # エラーメッセージの取得と整形
-                error_detail = ""
-                if row_result.errors:
-                    err = str(row_result.errors[0].error)
-                    # データベースの制約エラーを分かりやすく変換
-                    error_detail = err
-                elif row_result.validation_error:
-                    error_detail = str(row_result.validation_error)
-                else:
-                    error_detail = "データの不備"
-                
-                error_messages.append(f"{line_info}: {error_detail}")
-            
-            if len(error_messages) >= 5:
-                break
-
-        context = {
-            'new_count': new_count,
-            'update_count': update_count,
-            'skip_count': skip_count,
-            'success_count': new_count + update_count,
-            'error_count': error_count,
-            'error_messages': error_messages,
-            'total_count': result.total_rows,
-            'has_errors': has_errors,
-        }
-        
-        # 結果用のHTML部品を返す
-        html = render(request, 'cards/_csv_import_result.html', context).content.decode('utf-8')
-        
-        # 新規追加または更新があった場合はリストの更新もトリガーする
-        response = HttpResponse(html)
-        if new_count > 0 or update_count > 0:
-            response['HX-Trigger'] = 'cardCreated'
-        return response
-
+        job = csv_import_jobs.enqueue_csv_import_job(csv_file, mode)
     except Exception as e:
         logger.error(f"CSV Import Error: {e}", exc_info=True)
         return HttpResponse(f'<div class="alert alert-error mt-4">エラーが発生しました: {str(e)}</div>')
 
+    # 進捗確認・再開できるのはアップロードしたセッションのみ
+    request.session['csv_import_job_id'] = str(job.pk)
+    return _run_or_show_csv_import_progress(request, job)
+
+def csv_import_job_status(request, job_id):
+    """
+    CSVインポートジョブの進捗を返す (htmxのポーリング用)
+    終了時は進捗表示を取り込み結果に差し替える。
+    """
+    if request.session.get('csv_import_job_id') != str(job_id):
+        return HttpResponse("ジョブが見つかりません", status=404)
+    job = get_object_or_404(CsvImportJob, pk=job_id)
+
+    if not job.is_finished:
+        return _render_csv_import_progress(request, job)
+    return _render_csv_import_result(request, job)
+
+@require_POST
+def csv_import_job_resume(request, job_id):
+    """失敗したCSVインポートジョブを、処理済みの行の続きから再開する"""
+    if request.session.get('csv_import_job_id') != str(job_id):
+        return HttpResponse("ジョブが見つかりません", status=404)
+    job = get_object_or_404(CsvImportJob, pk=job_id)
+
+    if not csv_import_jobs.resume_job(job):
+        return _render_csv_import_result(request, job)
+    job.refresh_from_db()
+    return _run_or_show_csv_import_progress(request, job)
+
+def _run_or_show_csv_import_progress(request, job):
+    """非同期の場合は進捗表示を返し、同期の場合はその場で取り込んで結果を返す"""
+    if settings.CSV_IMPORT_ASYNC:
+        return _render_csv_import_progress(request, job)
+
+    if csv_import_jobs.claim_job(job.pk):
+        job.refresh_from_db()
+        csv_import_jobs.process_job(job)
+    job.refresh_from_db()
+    return _render_csv_import_result(request, job)
+
+def _render_csv_import_progress(request, job):
+    return render(request, 'cards/_csv_import_progress.html', {
+        'job': job,
+        'processed_rows': csv_import_jobs.get_processed_rows(job),
+    })
+
+def _render_csv_import_result(request, job):
+    """終了したジョブの取り込み結果を返す"""
+    context = {
+        'job': job,
+        'new_count': job.new_count,
+        'update_count': job.update_count,
+        'skip_count': job.skip_count,
+        'success_count': job.new_count + job.update_count,
+        'error_count': job.error_count,
+        # エラー詳細 (最初の5件)
+        'error_messages': job.error_messages,
+        'total_count': job.total_rows or 0,
+        'has_errors': job.error_count > 0 or job.status == CsvImportJob.STATUS_FAILED,
+        'processed_rows': job.processed_rows,
+        # チャンクごとに確定する方式で、途中までは取り込まれた場合
+        'is_partial': job.mode == CsvImportJob.MODE_CHUNKED and job.status == CsvImportJob.STATUS_FAILED and job.processed_rows > 0,
+        'can_resume': csv_import_jobs.can_resume(job),
+    }
+    response = render(request, 'cards/_csv_import_result.html', context)
+
+    # 新規追加または更新があった場合はリストの更新もトリガーする
+    if job.new_count > 0 or job.update_count > 0:
+        response['HX-Trigger'] = 'cardCreated'
+    return response
+
+def collection_stats_modal(request):
+    """
+    コレクションの統計をモーダルで表示する
+
+    全体の集計はカードの変更時に更新している集計テーブル (cards.aggregates) から表示し、
+    直近の絞り込み条件での集計は列ストア (cards.column_store) で求める。
+    """
+    category_slug = 'trainers' if request.GET.get('category') == 'trainers' else 'pokemon'
+    context = {'stats': collection_stats(), 'category': category_slug}
+
+    # 直近の絞り込み条件 (並び替えのみの場合は表示しない)
+    params = QueryDict(request.session.get(f'last_search_params_{category_slug}', ''), mutable=True)
+    for key in ('ordering', 'page', 'cursor'):
+        params.pop(key, None)
+    if column_store_enabled() and any(value for key in params for value in params.getlist(key)):
+        filterset_class = TrainersCardFilter if category_slug == 'trainers' else PokemonCardFilter
+        queryset = PokemonCard.objects.filter(category=get_master_data().category(category_slug))
+        store, selection = filtered_selection(filterset_class(params, queryset=queryset), category_slug)
+        if category_slug == 'trainers':
+            breakdown = store.count_by('trainer_type', selection)
+            objects = get_master_data().all(TrainerType)
+        else:
+            breakdown = store.count_by_bit('types', selection)
+            objects = get_master_data().all(Type)
+        context['filtered'] = {
+            'cards': store.count(selection),
+            'copies': store.copies(selection),
+            'rows': [
+                {'object': obj, 'cards': breakdown[obj.pk][0], 'copies': breakdown[obj.pk][1]}
+                for obj in objects if obj.pk in breakdown
+            ],
+        }
+    return render(request, 'cards/_collection_stats_modal.html', context)
+
+def deck_list_modal(request):
+    """デッキの一覧と、所持しているカードで組めるかをモーダルで表示する"""
+    return render(request, 'cards/_deck_list_modal.html', {
+        'checks': check_decks(Deck.objects.all()),
+    })
+
+@require_http_methods(["GET", "POST"])
+def deck_builder(request, pk=None):
+    """
+    デッキを作成・編集する
+
+    POST の action が check の場合は保存せずに確認結果を表示し、save の場合は保存してデッキの一覧に戻る。
+    """
+    deck = get_object_or_404(Deck, pk=pk) if pk is not None else None
+    check = None
+    if request.method == 'POST':
+        form = DeckForm(request.POST, instance=deck)
+        if form.is_valid():
+            entries = form.cleaned_data['entries']
+            if request.POST.get('action') == 'save':
+                # デッキとカードを1つのトランザクションで保存する (カードを保存できない場合にデッキだけが残らないように)
+                with transaction.atomic():
+                    deck = form.save()
+                    save_deck_entries(deck, entries)
+                return deck_list_modal(request)
+            check = check_entries(entries, deck=deck)
+    else:
+        form = DeckForm(instance=deck)
+        if deck is not None:
+            check = check_entries([(entry.name, entry.quantity) for entry in deck.entries.all()], deck=deck)
+    return render(request, 'cards/_deck_builder_modal.html', {'form': form, 'deck': deck, 'check': check})
+
+@require_http_methods(["GET", "POST"])
+def deck_list_import(request):
+    """
+    複数のデッキリストを貼り付けて、所持しているカードで組めるかをまとめて確認する
+
+    POST の action が save の場合は、読み込んだデッキリストをデッキとして保存してデッキの一覧に戻る。
+    """
+    if request.method == 'GET':
+        return render(request, 'cards/_deck_list_import_modal.html')
+
+    text = request.POST.get('deck_lists', '')
+    importer = DeckListImporter()
+    try:
+        deck_lists = importer.parse(text)
+    except ValueError as e:
+        return render(request, 'cards/_deck_list_import_modal.html', {'text': text, 'error': str(e)})
+
+    savable_count = sum(1 for deck_list in deck_lists if deck_list.is_savable)
+    if request.POST.get('action') == 'save' and savable_count:
+        # 読み取れない行や保存できないカードがあるデッキリストは保存しない (確認結果に保存しない件数を表示している)
+        importer.save(deck_lists, is_allocated=bool(request.POST.get('is_allocated')))
+        return deck_list_modal(request)
+
+    importer.check(deck_lists)
+    return render(request, 'cards/_deck_list_import_modal.html', {
+        'text': text,
+        'deck_lists': deck_lists,
+        'shortages': shortage_summary(deck_lists),
+        'buildable_count': sum(1 for deck_list in deck_lists if deck_list.check.is_buildable),
+        'savable_count': savable_count,
+        'skipped_count': len(deck_lists) - savable_count,
+    })
+
+@require_POST
+def deck_delete(request, pk):
+    """デッキを削除し、デッキの一覧を返す"""
+    get_object_or_404(Deck, pk=pk).delete()
+    return deck_list_modal(request)
+
 def help_modal(request):
     """ヘルプ画面をモーダルで表示する"""
     return render(request, 'cards/_help_modal.html')
\ No newline at end of file
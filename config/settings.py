@@ -76,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cards.context_processors.cache_versions',
             ],
         },
     },
@@ -169,6 +170,80 @@ GEMINI_API_KEYS = [key for key in GEMINI_API_KEYS if key]
 if not GEMINI_API_KEYS:
     raise ValueError("At least one GEMINI_API_KEY must be configured")
 
+# Gemini API KEYごとの1日の使用上限（GEMINI_API_KEY_n_DAILY_LIMIT でキーごとに上書き可能）
+GEMINI_DAILY_LIMIT = int(os.environ.get('GEMINI_DAILY_LIMIT', '20'))
+GEMINI_API_KEY_DAILY_LIMITS = [
+    int(os.environ.get(f'GEMINI_API_KEY_{i}_DAILY_LIMIT', GEMINI_DAILY_LIMIT))
+    for i in range(1, 10)
+    if os.environ.get(f'GEMINI_API_KEY_{i}')
+]
+# 利用制限 (ResourceExhausted) を受けたキーを使用しない秒数（その間は次のキーを使う）
+GEMINI_KEY_COOLDOWN_SECONDS = int(os.environ.get('GEMINI_KEY_COOLDOWN_SECONDS', '600'))
+
+# YOLOモデルプール設定（ワーカープロセス内でロード済みモデルを使い回す）
+# YOLO_MODEL_POOL_SIZE: 1プロセスあたりに保持するモデル数（= 同時に推論できる数）
+# YOLO_MODEL_POOL_TIMEOUT: モデルの空き待ちの上限秒数
+# YOLO_PRELOAD: True の場合、Webサーバーの起動時 (AppConfig.ready) にモデルをロードする
+#               (migrate などの管理コマンドではロードしない)
+YOLO_MODEL_POOL_SIZE = int(os.environ.get('YOLO_MODEL_POOL_SIZE', '1'))
+YOLO_MODEL_POOL_TIMEOUT = float(os.environ.get('YOLO_MODEL_POOL_TIMEOUT', '300'))
+YOLO_PRELOAD = os.environ.get('YOLO_PRELOAD', 'False').lower() == 'true'
+# YOLO_PREDICT_BATCH: 複数画像を解析する際に1回の推論でまとめて処理する枚数
+YOLO_PREDICT_BATCH = int(os.environ.get('YOLO_PREDICT_BATCH', '4'))
+
+# 一括登録のAI解析をバックグラウンドジョブで実行する（run_analysis_worker コマンドが必要）
+# False の場合は従来通りリクエスト内で同期的に解析する
+BULK_ANALYSIS_ASYNC = os.environ.get('BULK_ANALYSIS_ASYNC', 'True').lower() == 'true'
+# 一括登録で一度にアップロードできる画像の枚数
+BULK_REGISTER_MAX_IMAGES = int(os.environ.get('BULK_REGISTER_MAX_IMAGES', '30'))
+
+# 一覧表示用のカード画像の縮小画像（WebP / JPEG）
+# CARD_THUMBNAIL_WIDTHS: 生成する幅（px, カンマ区切り）。画面の解像度に応じてブラウザが選択する
+# CARD_THUMBNAIL_QUALITY: 縮小画像の画質（1〜100）
+# 既存の画像の縮小画像は generate_card_thumbnails コマンドで生成する
+CARD_THUMBNAIL_WIDTHS = [
+    int(width) for width in os.environ.get('CARD_THUMBNAIL_WIDTHS', '160,320,480').split(',') if width.strip()
+]
+CARD_THUMBNAIL_QUALITY = int(os.environ.get('CARD_THUMBNAIL_QUALITY', '80'))
+
+# CSVインポートをバックグラウンドジョブで実行する（run_csv_import_worker コマンドが必要）
+# False の場合はリクエスト内で同じ処理（チャンクごとの読み込み）を実行する
+# CSV_IMPORT_CHUNK_SIZE: 1回に読み込んで取り込む行数（チャンクごとに処理済みの行数を記録し、失敗時はその続きから再開する）
+CSV_IMPORT_ASYNC = os.environ.get('CSV_IMPORT_ASYNC', 'True').lower() == 'true'
+CSV_IMPORT_CHUNK_SIZE = int(os.environ.get('CSV_IMPORT_CHUNK_SIZE', '1000'))
+
+# Gemini抽出結果キャッシュ（解析済みのカードはAPIを呼ばずに結果を再利用する）
+# GEMINI_CACHE_MAX_AGE_DAYS: 最後に利用されてからこの日数を過ぎたエントリを削除する
+# GEMINI_CACHE_MAX_ENTRIES: エントリ数の上限（超えた分は最終利用日時の古い順に削除する）
+GEMINI_CACHE_ENABLED = os.environ.get('GEMINI_CACHE_ENABLED', 'True').lower() == 'true'
+GEMINI_CACHE_MAX_AGE_DAYS = int(os.environ.get('GEMINI_CACHE_MAX_AGE_DAYS', '90'))
+GEMINI_CACHE_MAX_ENTRIES = int(os.environ.get('GEMINI_CACHE_MAX_ENTRIES', '5000'))
+
+# Geminiに送信するグリッド画像の作成方法
+# GEMINI_GRID_STRATEGY: dense（カードを詰めて並べ、複数画像のカードをまとめて送信）/ fixed（従来の幅400px・4列固定）
+# GEMINI_GRID_CELL_WIDTH: dense で1枚のカードに割り当てる幅（px）。小さくしすぎると文字が読み取れなくなる
+# GEMINI_GRID_MAX_CARDS: dense で1回の問い合わせに含める最大枚数
+GEMINI_GRID_STRATEGY = os.environ.get('GEMINI_GRID_STRATEGY', 'dense')
+GEMINI_GRID_CELL_WIDTH = int(os.environ.get('GEMINI_GRID_CELL_WIDTH', '300'))
+GEMINI_GRID_MAX_CARDS = int(os.environ.get('GEMINI_GRID_MAX_CARDS', '24'))
+
+# カード一覧のページネーション
+# CARD_LIST_PAGINATION: keyset（並び替えキーによるカーソル方式・スクロールで続きを読み込む）/ offset（従来のページ番号方式）
+# CARD_LIST_COUNT_MODE: keyset での検索結果件数の表示 approximate（PostgreSQLでは推定値）/ exact / none（表示しない）
+CARD_LIST_PAGINATION = os.environ.get('CARD_LIST_PAGINATION', 'keyset')
+CARD_LIST_COUNT_MODE = os.environ.get('CARD_LIST_COUNT_MODE', 'approximate')
+
+# 検索フォームの選択肢ごとに該当するカードの件数を表示する（絞り込み条件ごとに集計結果をキャッシュする）
+CARD_LIST_FACETS = os.environ.get('CARD_LIST_FACETS', 'True').lower() == 'true'
+
+# タイプ・弱点などの絞り込みと一覧の表示に、カードの検索用ドキュメント（ビットマスク）を使用する（cards.search_documents）
+# False にすると中間テーブルの結合・prefetch で行う
+CARD_SEARCH_DOCUMENTS = os.environ.get('CARD_SEARCH_DOCUMENTS', 'True').lower() == 'true'
+
+# 検索フォームの件数などの集計を、全カードの列ストア（NumPy配列をワーカーのメモリに保持）で行う（cards.column_store）
+# 検索用ドキュメントのビットマスクを使用するため、CARD_SEARCH_DOCUMENTS=False の場合は無効になる
+CARD_COLUMN_STORE = os.environ.get('CARD_COLUMN_STORE', 'True').lower() == 'true'
+
 # セッション設定（一括登録機能用）
 # signed_cookies: キャッシュやDBが不要で低リソース環境に最適
 SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
@@ -179,5 +254,39 @@ SESSION_ENGINE = os.environ.get(
     'django.contrib.sessions.backends.signed_cookies'  # デフォルト
 )
 
+# キャッシュ設定（gunicornの複数ワーカー・解析ワーカー間で共有するためファイルに保存する）
+# 進化系統の索引・ファセットの件数などの派生データを保持する
+# 上限 (DJANGO_CACHE_MAX_ENTRIES) を超えるとエントリの一部が削除される
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', '/tmp/pokeapp_cache'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+    # 派生データの無効化に使うバージョン情報（cards.cache_versions）
+    # 派生データのエントリ数による削除の対象にならないよう、別のディレクトリに保存する
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(os.environ.get('DJANGO_CACHE_DIR', '/tmp/pokeapp_cache'), 'versions'),
+        'TIMEOUT': None,
+    },
+    # カード一覧の表示部品 (カード・表の行) のキャッシュ（{% cache %} タグが使用する）
+    # 部品ごとの読み書きが多いため、ワーカープロセス内のメモリに保存する（上限を超えると最近使われていないものから削除）
+    'template_fragments': {
+        'BACKEND': (
+            'django.core.cache.backends.locmem.LocMemCache'
+            if os.environ.get('CARD_FRAGMENT_CACHE', 'True').lower() == 'true'
+            else 'django.core.cache.backends.dummy.DummyCache'
+        ),
+        'LOCATION': 'card-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CARD_FRAGMENT_CACHE_MAX_ENTRIES', '3000')),
+        },
+    },
+}
+
 # ウィジェットのレンダリング設定（プロジェクトのtemplatesを優先する）
 FORM_RENDERER = 'django.forms.renderers.TemplatesSetting'
\ No newline at end of file
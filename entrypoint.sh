@@ -4,6 +4,12 @@ set -e
 # Wait for DB if necessary (optional, but good for stability)
 # You can add a wait-for-it script here if needed
 
+# 設定値が true か (config/settings.py の .lower() == 'true' と同じ判定)
+# 使い方: is_true "${BULK_ANALYSIS_ASYNC:-True}"
+is_true() {
+    [ "$(printf '%s' "$1" | tr '[:upper:]' '[:lower:]')" = "true" ]
+}
+
 # ================================================
 # 共通処理: マイグレーション & マスタデータ投入
 # ================================================
@@ -13,6 +19,22 @@ python manage.py migrate --noinput
 echo "Seeding master data..."
 python manage.py seed_master_data
 
+# ================================================
+# 画像解析ワーカー起動 (一括登録のAI解析をバックグラウンドで処理)
+# ================================================
+if is_true "${BULK_ANALYSIS_ASYNC:-True}"; then
+    echo "Starting analysis worker..."
+    python manage.py run_analysis_worker &
+fi
+
+# ================================================
+# CSVインポートワーカー起動 (CSVインポートをチャンクごとにバックグラウンドで処理)
+# ================================================
+if is_true "${CSV_IMPORT_ASYNC:-True}"; then
+    echo "Starting CSV import worker..."
+    python manage.py run_csv_import_worker &
+fi
+
 # ================================================
 # 環境別サーバー起動
 # ================================================
@@ -21,13 +43,26 @@ if [ "$APP_ENV" = "production" ]; then
     echo " Launching in PRODUCTION mode"
     echo "------------------------------------------------"
     # Raspberry Pi 1GBメモリ想定でデフォルトワーカー数を 1 に設定
-    # --timeout 600: PyTorch/YOLO ロードに時間がかかるため延長
+    # --timeout: AI解析を同期実行する場合 (BULK_ANALYSIS_ASYNC=False) は
+    #            PyTorch/YOLO ロードに時間がかかるため 600 秒に延長する
     WORKERS=${GUNICORN_WORKERS:-1}
-    TIMEOUT=${GUNICORN_TIMEOUT:-600}
+    if is_true "${BULK_ANALYSIS_ASYNC:-True}"; then
+        TIMEOUT=${GUNICORN_TIMEOUT:-120}
+    else
+        TIMEOUT=${GUNICORN_TIMEOUT:-600}
+    fi
+    # GUNICORN_PRELOAD=true: マスタープロセスでYOLOモデルを事前ロードし、
+    # フォークした全ワーカーで共有する（初回解析時のロード待ちをなくす）
+    PRELOAD_ARGS=""
+    if [ "${GUNICORN_PRELOAD:-false}" = "true" ]; then
+        PRELOAD_ARGS="--preload"
+        export YOLO_PRELOAD=True
+    fi
     exec gunicorn config.wsgi:application \
         --bind 0.0.0.0:8000 \
         --workers $WORKERS \
         --timeout $TIMEOUT \
+        $PRELOAD_ARGS \
         --access-logfile - \
         --error-logfile -
 else